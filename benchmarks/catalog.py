@@ -0,0 +1,65 @@
+"""
+Benchmark of building a large inapps catalog, as listing inapps of an application does.
+Compares slotted ITCInappPurchase sharing one parser with inapps as itc built them before:
+attributes in __dict__, own parser with its own thread local requests sessions and logging
+on construction. Memory is the size of objects owned by each inapp, strings are shared.
+
+Usage: python benchmarks/catalog.py [inapps count]
+"""
+
+import sys
+import time
+import logging
+import threading
+
+from itc.core.inapp import ITCInappPurchase
+from itc.parsers.inappparser import ITCInappParser
+
+class LegacyInappPurchase(object):
+    def __init__(self, name=None, numericId=None, productId=None, iaptype=None, manageLink=None, appleId=None):
+        self.name = name
+        self.numericId = numericId
+        self.productId = productId
+        self.appleId = appleId
+        self.type = iaptype
+        self.reviewNotes = None
+        self.clearedForSale = False
+        self.hostingContentWithApple = False
+        self.manageLink = manageLink
+        self._parser = ITCInappParser()
+        self._parser._threadLocal = threading.local()
+
+        logging.info('Inapp found: ' + self.__str__())
+        logging.debug('productId: ' + (self.productId if self.productId != None else ""))
+        logging.debug('type: ' + (self.type if self.type != None else ""))
+        logging.debug('manage link: ' + (self.manageLink if self.manageLink != None else ""))
+
+    def __str__(self):
+        return "\"" + self.name + "\" (" + str(self.appleId) + ")"
+
+def ownedSize(inapp):
+    owned = [inapp]
+    if hasattr(inapp, '__dict__'):
+        parser = inapp.__dict__['_parser']
+        owned += [inapp.__dict__, parser, parser.__dict__] + parser.__dict__.values()
+
+    return sum(sys.getsizeof(obj) for obj in owned)
+
+def build(inappClass, rows):
+    startTime = time.time()
+    inapps = [inappClass(name=name, appleId=appleId, numericId=numericId, productId=productId, iaptype='Consumable', manageLink=link)
+                for name, appleId, numericId, productId, link in rows]
+
+    return time.time() - startTime, sum(ownedSize(inapp) for inapp in inapps)
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    logging.basicConfig(level=logging.ERROR)
+    rows = [('Inapp %d' % i, str(1000000 + i), str(2000000 + i), 'com.example.item%d' % i, '/item?itemID=%d' % i) for i in range(count)]
+
+    legacyTime, legacySize = build(LegacyInappPurchase, rows)
+    slottedTime, slottedSize = build(ITCInappPurchase, rows)
+
+    print '%d inapps' % count
+    print '%-30s %8.3fs %10.1fMB' % ('dict, own parser', legacyTime, legacySize / 1024.0 / 1024)
+    print '%-30s %8.3fs %10.1fMB' % ('slots, shared parser', slottedTime, slottedSize / 1024.0 / 1024)
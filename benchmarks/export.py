@@ -0,0 +1,96 @@
+# coding=utf-8
+"""
+Benchmark of reviews and inapps catalog exports. Compares JSON dumps, which generateReviews
+and generateConfig write, with columnar files of itc.util.columnar: time to write, size,
+time to load and time to scan one numeric and one string column after loading.
+
+Usage: python benchmarks/export.py [reviews count]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+from itc.core.review import ITCReview
+from itc.util.columnar import ColumnarFile, writeReviews, writeInappsCatalog
+
+COUNTRIES = ['USA', 'United Kingdom', 'Germany', 'France', 'Japan', 'Russia', 'Brazil', 'Canada']
+WORDS = u'great app crashes sometimes please add more levels love it ★ works fine on my phone'.split()
+
+def sampleReviews(count):
+    random.seed(1)
+    reviews = {}
+    for index in xrange(count):
+        review = ITCReview(authorName='Reviewer %d' % index
+                         , title=u' '.join(random.sample(WORDS, 3))
+                         , text=u' '.join(random.choice(WORDS) for i in range(40))
+                         , rating=random.randint(1, 5)
+                         , version='1.%d' % random.randint(0, 9)
+                         , date='Jun %d, 2013' % random.randint(1, 30))
+        reviews.setdefault(random.choice(COUNTRIES), []).append(review)
+
+    return reviews
+
+def sampleInapps(count):
+    return [{'id': 500000000 + index, '_id': 'com.example.item%d' % index, 'type': 'Consumable'
+           , 'reference name': 'Item %d' % index, 'price tier': index % 80, 'cleared': index % 2 == 0
+           , 'hosting content with apple': False, 'review notes': '', 'languages': {}} for index in xrange(count)]
+
+def timed(function):
+    startTime = time.time()
+    result = function()
+
+    return time.time() - startTime, result
+
+def writeJSON(path, data):
+    with open(path, 'wb') as fp:
+        json.dump(data, fp, sort_keys=False, indent=4, separators=(',', ': '))
+
+def loadJSON(path):
+    with open(path, 'rb') as fp:
+        return json.load(fp)
+
+def compare(title, jsonData, writeColumnar, numericKey, stringKey, jsonRows, columnarNumeric, columnarString):
+    directory = tempfile.mkdtemp()
+    jsonPath = os.path.join(directory, 'export.json')
+    columnarPath = os.path.join(directory, 'export.itcc')
+
+    jsonWrite, _ = timed(lambda: writeJSON(jsonPath, jsonData()))
+    columnarWrite, _ = timed(lambda: writeColumnar(columnarPath))
+
+    jsonLoad, loaded = timed(lambda: loadJSON(jsonPath))
+    jsonScan, _ = timed(lambda: (sum(row[numericKey] for row in jsonRows(loaded)), sum(len(row[stringKey]) for row in jsonRows(loaded))))
+
+    columnarLoad, columnarFile = timed(lambda: ColumnarFile(columnarPath))
+    columnarScan, _ = timed(lambda: (sum(columnarFile[columnarNumeric].array()), sum(len(value) for value in columnarFile[columnarString])))
+    columnarFile.close()
+
+    print title
+    print '%-10s %10s %10s %10s %12s' % ('format', 'write', 'load', 'scan', 'size')
+    for name, write, load, scan, path in (('json', jsonWrite, jsonLoad, jsonScan, jsonPath)
+                                         , ('columnar', columnarWrite, columnarLoad, columnarScan, columnarPath)):
+        print '%-10s %9.3fs %9.3fs %9.3fs %10.1fMB' % (name, write, load, scan, os.path.getsize(path) / 1024.0 / 1024)
+        os.remove(path)
+    os.rmdir(directory)
+    print
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    reviews = sampleReviews(count)
+    inapps = sampleInapps(count / 10)
+
+    compare('%d reviews' % count
+          , lambda: dict((country, [review.dict() for review in reviewsForCountry]) for country, reviewsForCountry in reviews.items())
+          , lambda path: writeReviews(path, reviews)
+          , 'mark', 'title'
+          , lambda loaded: (row for reviewsForCountry in loaded.values() for row in reviewsForCountry)
+          , 'rating', 'title')
+    compare('%d inapps' % len(inapps)
+          , lambda: {'inapps': inapps}
+          , lambda path: writeInappsCatalog(path, inapps)
+          , 'price tier', '_id'
+          , lambda loaded: loaded['inapps']
+          , 'priceTier', 'productId')
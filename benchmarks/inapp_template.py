@@ -0,0 +1,109 @@
+"""
+Benchmark of inapp template expansion for large 'index iterator' ranges.
+Compares lazy InappTemplate views with per-index deepcopy of flattened dictionaries,
+which itc used before.
+
+Usage: python benchmarks/inapp_template.py [indexes count]
+"""
+
+import sys
+import time
+from copy import deepcopy
+
+from itc.util import dict_merge
+from itc.util.template import InappTemplate
+
+def inappDictForIndexes(count):
+    languages = {}
+    for lang in ['en', 'ru', 'pt', 'de', 'fr', 'ja', 'ko', 'es-419', 'it', 'nl']:
+        languages[lang] = {"name": "Inapp {index} - " + lang
+                         , "description": {"1-%d" % (count / 2): "First half - " + lang
+                                          , "%d-%d" % (count / 2 + 1, count): "Second half - " + lang}}
+
+    return {"index iterator": {"from": 1, "to": count}
+          , "id": "com.example.inapp.{index}"
+          , "type": "Consumable"
+          , "reference name": "Inapp {index}"
+          , "price tier": {"1-%d" % count: 1}
+          , "cleared": True
+          , "hosting content with apple": False
+          , "review notes": "Notes {index}"
+          , "review screenshot": None
+          , "general": {"publication name": "Publication {index}"}
+          , "languages": languages}
+
+def flattenDictIndexes(dict):
+    for indexKey, val in dict.items():
+        if "-" in indexKey:
+            startIndex, endIndex = indexKey.split("-")
+            for i in range(int(startIndex), int(endIndex) + 1):
+                dict[i] = val
+            del dict[indexKey]
+
+    return dict
+
+def expandWithDeepcopy(inappDict):
+    inappDict = deepcopy(inappDict)
+    for langId in inappDict['languages']:
+        inappDict['languages'][langId] = dict_merge(inappDict['general'], inappDict['languages'][langId])
+    del inappDict['general']
+    iteratorDict = inappDict.pop('index iterator')
+    indexes = range(iteratorDict.get('from', 1), iteratorDict['to'] + 1)
+
+    for key, value in inappDict.items():
+        if key != "languages" and isinstance(value, dict):
+            flattenDictIndexes(value)
+    for langDict in inappDict['languages'].values():
+        for langValue in langDict.values():
+            if isinstance(langValue, dict):
+                flattenDictIndexes(langValue)
+
+    for index in indexes:
+        inappIndexDict = deepcopy(inappDict)
+        for key, value in inappIndexDict.items():
+            if isinstance(value, basestring):
+                inappIndexDict[key] = value.replace('{index}', str(index))
+            elif isinstance(value, dict) and key != "languages":
+                inappIndexDict[key] = value[index]
+        for langDict in inappIndexDict['languages'].values():
+            for langKey, langValue in langDict.items():
+                if isinstance(langValue, basestring):
+                    langDict[langKey] = langValue.replace('{index}', str(index))
+                elif isinstance(langValue, dict):
+                    langDict[langKey] = langValue[index]
+        yield inappIndexDict
+
+def expandLazily(inappDict):
+    for inappIndexDict in InappTemplate(inappDict):
+        yield inappIndexDict
+
+def consume(inappIndexDict):
+    # reads the same values createInapp/update do
+    inappIndexDict['id']
+    inappIndexDict['price tier']
+    for langId, langVal in inappIndexDict['languages'].items():
+        langVal['name']
+        langVal['description']
+
+def measure(name, expand, inappDict, limit=None):
+    """
+    Expands at most 'limit' inapps. Total time for the whole iterator is extrapolated
+    """
+    total = inappDict['index iterator']['to']
+    startTime = time.time()
+    count = 0
+    for inappIndexDict in expand(inappDict):
+        consume(inappIndexDict)
+        count += 1
+        if count == limit:
+            break
+
+    elapsed = time.time() - startTime
+    print '%-10s %6d of %d inapps: %.3fs, estimated total: %.3fs' % (name, count, total, elapsed, elapsed * total / count)
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    inappDict = inappDictForIndexes(count)
+    # every deepcopy copies all the flattened indexes, so only first inapps are measured
+    measure('deepcopy', expandWithDeepcopy, inappDict, limit=20)
+    measure('lazy', expandLazily, inappDict)
@@ -0,0 +1,76 @@
+"""
+Benchmark of language lookups for large config expansions: every inapp of an
+'index iterator' template resolves each of its languages, as update does.
+Compares prebuilt indexes of itc.util.languages with linear scans over the
+languages map, which itc used before.
+
+Usage: python benchmarks/languages.py [inapps count]
+"""
+
+import sys
+import time
+
+from itc.util import languages
+
+def scanAppleLangIdForLanguage(languageString):
+    lang = languages.languages_map.get(languageString)
+    if lang != None:
+        if type(lang) is dict:
+            return lang['name']
+
+        return lang
+
+    for langId, lang in languages.languages_map.items():
+        if type(lang) is dict:
+            if lang['name'] == languageString:
+                return lang['id']
+        else:
+            if lang == languageString:
+                return lang
+
+    return None
+
+def scanLangCodeForLanguage(languageString):
+    for langId, lang in languages.languages_map.items():
+        if type(lang) is dict:
+            if (lang['name'] == languageString) or (lang['id'] == languageString):
+                return langId
+        else:
+            if lang == languageString:
+                return langId
+
+    return None
+
+def expand(inappsCount, appleLangIdForLanguage, langCodeForLanguage):
+    langIds = sorted(languages.languages_map.keys())
+    result = 0
+    for i in xrange(inappsCount):
+        for langId in langIds:
+            name = languages.languageNameForId(langId)
+            appleId = appleLangIdForLanguage(name)
+            if langCodeForLanguage(appleId) == langId and langCodeForLanguage(name) == langId:
+                result += 1
+
+    return result
+
+def measure(title, function, *args):
+    startTime = time.time()
+    result = function(*args)
+    print '%-30s %8.3fs' % (title, time.time() - startTime)
+
+    return result
+
+if __name__ == '__main__':
+    inappsCount = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    languages.languageNameForId('en') # load the map
+
+    for langId in languages.languages_map:
+        name = languages.languageNameForId(langId)
+        assert languages.appleLangIdForLanguage(langId) == scanAppleLangIdForLanguage(langId)
+        assert languages.appleLangIdForLanguage(name) == scanAppleLangIdForLanguage(name)
+        assert languages.langCodeForLanguage(name) == scanLangCodeForLanguage(name)
+
+    print '%d inapps, %d languages each' % (inappsCount, len(languages.languages_map))
+    scanned = measure('linear scan', expand, inappsCount, scanAppleLangIdForLanguage, scanLangCodeForLanguage)
+    indexed = measure('prebuilt indexes', expand, inappsCount, languages.appleLangIdForLanguage, languages.langCodeForLanguage)
+    assert scanned == indexed
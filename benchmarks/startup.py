@@ -0,0 +1,101 @@
+"""
+Benchmark of CLI startup. Runs 'itc --help' and 'itc' with wrong arguments in fresh
+interpreters and checks that they fit into time budget and don't import network and
+html parsing modules. With --imports, prints the slowest imports for given arguments,
+similar to 'python -X importtime'.
+
+Usage: python benchmarks/startup.py [--budget SECONDS] [--runs N]
+       python benchmarks/startup.py --imports [itc arguments]
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+ITC = os.path.join(ROOT, 'itc', 'bin', 'itc')
+ENVIRONMENT = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+HEAVY_MODULES = ('requests', 'html5lib', 'lxml', 'bs4', 'multiprocessing')
+
+CHECK_MODULES = """
+import sys
+sys.argv = ['itc'] + %r
+from itc.core import itccli
+try:
+    itccli.main()
+except SystemExit:
+    pass
+sys.stdout.write('\\nIMPORTED: ' + ' '.join(m for m in %r if m in sys.modules) + '\\n')
+"""
+
+def runTime(arguments, runs):
+    times = []
+    for i in range(runs):
+        startTime = time.time()
+        subprocess.call([sys.executable, ITC] + arguments, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT, env=ENVIRONMENT)
+        times.append(time.time() - startTime)
+
+    return sorted(times)[len(times) / 2]
+
+def importedHeavyModules(arguments):
+    process = subprocess.Popen([sys.executable, '-c', CHECK_MODULES % (arguments, HEAVY_MODULES)]
+                               , stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=ENVIRONMENT)
+    output = process.communicate()[0]
+
+    return output.split('IMPORTED:')[-1].split()
+
+def printImportTimes(arguments):
+    import __builtin__
+    originalImport = __builtin__.__import__
+    times = {}
+    stack = []
+
+    def timedImport(name, *args, **kwargs):
+        if name in sys.modules:
+            return originalImport(name, *args, **kwargs)
+
+        stack.append(name)
+        startTime = time.time()
+        try:
+            return originalImport(name, *args, **kwargs)
+        finally:
+            stack.pop()
+            times[name] = max(times.get(name, 0), time.time() - startTime)
+
+    __builtin__.__import__ = timedImport
+    sys.argv = ['itc'] + arguments
+    from itc.core import itccli
+    try:
+        itccli.main()
+    except SystemExit:
+        pass
+    __builtin__.__import__ = originalImport
+
+    print >> sys.stderr, '\n%-40s %10s' % ('module', 'cumulative')
+    for name, duration in sorted(times.items(), key=lambda item: -item[1])[:20]:
+        print >> sys.stderr, '%-40s %9.1fms' % (name, duration * 1000)
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    if len(arguments) > 0 and arguments[0] == '--imports':
+        printImportTimes(arguments[1:])
+        sys.exit(0)
+
+    budget = 0.3
+    runs = 5
+    if '--budget' in arguments:
+        budget = float(arguments[arguments.index('--budget') + 1])
+    if '--runs' in arguments:
+        runs = int(arguments[arguments.index('--runs') + 1])
+
+    failed = False
+    for title, itcArguments in (('itc --help', ['--help']), ('itc with wrong arguments', ['wrong', 'arguments'])):
+        duration = runTime(itcArguments, runs)
+        heavyModules = importedHeavyModules(itcArguments)
+        ok = duration <= budget and len(heavyModules) == 0
+        failed = failed or not ok
+        print '%-30s %6.3fs (budget %.3fs) %s%s' % (title, duration, budget, 'OK' if ok else 'FAILED'
+                                                   , (', imported: ' + ', '.join(heavyModules)) if heavyModules else '')
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,76 @@
+"""
+Benchmark of verbose (-vv) logging. Simulates a command, which fetches pages with LATENCY
+network delay, logging a few debug lines and the response body for each of them. Compares
+logging.basicConfig handler, writing bodies to the console, with the background handler of
+itc.util.logs and bodies dumped to files, each one and sampled. Console is a process reading
+CONSOLE_SPEED bytes per second, as a terminal does. 'command' is the time the command spends,
+'total' includes waiting for the log writes.
+
+Usage: python benchmarks/verbose.py [pages count]
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+
+from itc.util.logs import configureLogging, bodyDumper, backgroundWriter
+
+LATENCY = 0.02
+CONSOLE_SPEED = 10 * 1024 * 1024
+CONSOLE = """
+import sys, time
+while sys.stdin.read(65536):
+    time.sleep(65536.0 / %d)
+""" % CONSOLE_SPEED
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+BODY = '<html><body>' + '<div class="lcAjaxLightboxContents"><input name="field" value="value"/></div>' * 2000 + '</body></html>'
+
+def fetchPages(count, dumpBodies):
+    for index in xrange(count):
+        url = '/WebObjects/iTunesConnect.woa/wo/%d.0.0' % index
+        time.sleep(LATENCY)
+        if not (dumpBodies and bodyDumper.dump('GET', url, BODY)):
+            logging.debug(BODY)
+        for line in range(20):
+            logging.debug('Field %d of page %s: %s', line, url, {'name': 'field', 'value': line})
+
+def run(count, configure, dumpBodies):
+    directory = tempfile.mkdtemp()
+    console = subprocess.Popen([sys.executable, '-c', CONSOLE], stdin=subprocess.PIPE)
+    savedStderr, sys.stderr = sys.stderr, console.stdin
+    rootLogger = logging.getLogger()
+    rootLogger.handlers = []
+    bodyDumper.configure(os.path.join(directory, 'bodies') if dumpBodies else None, dumpBodies or 1)
+    try:
+        configure()
+        startTime = time.time()
+        fetchPages(count, dumpBodies)
+        callerTime = time.time() - startTime
+        backgroundWriter.flush()
+        rootLogger.handlers[0].flush()
+        totalTime = time.time() - startTime
+    finally:
+        sys.stderr = savedStderr
+        rootLogger.handlers = []
+        bodyDumper.configure(None)
+        console.stdin.close()
+        console.wait()
+        shutil.rmtree(directory)
+
+    return callerTime, totalTime
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    print '%d pages' % count
+    print '%-36s %10s %10s' % ('', 'command', 'total')
+    for title, configure, dumpBodies in (('basicConfig, bodies in the log', lambda: logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT), 0)
+                                       , ('background, bodies in the log', lambda: configureLogging(logging.DEBUG, LOG_FORMAT), 0)
+                                       , ('background, bodies dumped', lambda: configureLogging(logging.DEBUG, LOG_FORMAT), 1)
+                                       , ('background, each 10th body dumped', lambda: configureLogging(logging.DEBUG, LOG_FORMAT), 10)):
+        callerTime, totalTime = run(count, configure, dumpBodies)
+        print '%-36s %9.3fs %9.3fs' % (title, callerTime, totalTime)
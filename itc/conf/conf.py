@@ -13,9 +13,11 @@ class DEVICE_TYPE:
 
 temp_dir = gettempdir()
 default_file_format = 'images/{language}/{device_type} {index}.png'
-cookie_file_name = '.itc-cli-cookies.txt'
-cookie_file = os.path.join(temp_dir, cookie_file_name)
-cookie_jar = LWPCookieJar(cookie_file)
+default_workers = 8
+cookie_jar = LWPCookieJar()
+applications_cache_ttl = 24 * 60 * 60
+reference_cache_file = os.path.join(temp_dir, '.itc-cli-reference.json')
+session_ttl = 60 * 60
 
 class ALIASES:
     language_aliases = {}
@@ -23,12 +25,3 @@ class ALIASES:
 
 class config:
     options = {}
-
-def __initCookies():
-    if cookie_file:
-        try:
-            cookie_jar.load(cookie_file, ignore_discard=True)
-        except IOError:
-            pass
-
-__initCookies()
\ No newline at end of file
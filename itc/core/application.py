@@ -4,6 +4,7 @@ import os
 import re
 import json
 import logging
+import hashlib
 import sys
 from datetime import datetime, timedelta
 
@@ -12,12 +13,29 @@ import requests
 from itc.core.inapp import ITCInappPurchase
 from itc.core.imageuploader import ITCImageUploader
 from itc.parsers.applicationparser import ITCApplicationParser
+from itc.parsers.inappparser import ITCInappParser
+from itc.parsers.baseparser import SessionExpiredError, sessionLock
 from itc.util import languages
 from itc.util import dataFromStringOrFile
 from itc.util import EnhancedFile
+from itc.util.progress import ProgressIndicator
+from itc.util.plan import changesPlan, isPlanning, isApplyingChangesOnly
+from itc.util.profiling import profiler, profiledPhase, DISK
+from itc.util.memory import memoryReport
+from itc.util.columnar import writeReviews, writeInappsCatalog
 from itc.conf import *
 
-class ITCApplication(ITCImageUploader):
+class ITCApplication(object):
+    """
+    Applications are kept in slots and share parsers, and so requests sessions of each thread,
+    with each other, so accounts with many applications and inapps stay light
+    """
+    __slots__ = ('name', 'applicationId', 'applicationLink', 'versions', 'inapps', 'promocodesLink'
+                 , '_manageInappsLink', '_customerReviewsLink', '_addVersionLink', '_reloadInappsAction'
+                 , '_createInappLink', '_inappActionURLs', '__weakref__')
+    _parser = ITCApplicationParser()
+    _inappParser = ITCInappParser()
+
     def __init__(self, name=None, applicationId=None, link=None, dict=None):
         if (dict):
             name = dict['name']
@@ -33,13 +51,12 @@ class ITCApplication(ITCImageUploader):
         self._manageInappsLink = None
         self._customerReviewsLink = None
         self._addVersionLink = None
-        self._manageInappsTree = None
+        self._reloadInappsAction = None
         self._createInappLink = None
         self._inappActionURLs = None
-        self._parser = ITCApplicationParser()
+        self.promocodesLink = None
 
-        logging.info('Application found: ' + self.__str__())
-        super(ITCApplication, self).__init__()
+        memoryReport.track(self)
 
 
     def __repr__(self):
@@ -69,20 +86,22 @@ class ITCApplication(ITCImageUploader):
         self.versions = versionsMetadata.versions
 
 
-    def __parseAppVersionMetadata(self, version, language=None):
-        tree = self._parser.parseTreeForURL(version['detailsLink'])
+    @profiledPhase('version parse')
+    def __parseAppVersionMetadata(self, version, language=None, tree=None):
+        if tree == None:
+            tree = self._parser.parseTreeForURL(version.detailsLink)
 
         return self._parser.parseCreateOrEditPage(tree, version, language)
 
     def __parseAppReviewInformation(self, version):
-        tree = self._parser.parseTreeForURL(version['detailsLink'])
+        tree = self._parser.parseTreeForURL(version.detailsLink)
 
         return self._parser.parseAppReviewInfoForm(tree)
 
-    def __generateConfigForVersion(self, version):
+    def __generateConfigForVersion(self, version, tree=None):
         languagesDict = {}
 
-        metadata = self.__parseAppVersionMetadata(version)
+        metadata = self.__parseAppVersionMetadata(version, tree=tree)
         formData = metadata.formData
         # activatedLanguages = metadata.activatedLanguages
 
@@ -105,36 +124,115 @@ class ITCApplication(ITCImageUploader):
         return resultDict
 
 
-    def generateConfig(self, versionString=None, generateInapps=False):
+    def __versionFingerprint(self, version, generateInapps, outputFormat):
+        """
+        Fingerprint of the version's state from the application page: version string and status,
+        so version details aren't requested for unchanged versions. If inapps are generated
+        as well, inapps list and output format are also taken into account
+        """
+        state = [version.versionString, version.statusString]
+
+        if generateInapps:
+            state.append(outputFormat)
+            if not self.inapps:
+                self.getInapps()
+            state.append(sorted([inapp.appleId, inapp.productId, inapp.name] for inapp in (self.inapps or {}).values()))
+
+        return hashlib.sha1(json.dumps(state)).hexdigest()
+
+
+    def generateConfig(self, versionString=None, generateInapps=False, outputFormat='json'):
+        """
+        Writes configuration file <application id>.json. With 'columnar' outputFormat, inapps
+        are also written to <application id>.inapps.itcc catalog for analytics. Catalog keeps only
+        the main fields, so configuration file still has all of them
+        """
         if len(self.versions) == 0:
             self.getAppInfo()
         if len(self.versions) == 0:
             raise 'Can\'t get application versions'
         if versionString == None: # Suppose there's one or less editable versions
-            versionString = next((versionString for versionString, version in self.versions.items() if version['editable']), None)
+            versionString = next((versionString for versionString, version in self.versions.items() if version.editable), None)
         if versionString == None: # No versions to edit. Generate config from the first one
             versionString = self.versions.keys()[0]
         
-        resultDict = self.__generateConfigForVersion(self.versions[versionString])
+        version = self.versions[versionString]
+        filename = str(self.applicationId) + '.json'
+        fingerprintFilename = filename + '.fingerprint'
+        catalogFilename = str(self.applicationId) + '.inapps.itcc'
+        outputFilenames = [filename, fingerprintFilename]
+        if generateInapps and outputFormat == 'columnar':
+            outputFilenames.append(catalogFilename)
+
+        fingerprint = self.__versionFingerprint(version, generateInapps, outputFormat)
+        if all(os.path.exists(outputFilename) for outputFilename in outputFilenames):
+            with open(fingerprintFilename, 'r') as fp:
+                if fp.read().strip() == fingerprint:
+                    logging.info('Version %s of %s is not changed since last generation. Skipping', versionString, self)
+                    return
+
+        # version page and its localization lightboxes are opened by one thread at a time
+        with sessionLock:
+            resultDict = self.__generateConfigForVersion(version)
 
         if generateInapps:
-            if len(self.inapps) == 0:
-                self.getInapps()
-
-            inapps = []
-            for inappId, inapp in self.inapps.items():
-                inapps.append(inapp.generateConfig())
-
+            inapps = [inapp for inappId, inapp in sorted(self.inapps.items())]
+            logging.info('Fetching metadata for %d inapps', len(inapps))
+            with profiler.phase('inapps'):
+                inappsMetadata = self._inappParser.metadataForInappPurchases([inapp.itemURL for inapp in inapps])
+                inapps = [inapp.generateConfig(metadata) for inapp, metadata in zip(inapps, inappsMetadata)]
+
+            if outputFormat == 'columnar':
+                with profiler.phase('output'):
+                    writeInappsCatalog(catalogFilename, inapps)
             if len(inapps) > 0:
                 resultDict['inapps'] = inapps
 
-        filename = str(self.applicationId) + '.json'
-        with open(filename, 'wb') as fp:
-            json.dump(resultDict, fp, sort_keys=False, indent=4, separators=(',', ': '))
+        with profiler.phase('output'), profiler.measure(DISK):
+            with open(filename, 'wb') as fp:
+                json.dump(resultDict, fp, sort_keys=False, indent=4, separators=(',', ': '))
+
+            with open(fingerprintFilename, 'wb') as fp:
+                fp.write(fingerprint)
+
+
+    def updateWithConfig(self, compiledConfig):
+        """
+        Updates metadata, review information and inapps with compiled configuration
+        """
+        self.editVersions(compiledConfig.langActions, filename_format=compiledConfig.filenameFormat)
+
+        if compiledConfig.reviewInformation != None:
+            self.editReviewInformation(compiledConfig.reviewInformation)
+
+        inappsToProcess = []
+        for inappTemplate in compiledConfig.inapps:
+            inappsToProcess.extend(inappTemplate)
+
+        if len(inappsToProcess) > 0:
+            return self.createOrUpdateInapps(inappsToProcess)
+
+        return []
+
+
+    def addVersionWithConfig(self, compiledConfig):
+        langActions = dict(compiledConfig.langActions)
+        langActions['default'] = compiledConfig.commonActions
+        self.addVersion(compiledConfig.version, langActions)
 
 
     def editVersion(self, dataDict, lang=None, versionString=None, filename_format=None):
-        if dataDict == None or len(dataDict) == 0: # nothing to change
+        self.editVersions({lang: dataDict}, versionString=versionString, filename_format=filename_format)
+
+
+    def editVersions(self, langActions, versionString=None, filename_format=None):
+        """
+        Edits metadata and screenshots for several languages at once. Version page is fetched once,
+        then lightbox of each language is opened, its screenshots are processed and it's saved
+        before the next one is opened, as the server side session keeps only the last opened lightbox
+        """
+        langActions = dict((lang, dataDict) for lang, dataDict in langActions.items() if dataDict != None and len(dataDict) != 0)
+        if len(langActions) == 0: # nothing to change
             return
 
         if len(self.versions) == 0:
@@ -142,18 +240,25 @@ class ITCApplication(ITCImageUploader):
         if len(self.versions) == 0:
             raise 'Can\'t get application versions'
         if versionString == None: # Suppose there's one or less editable versions
-            versionString = next((versionString for versionString, version in self.versions.items() if version['editable']), None)
+            versionString = next((versionString for versionString, version in self.versions.items() if version.editable), None)
         if versionString == None: # Suppose there's one or less editable versions
             raise 'No editable version found'
             
         version = self.versions[versionString]
-        if not version['editable']:
+        if not version.editable:
             raise 'Version ' + versionString + ' is not editable'
 
+        with sessionLock:
+            tree = self._parser.parseTreeForURL(version.detailsLink)
+            for lang, dataDict in langActions.items():
+                metadata = self.__parseAppVersionMetadata(version, lang, tree=tree)
+                self.__editVersionLanguage(metadata, dataDict, lang, filename_format)
+
+
+    def __editVersionLanguage(self, metadata, dataDict, lang, filename_format):
         languageId = languages.appleLangIdForLanguage(lang)
         languageCode = languages.langCodeForLanguage(lang)
 
-        metadata = self.__parseAppVersionMetadata(version, lang)
         # activatedLanguages = metadata.activatedLanguages
         # nonactivatedLanguages = metadata.nonactivatedLanguages
         formData = {} #metadata.formData[languageId]
@@ -171,6 +276,35 @@ class ITCApplication(ITCImageUploader):
         formData[formNames['marketingURLName']] = dataDict.get('marketing url', metadata.formData[languageId]['marketingURLValue'])
         formData[formNames['pPolicyURLName']]   = dataDict.get('privacy policy url', metadata.formData[languageId]['pPolicyURLValue'])
 
+        scope = 'App ' + str(self.applicationId) + ' / ' + lang
+        currentValues = {}
+        newValues = {}
+        for field, nameKey, valueKey in [('name', 'appNameName', 'appNameValue')
+                                       , ('description', 'descriptionName', 'descriptionValue')
+                                       , ('whats new', 'whatsNewName', 'whatsNewValue')
+                                       , ('keywords', 'keywordsName', 'keywordsValue')
+                                       , ('support url', 'supportURLName', 'supportURLValue')
+                                       , ('marketing url', 'marketingURLName', 'marketingURLValue')
+                                       , ('privacy policy url', 'pPolicyURLName', 'pPolicyURLValue')]:
+            if nameKey in formNames:
+                currentValues[field] = metadata.formData[languageId].get(valueKey)
+                newValues[field] = formData[formNames[nameKey]]
+
+        metadataChanged = changesPlan.addDifferences(scope, currentValues, newValues)
+
+        imagesActions = dataDict.get('images', {})
+        for dType, deviceImagesActions in imagesActions.items():
+            if dType.lower() in ('iphone', 'iphone 5', 'ipad') and deviceImagesActions != "":
+                changesPlan.addAction(scope + ' / ' + dType, 'images: ' + ', '.join(str(action) for action in deviceImagesActions))
+                metadataChanged = True
+
+        if isPlanning():
+            return
+
+        if isApplyingChangesOnly() and not metadataChanged:
+            logging.debug('Metadata for %s is not changed. Skipping', lang)
+            return
+
         iphoneUploadScreenshotForm  = formNames['iphoneUploadScreenshotForm'] 
         iphone5UploadScreenshotForm = formNames['iphone5UploadScreenshotForm']
         ipadUploadScreenshotForm    = formNames['ipadUploadScreenshotForm']
@@ -179,28 +313,24 @@ class ITCApplication(ITCImageUploader):
         iphone5UploadScreenshotJS = iphone5UploadScreenshotForm.xpath('../following-sibling::script/text()')[0]
         ipadUploadScreenshotJS = ipadUploadScreenshotForm.xpath('../following-sibling::script/text()')[0]
 
-        self._uploadSessionData[DEVICE_TYPE.iPhone] = dict({'action': iphoneUploadScreenshotForm.attrib['action']
+        # upload session belongs to the language's lightbox, so each language has its own uploader
+        uploader = ITCImageUploader(parser=self._parser)
+        uploader._uploadSessionData[DEVICE_TYPE.iPhone] = dict({'action': iphoneUploadScreenshotForm.attrib['action']
                                                         , 'key': iphoneUploadScreenshotForm.xpath(".//input[@name='uploadKey']/@value")[0]
-                                                      }, **self.parseURLSFromScript(iphoneUploadScreenshotJS))
-        self._uploadSessionData[DEVICE_TYPE.iPhone5] = dict({'action': iphone5UploadScreenshotForm.attrib['action']
+                                                      }, **uploader.parseURLSFromScript(iphoneUploadScreenshotJS))
+        uploader._uploadSessionData[DEVICE_TYPE.iPhone5] = dict({'action': iphone5UploadScreenshotForm.attrib['action']
                                                          , 'key': iphone5UploadScreenshotForm.xpath(".//input[@name='uploadKey']/@value")[0]
-                                                       }, **self.parseURLSFromScript(iphone5UploadScreenshotJS))
-        self._uploadSessionData[DEVICE_TYPE.iPad] = dict({'action': ipadUploadScreenshotForm.attrib['action']
+                                                       }, **uploader.parseURLSFromScript(iphone5UploadScreenshotJS))
+        uploader._uploadSessionData[DEVICE_TYPE.iPad] = dict({'action': ipadUploadScreenshotForm.attrib['action']
                                                       , 'key': ipadUploadScreenshotForm.xpath(".//input[@name='uploadKey']/@value")[0]
-                                                    }, **self.parseURLSFromScript(ipadUploadScreenshotJS))
+                                                    }, **uploader.parseURLSFromScript(ipadUploadScreenshotJS))
 
-        self._uploadSessionId = iphoneUploadScreenshotForm.xpath('.//input[@name="uploadSessionID"]/@value')[0]
+        uploader._uploadSessionId = iphoneUploadScreenshotForm.xpath('.//input[@name="uploadSessionID"]/@value')[0]
 
-        # get all images
-        for device_type in [DEVICE_TYPE.iPhone, DEVICE_TYPE.iPhone5, DEVICE_TYPE.iPad]:
-            self._images[device_type] = self.imagesForDevice(device_type)
-
-        logging.debug(self._images)
         # logging.debug(formData)
 
         if 'images' in dataDict:
             imagesActions = dataDict['images']
-            languageCode = languages.langCodeForLanguage(lang)
 
             for dType in imagesActions:
                 device_type = None
@@ -217,44 +347,47 @@ class ITCApplication(ITCImageUploader):
                 if deviceImagesActions == "":
                     continue
 
+                # images are requested only for device types, which are going to be modified
+                uploader._images[device_type] = uploader.imagesForDevice(device_type)
+                logging.debug('Images: %s', uploader._images[device_type])
+
                 for imageAction in deviceImagesActions:
-                    imageAction.setdefault('cmd')
-                    imageAction.setdefault('indexes')
-                    cmd = imageAction['cmd']
-                    indexes = imageAction['indexes']
+                    # actions are shared between languages by compiled configuration, so they aren't modified
+                    cmd = imageAction.get('cmd')
+                    indexes = imageAction.get('indexes')
                     replace_language = ALIASES.language_aliases.get(languageCode, languageCode)
                     replace_device = ALIASES.device_type_aliases.get(dType.lower(), DEVICE_TYPE.deviceStrings[device_type])
 
                     imagePath = filename_format.replace('{language}', replace_language) \
                            .replace('{device_type}', replace_device)
-                    logging.debug('Looking for images at ' + imagePath)
+                    logging.debug('Looking for images at %s', imagePath)
 
                     if (indexes == None) and ((cmd == 'u') or (cmd == 'r')):
                         indexes = []
                         for i in range(0, 5):
                             realImagePath = imagePath.replace("{index}", str(i + 1))
-                            logging.debug('img path: ' + realImagePath)
+                            logging.debug('img path: %s', realImagePath)
                             if os.path.exists(realImagePath):
                                 indexes.append(i + 1)
 
-                    logging.debug('indexes ' + indexes.__str__())
-                    logging.debug('Processing command ' + imageAction.__str__())
+                    logging.debug('indexes %s', indexes)
+                    logging.debug('Processing command %s', imageAction)
 
                     if (cmd == 'd') or (cmd == 'r'): # delete or replace. To perform replace we need to delete images first
-                        deleteIndexes = [img['id'] for img in self._images[device_type]]
+                        deleteIndexes = [img['id'] for img in uploader._images[device_type]]
                         if indexes != None:
                             deleteIndexes = [deleteIndexes[idx - 1] for idx in indexes]
 
-                        logging.debug('deleting images ' + deleteIndexes.__str__())
+                        logging.debug('deleting images %s', deleteIndexes)
                         
                         for imageIndexToDelete in deleteIndexes:
-                            img = next(im for im in self._images[device_type] if im['id'] == imageIndexToDelete)
-                            self.deleteScreenshot(device_type, img['id'])
+                            img = next(im for im in uploader._images[device_type] if im['id'] == imageIndexToDelete)
+                            uploader.deleteScreenshot(device_type, img['id'])
 
-                        self._images[device_type] = self.imagesForDevice(device_type)
+                        uploader._images[device_type] = uploader.imagesForDevice(device_type)
                     
                     if (cmd == 'u') or (cmd == 'r'): # upload or replace
-                        currentIndexes = [img['id'] for img in self._images[device_type]]
+                        currentIndexes = [img['id'] for img in uploader._images[device_type]]
 
                         if indexes == None:
                             continue
@@ -263,12 +396,12 @@ class ITCApplication(ITCImageUploader):
                         for i in indexes:
                             realImagePath = imagePath.replace("{index}", str(i))
                             if os.path.exists(realImagePath):
-                                self.uploadScreenshot(device_type, realImagePath)
+                                uploader.uploadScreenshot(device_type, realImagePath)
 
-                        self._images[device_type] = self.imagesForDevice(device_type)
+                        uploader._images[device_type] = uploader.imagesForDevice(device_type)
 
                         if cmd == 'r':
-                            newIndexes = [img['id'] for img in self._images[device_type]][len(currentIndexes):]
+                            newIndexes = [img['id'] for img in uploader._images[device_type]][len(currentIndexes):]
 
                             if len(newIndexes) == 0:
                                 continue
@@ -276,28 +409,28 @@ class ITCApplication(ITCImageUploader):
                             for i in indexes:
                                 currentIndexes.insert(i - 1, newIndexes.pop(0))
 
-                            self.sortScreenshots(device_type, currentIndexes)
-                            self._images[device_type] = self.imagesForDevice(device_type)
+                            uploader.sortScreenshots(device_type, currentIndexes)
+                            uploader._images[device_type] = uploader.imagesForDevice(device_type)
 
                     if (cmd == 's'): # sort
-                        if indexes == None or len(indexes) != len(self._images[device_type]):
+                        if indexes == None or len(indexes) != len(uploader._images[device_type]):
                             continue
-                        newIndexes = [self._images[device_type][i - 1]['id'] for i in indexes]
+                        newIndexes = [uploader._images[device_type][i - 1]['id'] for i in indexes]
 
-                        self.sortScreenshots(device_type, newIndexes)
-                        self._images[device_type] = self.imagesForDevice(device_type)
+                        uploader.sortScreenshots(device_type, newIndexes)
+                        uploader._images[device_type] = uploader.imagesForDevice(device_type)
 
-        formData['uploadSessionID'] = self._uploadSessionId
+        formData['uploadSessionID'] = uploader._uploadSessionId
         logging.debug(formData)
         # formData['uploadKey'] = self._uploadSessionData[DEVICE_TYPE.iPhone5]['key']
 
-        postFormResponse = self._parser.requests_session.post(ITUNESCONNECT_URL + submitAction, data = formData, cookies=cookie_jar)
+        postFormResponse = self._parser.request(submitAction, method="POST", data = formData)
 
         if postFormResponse.status_code != 200:
             raise 'Wrong response from iTunesConnect. Status code: ' + str(postFormResponse.status_code)
 
         if len(postFormResponse.text) > 0:
-            logging.error("Save information failed. " + postFormResponse.text)
+            logging.error("Save information failed. %s", postFormResponse.text)
 
 ########## App Review Information management ##########
 
@@ -310,44 +443,56 @@ class ITCApplication(ITCImageUploader):
         if len(self.versions) == 0:
             raise 'Can\'t get application versions'
 
-        versionString = next((versionString for versionString, version in self.versions.items() if version['editable']), None)
+        versionString = next((versionString for versionString, version in self.versions.items() if version.editable), None)
         if versionString == None: # Suppose there's one or less editable versions
             raise 'No editable version found'
             
         version = self.versions[versionString]
-        if not version['editable']:
+        if not version.editable:
             raise 'Version ' + versionString + ' is not editable'
 
-        metadata = self.__parseAppReviewInformation(version)
-        formData = {}
-        formNames = metadata.formNames
-        submitAction = metadata.submitAction
-        
-        formData["save"] = "true"
+        # review information lightbox is kept in the server side session
+        with sessionLock:
+            metadata = self.__parseAppReviewInformation(version)
+            formData = {}
+            formNames = metadata.formNames
+            submitAction = metadata.submitAction
 
-        formData[formNames['first name']]    = appReviewInfo.get('first name', metadata.formData['first name'])
-        formData[formNames['last name']]     = appReviewInfo.get('last name', metadata.formData['last name'])
-        formData[formNames['email address']] = appReviewInfo.get('email address', metadata.formData['email address'])
-        formData[formNames['phone number']]  = appReviewInfo.get('phone number', metadata.formData['phone number'])
-        formData[formNames['review notes']]  = dataFromStringOrFile(appReviewInfo.get('review notes', metadata.formData['review notes']))
-        formData[formNames['username']]      = appReviewInfo.get('username', metadata.formData['username'])
-        formData[formNames['password']]      = appReviewInfo.get('password', metadata.formData['password'])
+            formData["save"] = "true"
 
-        logging.debug(formData)
-        postFormResponse = self._parser.requests_session.post(ITUNESCONNECT_URL + submitAction, data = formData, cookies=cookie_jar)
+            formData[formNames['first name']]    = appReviewInfo.get('first name', metadata.formData['first name'])
+            formData[formNames['last name']]     = appReviewInfo.get('last name', metadata.formData['last name'])
+            formData[formNames['email address']] = appReviewInfo.get('email address', metadata.formData['email address'])
+            formData[formNames['phone number']]  = appReviewInfo.get('phone number', metadata.formData['phone number'])
+            formData[formNames['review notes']]  = dataFromStringOrFile(appReviewInfo.get('review notes', metadata.formData['review notes']))
+            formData[formNames['username']]      = appReviewInfo.get('username', metadata.formData['username'])
+            formData[formNames['password']]      = appReviewInfo.get('password', metadata.formData['password'])
 
-        if postFormResponse.status_code != 200:
-            raise 'Wrong response from iTunesConnect. Status code: ' + str(postFormResponse.status_code)
+            newValues = dict((field, formData[formNames[field]]) for field in metadata.formData)
+            reviewInfoChanged = changesPlan.addDifferences('App ' + str(self.applicationId) + ' / app review information'
+                                                            , metadata.formData, newValues)
 
-        if len(postFormResponse.text) > 0:
-            logging.error("Save information failed. " + postFormResponse.text)
+            if isPlanning():
+                return
+
+            if isApplyingChangesOnly() and not reviewInfoChanged:
+                logging.info('App review information is not changed. Skipping')
+                return
+
+            logging.debug(formData)
+            postFormResponse = self._parser.request(submitAction, method="POST", data = formData)
+
+            if postFormResponse.status_code != 200:
+                raise 'Wrong response from iTunesConnect. Status code: ' + str(postFormResponse.status_code)
+
+            if len(postFormResponse.text) > 0:
+                logging.error("Save information failed. %s", postFormResponse.text)
 
 ################## In-App management ##################
 
     def __parseInappActionURLsFromScript(self, script):
         matches = re.findall('\'([^\']+)\'\s:\s\'([^\']+)\'', script)
         self._inappActionURLs = dict((k, v) for k, v in matches if k.endswith('Url'))
-        ITCInappPurchase.actionURLs = self._inappActionURLs
 
         return self._inappActionURLs
 
@@ -360,7 +505,7 @@ class ITCApplication(ITCImageUploader):
             logging.info('No In-App Purchases found')
             return None
 
-        logging.debug('Found ' + str(len(inappULs)) + ' inapps')
+        logging.debug('Found %d inapps', len(inappULs))
 
         inappsActionScript = refreshContainerTree.xpath('//script[contains(., "var arguments")]/text()')
         if len(inappsActionScript) > 0:
@@ -398,8 +543,6 @@ class ITCApplication(ITCImageUploader):
         tree = self._parser.parseTreeForURL(self._manageInappsLink)
 
         self._createInappLink = tree.xpath('//img[contains(@src, "btn-create-new-in-app-purchase.png")]/../@href')[0]
-        if ITCInappPurchase.createInappLink == None:
-            ITCInappPurchase.createInappLink = self._createInappLink
 
         refreshContainerTree = tree.xpath('//span[@id="ajaxListListRefreshContainerId"]/ul')[0]
         self.inapps = self.__parseInappsFromTree(refreshContainerTree)
@@ -415,23 +558,24 @@ class ITCApplication(ITCImageUploader):
         if self.inapps.get(inappId) != None:
             return self.inapps[inappId]
 
-        if self._manageInappsTree == None:
-            self._manageInappsTree = self._parser.parseTreeForURL(self._manageInappsLink)
+        # only the action is kept, not the whole page
+        if self._reloadInappsAction == None:
+            tree = self._parser.parseTreeForURL(self._manageInappsLink)
+            self._reloadInappsAction = tree.xpath('//span[@id="ajaxListListRefreshContainerId"]/@action')[0]
 
-        tree = self._manageInappsTree
-        reloadInappsAction = tree.xpath('//span[@id="ajaxListListRefreshContainerId"]/@action')[0]
+        reloadInappsAction = self._reloadInappsAction
         searchAction = self._inappActionURLs['searchActionUrl']
 
-        logging.info('Searching for inapp with id ' + inappId)
+        logging.debug('Searching for inapp with id %s', inappId)
 
-        searchResponse = self._parser.requests_session.get(ITUNESCONNECT_URL + searchAction + "?query=" + inappId, cookies=cookie_jar)
+        searchResponse = self._parser.request(searchAction + "?query=" + inappId)
 
         if searchResponse.status_code != 200:
             raise 'Wrong response from iTunesConnect. Status code: ' + str(searchResponse.status_code)
 
         statusJSON = json.loads(searchResponse.content)
         if statusJSON['totalItems'] <= 0:
-            logging.warn('No matching inapps found! Search term: ' + inappId)
+            logging.warn('No matching inapps found! Search term: %s', inappId)
             return None
 
         inapps = self.__parseInappsFromTree(self._parser.parseTreeForURL(reloadInappsAction))
@@ -455,7 +599,7 @@ class ITCApplication(ITCImageUploader):
         if len(tmpinapps) == 1:
             return tmpinapps[0]
 
-        logging.error('Multiple inapps found for id (' + inappId + ').')
+        logging.error('Multiple inapps found for id (%s).', inappId)
         logging.error(tmpinapps)
 
         # TODO: handle this situation. It is possible to avoid this exception by requesting
@@ -470,7 +614,7 @@ class ITCApplication(ITCImageUploader):
             raise 'Can\'t create inapp purchase'
 
         if not (inappDict['type'] in ITCInappPurchase.supportedIAPTypes):
-            logging.error('Can\'t create inapp purchase: "' + inappDict['id'] + '" is not supported')
+            logging.error('Can\'t create inapp purchase: "%s" is not supported', inappDict['id'])
             return
 
         iap = ITCInappPurchase(name=inappDict['reference name']
@@ -481,7 +625,84 @@ class ITCApplication(ITCImageUploader):
         iap.hostingContentWithApple = inappDict['hosting content with apple']
         iap.reviewNotes = inappDict['review notes']
 
-        iap.create(inappDict['languages'], screenshot=inappDict.get('review screenshot'))
+        return iap.create(self._createInappLink, inappDict['languages'], screenshot=inappDict.get('review screenshot'))
+
+
+    def __planInapps(self, inappDicts):
+        """
+        Resolves product ids of all the inapps against current inapps list.
+        Returns a list of dictionaries to create and a list of (inapp, dictionary) pairs to update
+        """
+        if self._inappActionURLs == None:
+            self.getInapps()
+
+        catalog = dict((inapp.productId, inapp) for inapp in (self.inapps or {}).values())
+        toCreate = []
+        toUpdate = []
+
+        for inappDict in inappDicts:
+            inapp = catalog.get(inappDict['id'])
+            if inapp == None: # product id may be truncated in the list or inapp is on another page. Search for it
+                with sessionLock: # search results are kept in the server side session
+                    inapp = self.getInappById(inappDict['id'])
+
+            if inapp == None:
+                toCreate.append(inappDict)
+            else:
+                toUpdate.append((inapp, inappDict))
+
+        return toCreate, toUpdate
+
+
+    def __createOrUpdateInapp(self, inapp, inappDict, progress):
+        try:
+            # item page, its lightboxes and creation wizard are kept in the server side session
+            with sessionLock:
+                if inapp == None:
+                    languageErrors = self.createInapp(inappDict)
+                else:
+                    languageErrors = inapp.update(inappDict)
+        except SessionExpiredError:
+            raise
+        except Exception as e:
+            logging.error('Failed to process inapp %s: %s', inappDict['id'], e)
+            return inappDict['id']
+        finally:
+            progress.step()
+
+        if languageErrors:
+            return inappDict['id']
+
+        return None
+
+
+    @profiledPhase('inapps')
+    def createOrUpdateInapps(self, inappDicts):
+        """
+        Resolves all the inapps first, then creates new inapps and updates existing ones.
+        Search results, creation wizard and lightboxes are stored in the session on the server side,
+        which is shared by all the threads, so inapps are processed one by one.
+        Failure of one inapp doesn't stop the others. Returns a list of failed product ids
+        """
+        logging.info('Resolving %d inapps', len(inappDicts))
+        toCreate, toUpdate = self.__planInapps(inappDicts)
+        logging.info('Inapps to create: %d, to update: %d', len(toCreate), len(toUpdate))
+
+        if isPlanning():
+            for inappDict in toCreate:
+                changesPlan.addAction('Inapp ' + inappDict['id'], 'create')
+            toCreate = []
+
+        progress = ProgressIndicator(len(toCreate) + len(toUpdate))
+        failedIds = [self.__createOrUpdateInapp(None, inappDict, progress) for inappDict in toCreate]
+        failedIds += [self.__createOrUpdateInapp(inapp, inappDict, progress) for inapp, inappDict in toUpdate]
+        progress.finish()
+
+        failedIds = [inappId for inappId in failedIds if inappId != None]
+        if len(failedIds) > 0:
+            logging.error('Failed to process %d of %d inapps: %s', len(failedIds), len(toCreate) + len(toUpdate), ', '.join(failedIds))
+
+        return failedIds
 
 ####################### Add version ########################
 
@@ -495,69 +716,122 @@ class ITCApplication(ITCImageUploader):
             raise 'Can\'t find \'Add Version\' link.'
 
         logging.info('Parsing \'Add Version\' page')
-        tree = self._parser.parseTreeForURL(self._addVersionLink)
-        metadata = self._parser.parseAddVersionPageMetadata(tree)
-        formData = {metadata.saveButton + '.x': 46, metadata.saveButton + '.y': 10}
-        formData[metadata.formNames['version']] = version
-        defaultWhatsNew = langActions.get('default', {}).get('whats new', '')
-        logging.debug('Default what\'s new: ' + defaultWhatsNew.__str__())
-        for lang, taName in metadata.formNames['languages'].items():
-            languageCode = languages.langCodeForLanguage(lang)
-            whatsNew = langActions.get(lang, {}).get('whats new', defaultWhatsNew)
-            
-            if (isinstance(whatsNew, dict)):
-                whatsNew = dataFromStringOrFile(whatsNew, languageCode)
-            formData[taName] = whatsNew
-        self._parser.requests_session.post(ITUNESCONNECT_URL + metadata.submitAction, data = formData, cookies=cookie_jar)
+        # 'Add Version' page is kept in the server side session until it's submitted
+        with sessionLock:
+            tree = self._parser.parseTreeForURL(self._addVersionLink)
+            metadata = self._parser.parseAddVersionPageMetadata(tree)
+            formData = {metadata.saveButton + '.x': 46, metadata.saveButton + '.y': 10}
+            formData[metadata.formNames['version']] = version
+            defaultWhatsNew = langActions.get('default', {}).get('whats new', '')
+            logging.debug('Default what\'s new: %s', defaultWhatsNew)
+            for lang, taName in metadata.formNames['languages'].items():
+                languageCode = languages.langCodeForLanguage(lang)
+                whatsNew = langActions.get(lang, {}).get('whats new', defaultWhatsNew)
+
+                if (isinstance(whatsNew, dict)):
+                    whatsNew = dataFromStringOrFile(whatsNew, languageCode)
+                formData[taName] = whatsNew
+            self._parser.request(metadata.submitAction, method="POST", data = formData)
 
         # TODO: Add error handling
 
 
 ################## Promo codes management ##################
 
-    def getPromocodes(self, amount):
+    def __resolvePromocodesLink(self):
         if len(self.versions) == 0:
             self.getAppInfo()
         if len(self.versions) == 0:
             raise 'Can\'t get application versions'
 
         # We need non-editable version to get promocodes from
-        versionString = next((versionString for versionString, version in self.versions.items() if version['statusString'] == "Ready for Sale"), None)
+        versionString = next((versionString for versionString, version in self.versions.items() if version.statusString == "Ready for Sale"), None)
         if versionString == None:
             raise 'No "Ready for Sale" versions found'
             
         version = self.versions[versionString]
-        if version['editable']:
+        if version.editable:
             raise 'Version ' + versionString + ' is editable.'
 
         #get promocodes link
         logging.info('Getting promocodes link')
-        tree = self._parser.parseTreeForURL(version['detailsLink'])
+        tree = self._parser.parseTreeForURL(version.detailsLink)
         promocodesLink = self._parser.getPromocodesLink(tree)
-        logging.debug('Promocodes link: ' + promocodesLink)
-
-        #enter number of promocodes
-        logging.info('Requesting promocodes: ' + amount)
-        tree = self._parser.parseTreeForURL(promocodesLink)
-        metadata = self._parser.parsePromocodesPageMetadata(tree)
-        formData = {metadata.continueButton + '.x': 46, metadata.continueButton + '.y': 10}
-        formData[metadata.amountName] = amount
-        postFormResponse = self._parser.requests_session.post(ITUNESCONNECT_URL + metadata.submitAction, data = formData, cookies=cookie_jar)
-
-        #accept license agreement
-        logging.info('Accepting license agreement')
-        metadata = self._parser.parsePromocodesLicenseAgreementPage(postFormResponse.text)
-        formData = {metadata.continueButton + '.x': 46, metadata.continueButton + '.y': 10}
-        formData[metadata.agreeTickName] = metadata.agreeTickName
-        postFormResponse = self._parser.requests_session.post(ITUNESCONNECT_URL + metadata.submitAction, data = formData, cookies=cookie_jar)
+        logging.debug('Promocodes link: %s', promocodesLink)
+
+        return promocodesLink
+
+
+    def __promocodesPageMetadata(self):
+        """
+        Returns None if promocodes page can't be parsed, i.e. link is stale
+        """
+        tree = self._parser.parseTreeForURL(self.promocodesLink)
+        if tree == None:
+            return None
+
+        try:
+            return self._parser.parsePromocodesPageMetadata(tree)
+        except IndexError:
+            return None
+
+
+    def __requestPromocodes(self, amount):
+        """
+        Runs promocodes wizard: amount, then license agreement. Wizard is kept in the server side
+        session, so it's run by one thread at a time. Returns download link or None if
+        promocodes page can't be parsed, i.e. link is stale
+        """
+        with sessionLock:
+            metadata = self.__promocodesPageMetadata()
+            if metadata == None:
+                return None
+
+            #enter number of promocodes
+            logging.info('Requesting promocodes: %s', amount)
+            formData = {metadata.continueButton + '.x': 46, metadata.continueButton + '.y': 10}
+            formData[metadata.amountName] = amount
+            postFormResponse = self._parser.request(metadata.submitAction, method="POST", data = formData)
+
+            #accept license agreement
+            logging.info('Accepting license agreement')
+            metadata = self._parser.parsePromocodesLicenseAgreementPage(postFormResponse.text)
+            formData = {metadata.continueButton + '.x': 46, metadata.continueButton + '.y': 10}
+            formData[metadata.agreeTickName] = metadata.agreeTickName
+            postFormResponse = self._parser.request(metadata.submitAction, method="POST", data = formData)
+
+            return self._parser.getDownloadCodesLink(postFormResponse.text)
+
+
+    def getPromocodes(self, amount, outputFile=None):
+        """
+        Requests amount of promocodes. If outputFile is given, codes are streamed to it
+        and None is returned, otherwise codes are returned as a string.
+        Resolved promocodes link is kept in promocodesLink, so version pages aren't requested next time.
+        Only link resolution and download run concurrently with other applications
+        """
+        downloadCodesLink = None
+        if self.promocodesLink != None:
+            downloadCodesLink = self.__requestPromocodes(amount)
+        if downloadCodesLink == None:
+            self.promocodesLink = self.__resolvePromocodesLink()
+            downloadCodesLink = self.__requestPromocodes(amount)
+        if downloadCodesLink == None:
+            raise Exception('Cannot parse promocodes page for ' + self.__str__())
 
         #download promocodes
         logging.info('Downloading promocodes')
-        downloadCodesLink = self._parser.getDownloadCodesLink(postFormResponse.text)
-        codes = self._parser.requests_session.get(ITUNESCONNECT_URL + downloadCodesLink
-                                      , cookies=cookie_jar)
+        if outputFile == None:
+            codes = self._parser.request(downloadCodesLink)
+
+            return codes.text
 
-        return codes.text
+        codes = self._parser.request(downloadCodesLink
+                                      , prefetch=False)
+        with profiler.phase('output'):
+            for chunk in codes.iter_content(8192):
+                with profiler.measure(DISK):
+                    outputFile.write(chunk)
 
 ################## Reviews management ##################
     def _parseDate(self, date):
@@ -573,7 +847,7 @@ class ITCApplication(ITCImageUploader):
 
         return datetime(returnDate.year, returnDate.month, returnDate.day)
 
-    def generateReviews(self, latestVersion=False, date=None, outputFileName=None):
+    def generateReviews(self, latestVersion=False, date=None, outputFileName=None, outputFormat='json'):
         if self._customerReviewsLink == None:
             self.getAppInfo()
         if self._customerReviewsLink == None:
@@ -596,33 +870,35 @@ class ITCApplication(ITCImageUploader):
                     maxDate = minDate
                     minDate = tmpDate
 
-        logging.debug('From: %s' %minDate)
-        logging.debug('To: %s' %maxDate)
-        tree = self._parser.parseTreeForURL(self._customerReviewsLink)
-        metadata = self._parser.getReviewsPageMetadata(tree)
-        if (latestVersion):
-            tree = self._parser.parseTreeForURL(metadata.currentVersion)
-        else:
-            tree = self._parser.parseTreeForURL(metadata.allVersions)
-        tree = self._parser.parseTreeForURL(metadata.allReviews)
-
-        reviews = {}
-        logging.info('Fetching reviews for %d countries. Please wait...' % len(metadata.countries))
-        percentDone = 0
-        percentStep = 100 / len(metadata.countries)
-        totalReviews = 0
-        for countryName, countryId in metadata.countries.items():
-            logging.debug('Fetching reviews for ' + countryName)
-            formData = {metadata.countriesSelectName: countryId}
-            postFormResponse = self._parser.requests_session.post(ITUNESCONNECT_URL + metadata.countryFormSubmitAction, data = formData, cookies=cookie_jar)
-            reviewsForCountry = self._parser.parseReviews(postFormResponse.content, minDate=minDate, maxDate=maxDate)
-            if reviewsForCountry != None and len(reviewsForCountry) != 0:
-                reviews[countryName] = reviewsForCountry
-                totalReviews = totalReviews + len(reviewsForCountry)
-            if not config.options['--silent'] and not config.options['--verbose']:
-                percentDone = percentDone + percentStep
-                print >> sys.stdout, "\r%d%%" %percentDone,
-                sys.stdout.flush()
+        logging.debug('From: %s', minDate)
+        logging.debug('To: %s', maxDate)
+        # selected version and country are kept in the server side session
+        with sessionLock:
+            tree = self._parser.parseTreeForURL(self._customerReviewsLink)
+            metadata = self._parser.getReviewsPageMetadata(tree)
+            if (latestVersion):
+                tree = self._parser.parseTreeForURL(metadata.currentVersion)
+            else:
+                tree = self._parser.parseTreeForURL(metadata.allVersions)
+            tree = self._parser.parseTreeForURL(metadata.allReviews)
+
+            reviews = {}
+            logging.info('Fetching reviews for %d countries. Please wait...', len(metadata.countries))
+            percentDone = 0
+            percentStep = 100 / len(metadata.countries)
+            totalReviews = 0
+            for countryName, countryId in metadata.countries.items():
+                logging.debug('Fetching reviews for %s', countryName)
+                formData = {metadata.countriesSelectName: countryId}
+                postFormResponse = self._parser.request(metadata.countryFormSubmitAction, method="POST", data = formData)
+                reviewsForCountry = self._parser.parseReviews(postFormResponse.content, minDate=minDate, maxDate=maxDate, store=countryName)
+                if reviewsForCountry != None and len(reviewsForCountry) != 0:
+                    reviews[countryName] = reviewsForCountry
+                    totalReviews = totalReviews + len(reviewsForCountry)
+                if not config.options['--silent'] and not config.options['--verbose']:
+                    percentDone = percentDone + percentStep
+                    print >> sys.stdout, "\r%d%%" %percentDone,
+                    sys.stdout.flush()
 
         if not config.options['--silent'] and not config.options['--verbose']:
             print >> sys.stdout, "\rDone\n",
@@ -630,8 +906,15 @@ class ITCApplication(ITCImageUploader):
 
         logging.info("Got %d reviews." % totalReviews)
 
+        if outputFileName and outputFormat == 'columnar':
+            with profiler.phase('output'):
+                writeReviews(outputFileName, reviews)
+            return
+
+        reviews = dict((countryName, [review.dict() for review in reviewsForCountry]) for countryName, reviewsForCountry in reviews.items())
         if outputFileName:
-            with open(outputFileName, 'wb') as fp:
-                json.dump(reviews, fp, sort_keys=False, indent=4, separators=(',', ': '))
+            with profiler.phase('output'), profiler.measure(DISK):
+                with open(outputFileName, 'wb') as fp:
+                    json.dump(reviews, fp, sort_keys=False, indent=4, separators=(',', ': '))
         else:
             print reviews
@@ -0,0 +1,156 @@
+import json
+
+from itc.conf import *
+from itc.util import languages
+from itc.util.assets import prefetchTextAssets
+from itc.util.configuration import ConfigurationCompiler, ConfigurationError, loadConfigurationFile
+from itc.util.scheduler import TaskGraph
+from itc.parsers.baseparser import retryOnSessionExpired
+
+BATCH_COMMANDS = ('update', 'version', 'promo', 'reviews', 'generate')
+
+class ITCBatch(object):
+    """
+    Operations from manifest file, which are run with one logged in server:
+    {"tasks": [{"id": "...", "command": "version", "config file": "app.json", "after": ["..."]}, ...]}
+    Tasks for the same application are run in the order of manifest, tasks for different
+    applications are run concurrently. All the tasks share one server side session, so pages with
+    lightboxes and wizards are opened by one task at a time under sessionLock
+    """
+    def __init__(self, manifestPath):
+        self._server = None
+        self._graph = TaskGraph()
+        self._configs = {}
+
+        with open(manifestPath) as manifestFile:
+            manifest = json.load(manifestFile)
+
+        self.__buildGraph(manifest.get('tasks', []))
+
+
+    def __loadConfiguration(self, path, applicationId, addingVersion):
+        if not path in self._configs:
+            aliases = (ALIASES.language_aliases, ALIASES.device_type_aliases)
+            cfg = loadConfigurationFile(path)
+            if len(self._configs) > 0 and aliases != (ALIASES.language_aliases, ALIASES.device_type_aliases):
+                raise ConfigurationError([path + ': aliases should be the same in all configuration files of a batch'])
+            self._configs[path] = cfg
+
+        cfg = self._configs[path]
+        try:
+            compiledConfig = ConfigurationCompiler(cfg).compile(applicationId=applicationId, addingVersion=addingVersion)
+        except ConfigurationError as e:
+            raise ConfigurationError([path + ': ' + error for error in e.errors])
+
+        prefetchTextAssets(cfg['application'], [languages.langCodeForLanguage(lang) for lang in compiledConfig.langActions])
+
+        return compiledConfig
+
+
+    def __application(self, applicationId):
+        application = self._server.getApplication(applicationId)
+        if application == None:
+            raise Exception('No application with id ' + str(applicationId))
+
+        return application
+
+
+    def __taskFunction(self, taskDict):
+        """
+        Configuration files are validated when manifest is loaded, so nothing is run for invalid manifest
+        """
+        command = taskDict['command']
+        applicationId = taskDict.get('application id')
+        outputFormat = taskDict.get('output format', 'json')
+        if applicationId != None:
+            applicationId = int(applicationId)
+
+        if command in ('update', 'version'):
+            compiledConfig = self.__loadConfiguration(taskDict['config file'], applicationId, command == 'version')
+            applicationId = compiledConfig.applicationId
+
+            if command == 'version':
+                function = lambda: self.__application(applicationId).addVersionWithConfig(compiledConfig)
+            else:
+                def function():
+                    failedInapps = self.__application(applicationId).updateWithConfig(compiledConfig)
+                    if len(failedInapps) > 0:
+                        raise Exception('Failed inapps: ' + ', '.join(failedInapps))
+        elif applicationId == None:
+            raise ConfigurationError(['"application id" is required for ' + command])
+        elif not outputFormat in ('json', 'columnar'):
+            raise ConfigurationError(['"output format" should be json or columnar'])
+        elif command == 'reviews' and outputFormat == 'columnar' and not 'output file' in taskDict:
+            raise ConfigurationError(['"output file" is required for columnar reviews'])
+        elif command == 'promo':
+            def function():
+                application = self.__application(applicationId)
+                if 'output file' in taskDict:
+                    with open(taskDict['output file'], 'a') as outFile:
+                        application.getPromocodes(taskDict['amount'], outFile)
+                else: # just print to console. Using print as we want to suppress silence option
+                    print application.getPromocodes(taskDict['amount'])
+                self._server.savePromocodesLink(application)
+        elif command == 'reviews':
+            function = lambda: self.__application(applicationId).generateReviews(taskDict.get('latest version', False)
+                                                                               , taskDict.get('date range')
+                                                                               , taskDict.get('output file')
+                                                                               , outputFormat=outputFormat)
+        else:
+            function = lambda: self.__application(applicationId).generateConfig(taskDict.get('application version')
+                                                                              , generateInapps=taskDict.get('generate inapps', False)
+                                                                              , outputFormat=outputFormat)
+
+        # tasks resolve their applications when they're run, so they're resolved again if session is expired
+        return applicationId, lambda: retryOnSessionExpired(function)
+
+
+    def __buildGraph(self, tasks):
+        errors = []
+        lastTaskForApplication = {}
+
+        for index, taskDict in enumerate(tasks):
+            taskId = taskDict.get('id', '%d: %s' % (index + 1, taskDict.get('command')))
+            if not taskDict.get('command') in BATCH_COMMANDS:
+                errors.append(taskId + ': command should be one of ' + ', '.join(BATCH_COMMANDS))
+                continue
+
+            try:
+                applicationId, function = self.__taskFunction(taskDict)
+            except ConfigurationError as e:
+                errors.extend(taskId + ': ' + error for error in e.errors)
+                continue
+            except KeyError as e:
+                errors.append(taskId + ': "' + str(e.args[0]) + '" is missing')
+                continue
+            except (IOError, ValueError) as e:
+                errors.append(taskId + ': ' + str(e))
+                continue
+
+            dependencies = list(taskDict.get('after', []))
+            if applicationId in lastTaskForApplication and not lastTaskForApplication[applicationId] in dependencies:
+                dependencies.append(lastTaskForApplication[applicationId])
+
+            try:
+                self._graph.addTask(taskId, function, dependencies)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+
+            lastTaskForApplication[applicationId] = taskId
+
+        if len(errors) > 0:
+            raise ConfigurationError(errors)
+
+
+    def run(self, server):
+        """
+        Runs all the tasks with logged in server. Returns list of failed and skipped tasks
+        """
+        self._server = server
+
+        return self._graph.run()
+
+
+    def report(self):
+        return self._graph.report()
@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import stat
+import socket
+import logging
+
+from itc.conf import *
+
+# commands, which change session or can't be served by already logged in daemon
+LOCAL_COMMANDS = ('daemon', 'login')
+END_OF_OUTPUT = '\0'
+SHORT_OPTIONS_WITH_VALUES = 'uecaomdw'
+
+def _socketFile():
+    """
+    Each user has own socket in the temp directory. Returns None if unix sockets
+    aren't supported, e.g. on Windows, so there's no daemon
+    """
+    if not hasattr(os, 'getuid') or not hasattr(socket, 'AF_UNIX'):
+        return None
+
+    return os.path.join(temp_dir, '.itc-cli-daemon-%d.sock' % os.getuid())
+
+def __isOwnSocket(socketFile):
+    """
+    Socket is in the shared temp directory, so it may be created by another user to receive
+    commands and passwords. Only a socket of the current user is connected to
+    """
+    try:
+        socketStat = os.lstat(socketFile)
+    except OSError:
+        return False
+
+    return stat.S_ISSOCK(socketStat.st_mode) and socketStat.st_uid == os.getuid()
+
+def __connect(socketFile):
+    if not __isOwnSocket(socketFile):
+        return None
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socketFile)
+    except socket.error:
+        connection.close()
+        return None
+
+    return connection
+
+def _withoutPassword(argv):
+    """
+    Removes -p/--password from argv, as daemon is already logged in and password is never sent to it
+    """
+    result = []
+    skipValue = False
+    for index, arg in enumerate(argv):
+        if skipValue:
+            skipValue = False
+        elif arg == '--':
+            result.extend(argv[index:])
+            break
+        elif arg.startswith('--'):
+            name = arg.split('=', 1)[0]
+            if len(name) >= 4 and '--password'.startswith(name): # docopt accepts unique prefixes
+                skipValue = not '=' in arg
+            else:
+                result.append(arg)
+        elif arg.startswith('-') and len(arg) > 1:
+            # short options may be combined: -zpPASSWORD, -zp PASSWORD
+            for position, option in enumerate(arg[1:], 1):
+                if option == 'p':
+                    if position > 1:
+                        result.append(arg[:position])
+                    skipValue = position == len(arg) - 1
+                    break
+                if option in SHORT_OPTIONS_WITH_VALUES:
+                    result.append(arg)
+                    break
+            else:
+                result.append(arg)
+        else:
+            result.append(arg)
+
+    return result
+
+def runInDaemon(argv):
+    """
+    Client side. Sends command to a running daemon and prints its output.
+    Returns exit code of the command or None if there's no daemon or daemon can't run the command,
+    so the command should be run in place
+    """
+    if len(argv) == 0 or argv[0] in LOCAL_COMMANDS:
+        return None
+
+    socketFile = _socketFile()
+    if socketFile == None:
+        return None
+
+    connection = __connect(socketFile)
+    if connection == None:
+        return None
+
+    try:
+        connection.sendall(json.dumps({'argv': _withoutPassword(argv), 'cwd': os.getcwd()}) + '\n')
+
+        received = ''
+        while True:
+            chunk = connection.recv(4096)
+            if not chunk:
+                break
+            if END_OF_OUTPUT in chunk:
+                output, chunk = chunk.split(END_OF_OUTPUT, 1)
+                sys.stdout.write(output)
+                received = chunk
+                while True:
+                    chunk = connection.recv(4096)
+                    if not chunk:
+                        break
+                    received += chunk
+                sys.stdout.flush()
+                return json.loads(received)
+
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+    except (socket.error, ValueError):
+        return None
+    finally:
+        connection.close()
+
+    return None
+
+
+def __parseArguments(argv):
+    """
+    Returns docopt arguments or None if argv is not a valid command
+    """
+    from docopt import docopt, DocoptExit
+    from itc.core import itccli
+
+    if '-h' in argv or '--help' in argv:
+        return None
+    try:
+        return docopt(itccli.__doc__, argv=argv)
+    except (DocoptExit, SystemExit):
+        return None
+
+def __isServable(argv, username):
+    args = __parseArguments(argv)
+    if args == None:
+        return False
+
+    if any(args[command] for command in LOCAL_COMMANDS):
+        return False
+    if args['--no-cookies']:
+        return False
+    if args['--profile'] or args['--memory-report']: # reports should measure the command in this process
+        return False
+    if args['--username'] != None and args['--username'] != username:
+        return False
+
+    return True
+
+def __runCommand(server, argv, cwd, output):
+    """
+    Runs command in place with stdout, stderr and log output redirected to client's connection.
+    Returns exit code
+    """
+    from itc.core import itccli
+    from itc.util.plan import changesPlan
+    from itc.util.logs import backgroundWriter
+
+    savedStreams = sys.stdin, sys.stdout, sys.stderr
+    savedCwd = os.getcwd()
+    rootLogger = logging.getLogger()
+    savedHandlers = rootLogger.handlers[:]
+    savedLevel = rootLogger.level
+
+    # fresh state for each command. Server, its session and on-disk caches are kept
+    server.applications = {}
+    changesPlan.clear()
+    rootLogger.handlers = []
+
+    sys.stdin = open(os.devnull, 'r')
+    sys.stdout = sys.stderr = output
+    exitCode = 0
+    try:
+        os.chdir(cwd)
+        itccli.main(argv=argv, server=server)
+    except SystemExit as e:
+        exitCode = e.code if isinstance(e.code, int) else (0 if e.code == None else 1)
+    except BaseException as e:
+        logging.error('Command failed: ' + str(e))
+        logging.debug('', exc_info=True)
+        exitCode = 1
+    finally:
+        backgroundWriter.flush() # queued records are written to client's connection
+        sys.stdin.close()
+        sys.stdin, sys.stdout, sys.stderr = savedStreams
+        rootLogger.handlers = savedHandlers
+        rootLogger.setLevel(savedLevel)
+        os.chdir(savedCwd)
+
+    return exitCode
+
+def serve(server, username):
+    """
+    Daemon side. Runs commands, sent by clients, one at a time with the logged in server
+    """
+    socketFile = _socketFile()
+    if socketFile == None:
+        raise Exception('Daemon is not supported on this platform')
+
+    connection = __connect(socketFile)
+    if connection != None:
+        connection.close()
+        raise Exception('Daemon is already running: ' + socketFile)
+    if os.path.lexists(socketFile):
+        if not __isOwnSocket(socketFile):
+            raise Exception(socketFile + ' belongs to another user')
+        os.remove(socketFile)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socketFile)
+    os.chmod(socketFile, 0600)
+    listener.listen(5)
+    logging.info('Daemon is listening at ' + socketFile + '. Press Ctrl+C to stop')
+
+    try:
+        while True:
+            connection, address = listener.accept()
+            output = connection.makefile('wb', 0)
+            try:
+                request = json.loads(connection.makefile('rb').readline())
+                argv = request['argv']
+                exitCode = None
+                if __isServable(argv, username):
+                    # there's no terminal to ask for username, command is run for the logged in user
+                    if __parseArguments(argv)['--username'] == None:
+                        argv = argv[:1] + ['-u', username] + argv[1:]
+                    logging.info('Running: ' + argv[0])
+                    exitCode = __runCommand(server, argv, request['cwd'], output)
+                    logging.info('Finished with exit code %d' % exitCode)
+                output.write(END_OF_OUTPUT + json.dumps(exitCode))
+            except (socket.error, ValueError, KeyError) as e:
+                logging.error('Bad request: ' + str(e))
+            finally:
+                output.close()
+                connection.close()
+    except KeyboardInterrupt:
+        logging.info('Daemon stopped')
+    finally:
+        listener.close()
+        if os.path.exists(socketFile):
+            os.remove(socketFile)
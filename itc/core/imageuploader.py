@@ -7,14 +7,18 @@ import logging
 import requests
 
 from itc.util import EnhancedFile
+from itc.util.profiling import profiledPhase
 from itc.conf import *
 
 class ITCImageUploader(object):
     _uploadSessionData = None
+    _uploadSessionId = None
     _images = None
-    def __init__(self):
+    def __init__(self, parser=None):
         self._uploadSessionData = {}
         self._images = {}
+        if parser != None:
+            self._parser = parser
 
     def parseURLSFromScript(self, script):
         matches = re.search('{.*statusURL:\s\'([^\']+)\',\sdeleteURL:\s\'([^\']+)\',\ssortURL:\s\'([^\']+)\'', script) 
@@ -26,6 +30,7 @@ class ITCImageUploader(object):
         matches = re.search('{.*statusURL:\s\'([^\']+)\'', script) 
         return {'statusURL': matches.group(1)}
 
+    @profiledPhase('screenshots')
     def imagesForDevice(self, device_type):
         if len(self._uploadSessionData) == 0:
             raise 'No session keys found'
@@ -36,8 +41,7 @@ class ITCImageUploader(object):
         if statusURL:
             attempts = 3
             while attempts > 0 and result == None:
-                status = self._parser.requests_session.get(ITUNESCONNECT_URL + statusURL
-                                      , cookies=cookie_jar)
+                status = self._parser.request(statusURL)
                 statusJSON = None
                 try:
                     statusJSON = json.loads(status.content)
@@ -46,7 +50,7 @@ class ITCImageUploader(object):
                     attempts -= 1
                     continue
 
-                logging.debug(status.content)
+                logging.debug('Screenshots status: %s', status.content)
                 result = []
 
                 for i in range(0, 5):
@@ -64,6 +68,7 @@ class ITCImageUploader(object):
         return result
 
 
+    @profiledPhase('screenshots')
     def uploadScreenshot(self, upload_type, file_path):
         if self._uploadSessionId == None or len(self._uploadSessionData) == 0:
             raise 'Trying to upload screenshot without proper session keys'
@@ -77,10 +82,10 @@ class ITCImageUploader(object):
                         , 'x-original-filename' : os.path.basename(file_path)
                         , 'Content-Type': 'image/png'}
             logging.info('Uploading image ' + file_path)
-            r = self._parser.requests_session.post(ITUNESCONNECT_URL + uploadScreenshotAction
-                                , cookies=cookie_jar
-                                , headers=headers
-                                , data=EnhancedFile(file_path, 'rb'))
+            with EnhancedFile(file_path, 'rb') as imageFile:
+                r = self._parser.request(uploadScreenshotAction, method="POST"
+                                    , headers=headers
+                                    , data=imageFile)
 
             if r.content == 'success':
                 newImages = self.imagesForDevice(upload_type)
@@ -90,18 +95,19 @@ class ITCImageUploader(object):
                     logging.error('Upload failed: ' + file_path)
 
 
+    @profiledPhase('screenshots')
     def deleteScreenshot(self, type, screenshot_id):
         if len(self._uploadSessionData) == 0:
             raise 'Trying to delete screenshot without proper session keys'
 
         deleteScreenshotAction = self._uploadSessionData[type]['deleteURL']
         if deleteScreenshotAction != None:
-            self._parser.requests_session.get(ITUNESCONNECT_URL + deleteScreenshotAction + "?pictureId=" + screenshot_id
-                    , cookies=cookie_jar)
+            self._parser.request(deleteScreenshotAction + "?pictureId=" + screenshot_id)
 
             # TODO: check status
 
 
+    @profiledPhase('screenshots')
     def sortScreenshots(self, type, newScreenshotsIndexes):
         if len(self._uploadSessionData) == 0:
             raise 'Trying to sort screenshots without proper session keys'
@@ -109,8 +115,7 @@ class ITCImageUploader(object):
         sortScreenshotsAction = self._uploadSessionData[type]['sortURL']
 
         if sortScreenshotsAction != None:
-            self._parser.requests_session.get(ITUNESCONNECT_URL + sortScreenshotsAction 
-                                    + "?sortedIDs=" + (",".join(newScreenshotsIndexes))
-                            , cookies=cookie_jar)
+            self._parser.request(sortScreenshotsAction 
+                                    + "?sortedIDs=" + (",".join(newScreenshotsIndexes)))
 
             # TODO: check status
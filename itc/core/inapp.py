@@ -4,14 +4,21 @@ import logging
 import requests
 
 from itc.parsers.inappparser import ITCInappParser
+from itc.parsers.baseparser import SessionExpiredError, sessionLock
 from itc.util import EnhancedFile
 from itc.util import languages
+from itc.util.plan import changesPlan, isPlanning
 from itc.conf import *
 
 class ITCInappPurchase(object):
-    createInappLink = None
-    actionURLs = None
+    """
+    Inapps are kept in slots and share one parser, as an application may have thousands of them
+    """
+    __slots__ = ('name', 'numericId', 'productId', 'appleId', 'type', 'reviewNotes', 'clearedForSale', 'priceTier'
+                 , 'hostingContentWithApple', 'manageLink', '_uploadScreenshotAction', '_uploadScreenshotKey'
+                 , '_uploadSessionId', '_statusURL')
     supportedIAPTypes = ['Consumable', 'Non-Consumable', 'Free Subscription', 'Non-Renewing Subscription']
+    _parser = ITCInappParser()
 
     def __init__(self, name=None, numericId=None, productId=None, iaptype=None, manageLink=None, appleId=None):
         self.name = name
@@ -21,14 +28,13 @@ class ITCInappPurchase(object):
         self.type = iaptype
         self.reviewNotes = None
         self.clearedForSale = False
+        self.priceTier = None
         self.hostingContentWithApple = False
         self.manageLink = manageLink
-        self._parser = ITCInappParser()
-
-        logging.info('Inapp found: ' + self.__str__())
-        logging.debug('productId: ' + (self.productId if self.productId != None else ""))
-        logging.debug('type: ' + (self.type if self.type != None else ""))
-        logging.debug('manage link: ' + (self.manageLink if self.manageLink != None else ""))
+        self._uploadScreenshotAction = None
+        self._uploadScreenshotKey = None
+        self._uploadSessionId = None
+        self._statusURL = None
 
 
     def __repr__(self):
@@ -54,10 +60,10 @@ class ITCInappPurchase(object):
                         , 'x-original-filename' : os.path.basename(file_path)
                         , 'Content-Type': 'image/png'}
             logging.info('Uploading image ' + file_path)
-            r = self._parser.requests_session.post(ITUNESCONNECT_URL + self._uploadScreenshotAction
-                                , cookies=cookie_jar
-                                , headers=headers
-                                , data=EnhancedFile(file_path, 'rb'))
+            with EnhancedFile(file_path, 'rb') as imageFile:
+                r = self._parser.request(self._uploadScreenshotAction, method="POST"
+                                    , headers=headers
+                                    , data=imageFile)
 
             if r.content == 'success':
                 # newImages = self.__imagesForDevice(upload_type)
@@ -93,18 +99,51 @@ class ITCInappPurchase(object):
         langFormData[descriptionElementName] = langVal['description']
         langFormData['save'] = "true"
 
-        postFormResponse = self._parser.requests_session.post(ITUNESCONNECT_URL + localizationSaveAction, data = langFormData, cookies=cookie_jar)
+        postFormResponse = self._parser.request(localizationSaveAction, method="POST", data = langFormData)
 
         if postFormResponse.status_code != 200:
-            raise 'Wrong response from iTunesConnect. Status code: ' + str(postFormResponse.status_code)
+            raise Exception('Wrong response from iTunesConnect. Status code: ' + str(postFormResponse.status_code))
 
         if len(postFormResponse.text) > 0:
-            logging.error("Save information failed. " + postFormResponse.text)
-
-
-    def generateConfig(self):
-        tree = self._parser.parseTreeForURL(ITCInappPurchase.actionURLs['itemActionUrl'] + "?itemID=" + self.numericId)
-        metadata = self._parser.metadataForInappPurchase(tree)
+            raise Exception("Save information failed. " + postFormResponse.text)
+
+
+    def __saveLocalizations(self, localizations):
+        """
+        Saves localizations one by one. Each item is a tuple (langId, langVal, localizationTree, lightboxURL).
+        If localizationTree is None, a new localization is added using lightbox at lightboxURL.
+        Lightboxes are kept in the server side session, which is shared by all the threads, so they
+        can't be opened concurrently, and callers hold sessionLock. Errors don't stop other languages
+        from being saved, they are returned as a dictionary {langId: error}
+        """
+        errors = {}
+        for langId, langVal, localizationTree, lightboxURL in localizations:
+            try:
+                isEdit = localizationTree != None
+                if not isEdit:
+                    localizationTree = self._parser.parseTreeForURL(lightboxURL)
+                self.__createUpdateLanguage(localizationTree, langId, langVal, isEdit=isEdit)
+            except SessionExpiredError:
+                raise
+            except Exception as e:
+                logging.error('Inapp %s, language %s: %s', self.productId, langId, unicode(e))
+                errors[langId] = unicode(e)
+
+        return errors
+
+
+    @property
+    def itemURL(self):
+        """
+        Item page link, built by the application from its own action URLs
+        """
+        return self.manageLink
+
+    def generateConfig(self, metadata=None):
+        if metadata == None:
+            with sessionLock:
+                tree = self._parser.parseTreeForURL(self.itemURL)
+                metadata = self._parser.metadataForInappPurchase(tree)
 
         inappDict = {"id": metadata.numericid, "_id": metadata.textid, "type": self.type
                     , "reference name": metadata.refname
@@ -117,25 +156,25 @@ class ITCInappPurchase(object):
         return inappDict
 
     def update(self, inappDict):
-        tree = self._parser.parseTreeForURL(ITCInappPurchase.actionURLs['itemActionUrl'] + "?itemID=" + self.numericId)
-
-        # for non-consumable iap we can change name, cleared-for-sale and pricing. Check if we need to:
-        inappReferenceName = tree.xpath('//span[@id="iapReferenceNameUpdateContainer"]//span/text()')[0]
-        clearedForSaleText = tree.xpath('//div[contains(@class,"cleared-for-sale")]//span/text()')[0]
-        clearedForSale = False
-        if clearedForSaleText == 'Yes':
-            clearedForSale = True
+        tree = self._parser.parseTreeForURL(self.itemURL)
+        metadata = self._parser.parseInappPage(tree)
+        skippedRequests = 0
+        unchanged = []
+        planning = isPlanning()
+        scope = 'Inapp ' + self.productId
 
-        logging.debug('Updating inapp: ' + inappDict.__str__())
+        logging.debug('Updating inapp: %s', inappDict)
 
-        self.name = inappDict.get('name', self.name)
+        self.name = inappDict.get('reference name', self.name)
         self.clearedForSale = inappDict.get('cleared', self.clearedForSale)
         self.hostingContentWithApple = inappDict.get('hosting content with apple', self.hostingContentWithApple)
-        self.reviewNotes = inappDict.get('review notes', self.reviewNotes)
+        self.reviewNotes = inappDict.get('review notes', metadata.reviewnotes)
 
+        # for non-consumable iap we can change name, cleared-for-sale and pricing. Check if we need to:
         # TODO: change price tier
-        if (inappReferenceName != self.name) \
-            or (clearedForSale != self.clearedForSale):
+        pricingChanged = changesPlan.addDifferences(scope, {'reference name': metadata.refname, 'cleared': metadata.cleared}
+                                                         , {'reference name': self.name, 'cleared': self.clearedForSale})
+        if pricingChanged and not planning:
             editAction = tree.xpath('//div[@id="singleAddonPricingLightbox"]/@action')[0]
 
             inappTree = self._parser.parseTreeForURL(editAction)
@@ -161,76 +200,107 @@ class ITCInappPurchase(object):
                 formData[dcn] = 'WONoSelectionString'
             formData['save'] = "true"
 
-            postFormResponse = self._parser.requests_session.post(ITUNESCONNECT_URL + postAction, data = formData, cookies=cookie_jar)
+            postFormResponse = self._parser.request(postAction, method="POST", data = formData)
 
             if postFormResponse.status_code != 200:
                 raise 'Wrong response from iTunesConnect. Status code: ' + str(postFormResponse.status_code)
+        elif not pricingChanged:
+            skippedRequests += 2
+            unchanged.append('reference name')
 
-
-        idAddon = "autoRenewableL" if (inapptype == "Free Subscription") else "l"
-        languagesSpan = inappTree.xpath('//span[@id="0' + idAddon + 'ocalizationListListRefreshContainerId"]')[0]
-        activatedLanguages = languagesSpan.xpath('.//li[starts-with(@id, "0' + idAddon + 'ocalizationListRow")]/div[starts-with(@class, "ajaxListRowDiv")]/@itemid')
-        activatedLangsIds = [languages.langCodeForLanguage(lang) for lang in activatedLanguages]
-        languageAction = tree.xpath('//div[@id="0' + idAddon + 'ocalizationListLightbox"]/@action')[0]
-
-        logging.info('Activated languages for inapp ' + self.numericId + ': ' + ', '.join(activatedLanguages))
-        logging.debug('Activated languages ids: ' + ', '.join(activatedLangsIds))
+        localizationURLs = dict(metadata.localizationURLs)
+        activatedLangsIds = [langId for langId, url in metadata.localizationURLs]
+        logging.info('Activated languages for inapp ' + self.numericId + ': ' + ', '.join(activatedLangsIds))
 
         langDict = inappDict.get('languages', {})
+        addedLocalizations = []
+        errors = {}
         for langId, langVal in langDict.items():
-            if type(langVal) is str:
+            if isinstance(langVal, basestring):
                 if langId in activatedLangsIds and langVal == 'd': # TODO: delete lang
                     pass
-                return
-            
-            languageParamStr = ""
-            isEdit = False
-
-            if langId in activatedLangsIds: # edit
-                languageParamStr = "&itemID=" + languages.appleLangIdForLanguage(langId)
-                isEdit = True
-
-            localizationTree = self._parser.parseTreeForURL(languageAction + "?open=true" + languageParamStr)
-            self.__createUpdateLanguage(localizationTree, langId, langVal, isEdit=isEdit)
+                continue
+
+            if langId in localizationURLs: # edit
+                # lightbox is opened, compared and saved at once: opening another lightbox in the same
+                # session makes the state of this one stale on the server side
+                localizationTree = self._parser.parseTreeForURL(localizationURLs[langId])
+                currentLocalization = self._parser.parseInappLocalization(localizationTree)
+                newLocalization = dict((key, langVal.get(key, value)) for key, value in currentLocalization.items())
+                if not changesPlan.addDifferences(scope + ' / ' + langId, currentLocalization, newLocalization):
+                    skippedRequests += 1
+                    unchanged.append(langId)
+                    continue
+
+                if not planning:
+                    errors.update(self.__saveLocalizations([(langId, langVal, localizationTree, None)]))
+            else:
+                changesPlan.addAction(scope + ' / ' + langId, 'add localization')
+                addedLocalizations.append((langId, langVal, None, metadata.localizationAction + "?open=true"))
+
+        if not planning:
+            errors.update(self.__saveLocalizations(addedLocalizations))
 
         # upload screenshot, edit review notes, hosting content with apple, etc
-        formData = {"save":"true"}
-        editHostedContentAction = tree.xpath('//div[@id="versionLightboxId0"]/@action')[0]
-        hostedContentTree = self._parser.parseTreeForURL(editHostedContentAction + "?open=true")
-        saveEditHostedContentAction = hostedContentTree.xpath('//div[@class="lcAjaxLightboxContents"]/@action')[0]
-
-        if (self.type == "Non-Consumable"):
-            hostingContentName = hostedContentTree.xpath('//div[contains(@class,"hosting-on-apple")]//input[@classname="radioTrue"]/@name')[0]
-            hostingContentNames = {}
-            hostingContentNames["true"] = hostedContentTree.xpath('//div[contains(@class,"hosting-on-apple")]//input[@classname="radioTrue"]/@value')[0]
-            hostingContentNames["false"] = hostedContentTree.xpath('//div[contains(@class,"hosting-on-apple")]//input[@classname="radioFalse"]/@value')[0]
-            formData[hostingContentName] = hostingContentNames["true" if self.hostingContentWithApple else "false"]
-
-        if inappDict['review screenshot'] != None:
-            uploadForm = hostedContentTree.xpath('//form[@name="FileUploadForm__screenshotId"]')[0]
-            self._uploadScreenshotAction = uploadForm.xpath('./@action')[0]
-            self._uploadSessionId = uploadForm.xpath('.//input[@id="uploadSessionID"]/@value')[0]
-            self._uploadScreenshotKey = uploadForm.xpath('.//input[@id="uploadKey"]/@value')[0]
-            statusURLScript = hostedContentTree.xpath('//script[contains(., "var uploader_screenshotId")]/text()')[0]
-            matches = re.findall('statusURL:\s\'([^\']+)\'', statusURLScript)
-            self._statusURL = matches[0]
-            self.__uploadScreenshot(inappDict['review screenshot'])
-            self._parser.requests_session.get(ITUNESCONNECT_URL + self._statusURL, cookies=cookie_jar)
-
-            formData["uploadSessionID"] = self._uploadSessionId
-            formData["uploadKey"] = self._uploadScreenshotKey
-            formData["filename"] = inappDict['review screenshot']
-
- 
-        reviewNotesName = hostedContentTree.xpath('//div[@class="hosted-review-notes"]//textarea/@name')[0]
-        formData[reviewNotesName] = self.reviewNotes
-        self._parser.parseTreeForURL(saveEditHostedContentAction, method="POST", payload=formData)
-
-
-    def create(self, langDict, screenshot=None):
-        logging.debug('Creating inapp: ' + langDict.__str__())
-
-        tree = self._parser.parseTreeForURL(ITCInappPurchase.createInappLink)
+        screenshot = inappDict.get('review screenshot')
+        currentReviewInfo = {'review notes': metadata.reviewnotes}
+        newReviewInfo = {'review notes': self.reviewNotes}
+        if self.type == "Non-Consumable":
+            currentReviewInfo['hosting content with apple'] = metadata.hosted
+            newReviewInfo['hosting content with apple'] = self.hostingContentWithApple
+        reviewInfoChanged = changesPlan.addDifferences(scope, currentReviewInfo, newReviewInfo)
+        if screenshot != None: # there's no way to compare screenshots, so it's always uploaded
+            changesPlan.addAction(scope, 'upload review screenshot ' + screenshot)
+            reviewInfoChanged = True
+
+        if reviewInfoChanged and not planning:
+            formData = {"save":"true"}
+            editHostedContentAction = tree.xpath('//div[@id="versionLightboxId0"]/@action')[0]
+            hostedContentTree = self._parser.parseTreeForURL(editHostedContentAction + "?open=true")
+            saveEditHostedContentAction = hostedContentTree.xpath('//div[@class="lcAjaxLightboxContents"]/@action')[0]
+
+            if (self.type == "Non-Consumable"):
+                hostingContentName = hostedContentTree.xpath('//div[contains(@class,"hosting-on-apple")]//input[@classname="radioTrue"]/@name')[0]
+                hostingContentNames = {}
+                hostingContentNames["true"] = hostedContentTree.xpath('//div[contains(@class,"hosting-on-apple")]//input[@classname="radioTrue"]/@value')[0]
+                hostingContentNames["false"] = hostedContentTree.xpath('//div[contains(@class,"hosting-on-apple")]//input[@classname="radioFalse"]/@value')[0]
+                formData[hostingContentName] = hostingContentNames["true" if self.hostingContentWithApple else "false"]
+
+            if screenshot != None:
+                uploadForm = hostedContentTree.xpath('//form[@name="FileUploadForm__screenshotId"]')[0]
+                self._uploadScreenshotAction = uploadForm.xpath('./@action')[0]
+                self._uploadSessionId = uploadForm.xpath('.//input[@id="uploadSessionID"]/@value')[0]
+                self._uploadScreenshotKey = uploadForm.xpath('.//input[@id="uploadKey"]/@value')[0]
+                statusURLScript = hostedContentTree.xpath('//script[contains(., "var uploader_screenshotId")]/text()')[0]
+                matches = re.findall('statusURL:\s\'([^\']+)\'', statusURLScript)
+                self._statusURL = matches[0]
+                self.__uploadScreenshot(screenshot)
+                self._parser.request(self._statusURL)
+
+                formData["uploadSessionID"] = self._uploadSessionId
+                formData["uploadKey"] = self._uploadScreenshotKey
+                formData["filename"] = screenshot
+
+            reviewNotesName = hostedContentTree.xpath('//div[@class="hosted-review-notes"]//textarea/@name')[0]
+            formData[reviewNotesName] = self.reviewNotes
+            self._parser.parseTreeForURL(saveEditHostedContentAction, method="POST", payload=formData)
+        elif not reviewInfoChanged:
+            skippedRequests += 2
+            unchanged.append('review information')
+
+        if not planning:
+            logging.info('Inapp %s: %d requests skipped. Unchanged: %s' % (self.productId, skippedRequests, ', '.join(unchanged) if len(unchanged) > 0 else 'nothing'))
+
+        return errors
+
+
+    def create(self, createInappLink, langDict, screenshot=None):
+        """
+        createInappLink is the link of application's inapps page, inapp is created for
+        """
+        logging.debug('Creating inapp: %s', langDict)
+
+        tree = self._parser.parseTreeForURL(createInappLink)
 
         inapptype = self.type
         newInappLink = tree.xpath('//form[@name="mainForm"]/@action')[0]
@@ -239,11 +309,6 @@ class ITCInappPurchase(object):
         formData = {formKeyName + '.x': 46, formKeyName + '.y': 10}
         inappTree = self._parser.parseTreeForURL(newInappLink, method="POST", payload=formData)
 
-        if ITCInappPurchase.actionURLs == None:
-            inappsActionScript = inappTree.xpath('//script[contains(., "var arguments")]/text()')[0]
-            matches = re.findall('\'([^\']+)\'\s:\s\'([^\']+)\'', inappsActionScript)
-            ITCInappPurchase.actionURLs = dict((k, v) for k, v in matches if k.endswith('Url'))
-
         formData = {}
 
         inappReferenceNameName = inappTree.xpath('//span[@id="iapReferenceNameUpdateContainer"]//input/@name')[0]
@@ -271,10 +336,8 @@ class ITCInappPurchase(object):
         else:
             localizationLightboxAction = inappTree.xpath('//div[@id="localizationListLightbox"]/@action')[0]
 
-        for langId, langVal in langDict.items():
-            localizationTree = self._parser.parseTreeForURL(localizationLightboxAction + "?open=true")
-
-            self.__createUpdateLanguage(localizationTree, langId, langVal)
+        errors = self.__saveLocalizations([(langId, langVal, None, localizationLightboxAction + "?open=true")
+                                                for langId, langVal in langDict.items()])
 
         if screenshot != None:
             uploadForm = inappTree.xpath('//form[@name="FileUploadForm__screenshotId"]')[0]
@@ -285,7 +348,7 @@ class ITCInappPurchase(object):
             matches = re.findall('statusURL:\s\'([^\']+)\'', statusURLScript)
             self._statusURL = matches[0]
             self.__uploadScreenshot(screenshot)
-            self._parser.requests_session.get(ITUNESCONNECT_URL + self._statusURL, cookies=cookie_jar)
+            self._parser.request(self._statusURL)
 
             formData["uploadSessionID"] = self._uploadSessionId
             formData["uploadKey"] = self._uploadScreenshotKey
@@ -305,3 +368,5 @@ class ITCInappPurchase(object):
         if len(errorDiv) > 0:
             logging.error("Save information failed. " + errorDiv[0].xpath('.//span/text()')[0])
 
+        return errors
+
@@ -1,13 +1,15 @@
 """Command line interface for iTunesConnect (https://github.com/kovpas/itc.cli)
 
 Usage: 
-    itc login [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s]
-    itc update -c FILE [-a APP_ID] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s]
-    itc version -c FILE [-a APP_ID] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s]
-    itc create -c FILE [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s]
-    itc generate [-a APP_ID] [-e APP_VER] [-i] [-c FILE] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s]
-    itc promo -a APP_ID [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [-o FILE] <amount>
-    itc reviews -a APP_ID [-d DATE] [-l] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [-o FILE]
+    itc login [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [--profile OUT] [--memory-report] [--dump-bodies DIR [--dump-sample N]]
+    itc update -c FILE [-a APP_ID] [--plan | --apply] [-w WORKERS] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [--profile OUT] [--memory-report] [--dump-bodies DIR [--dump-sample N]]
+    itc version -c FILE [-a APP_ID] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [--profile OUT] [--memory-report] [--dump-bodies DIR [--dump-sample N]]
+    itc create -c FILE [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [--profile OUT] [--memory-report] [--dump-bodies DIR [--dump-sample N]]
+    itc generate [-a APP_ID] [-e APP_VER] [-i] [-c FILE] [--output-format FORMAT] [-w WORKERS] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [--profile OUT] [--memory-report] [--dump-bodies DIR [--dump-sample N]]
+    itc promo [-a APP_ID] [-w WORKERS] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [--profile OUT] [--memory-report] [--dump-bodies DIR [--dump-sample N]] [-o FILE] <amount>...
+    itc reviews -a APP_ID [-d DATE] [-l] [--output-format FORMAT] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [--profile OUT] [--memory-report] [--dump-bodies DIR [--dump-sample N]] [-o FILE]
+    itc batch -m FILE [-w WORKERS] [-n] [-u USERNAME] [-p PASSWORD] [-z] [-v | -vv [-f] | -s] [--profile OUT] [--memory-report] [--dump-bodies DIR [--dump-sample N]]
+    itc daemon [-n] [-u USERNAME] [-p PASSWORD] [-z] [-w WORKERS] [-v | -vv [-f] | -s]
     itc (-h | --help)
 
 Commands:
@@ -17,8 +19,12 @@ Commands:
   generate                    Generate configuration file for a specified application id and version.
                                 If no --application-id provided, configuration files for all 
                                 applications will be created.
-  promo                       Download specified <amount> of promocodes.
+  promo                       Download specified <amount> of promocodes. To get promocodes for several
+                                applications at once, use APP_ID:AMOUNT pairs instead of <amount>.
   reviews                     Get reviews for a specified application.
+  batch                       Run operations for several applications from a manifest file with one session.
+  daemon                      Keep logged in session and caches in memory and serve other itc commands
+                                of the same user over a unix socket until interrupted.
 
 Options:
   -h --help                   Print help (this message) and exit.
@@ -37,10 +43,30 @@ Options:
                                 in configuration file.
   -n --no-cookies             Remove saved authentication cookies and authenticate again.
   -z                          Automatically click 'Continue' button if appears after login.
-  -o --output-file FILE       Name of file to save promocodes or reviews to.
+  -o --output-file FILE       Name of file to save promocodes or reviews to. For promocodes of several
+                                applications, {application_id} in the name is replaced with application id,
+                                otherwise application id is prepended to the file name.
+  -m --manifest FILE          Batch manifest file. For more details on format see https://github.com/kovpas/itc.cli.
   -d --date-range DATERANGE   Get reviews specified with this date range. Format [date][-][date].
                                 For more information, please, refer to https://github.com/kovpas/itc.cli.
   -l --latest-version         Get reviews for current version only.
+  --output-format FORMAT      Format of reviews file and generated inapps: json or columnar. Columnar files are
+                                compact binary files for analytics, see itc.util.columnar. With columnar format,
+                                inapps are also written to APP_ID.inapps.itcc catalog, which keeps only ids, name,
+                                type, price tier and cleared for sale. Configuration file still has all the fields.
+                                [default: json]
+  -w --workers WORKERS        Number of concurrent requests to iTunesConnect. Default is 8.
+  --plan                      Compare configuration file with current state and print the changes
+                                without applying them.
+  --apply                     Submit only the changes found by comparing configuration file with
+                                current state.
+  --profile OUT               Save profile of the command to OUT (pstats format) and time of network requests,
+                                html parsing, xpath and disk I/O for each phase of the command to OUT.phases.txt.
+  --memory-report             Print peak memory, live objects, growing types and lxml trees retained by each
+                                application at the end of each phase of the command.
+  --dump-bodies DIR           Save bodies of iTunesConnect responses to numbered files in DIR instead of
+                                printing them with -vv.
+  --dump-sample N             Save only each N-th response body. Default is 1.
 
 """
 
@@ -48,262 +74,379 @@ import os
 import logging
 import platform
 import sys
-import json
 import getpass
-from copy import deepcopy 
+import time
 
-from itc.core.server import ITCServer
-from itc.util import *
+from itc.core import daemon
 from itc.conf import *
 from docopt import docopt
 
 options = None
 config = {}
+OUTPUT_FORMATS = ('json', 'columnar')
 
-def __parse_options():
-    args = docopt(__doc__)
+def __parse_options(argv=None):
+    args = docopt(__doc__, argv=argv)
     conf.config.options = args
     globals()['options'] = args
     log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
+    # imported after arguments are validated, as itc.util imports multiprocessing
+    from itc.util.logs import configureLogging, bodyDumper
+
     if args['--verbose']:
-        logging.basicConfig(level=logging.DEBUG, format=log_format)
+        configureLogging(logging.DEBUG, log_format)
     elif not args['--silent']:
         requests_log = logging.getLogger('requests')
         requests_log.setLevel(logging.WARNING)
         
-        logging.basicConfig(level=logging.INFO, format=log_format)
+        configureLogging(logging.INFO, log_format)
     else:
         requests_log = logging.getLogger('requests')
         requests_log.setLevel(logging.ERROR)
         
-        logging.basicConfig(level=logging.ERROR, format=log_format)
+        configureLogging(logging.ERROR, log_format)
+
+    # always configured, as daemon runs commands with and without dumps in one process
+    try:
+        bodyDumper.configure(args['--dump-bodies'], int(args['--dump-sample'] or 1))
+    except ValueError:
+        logging.error('--dump-sample should be a positive number')
+        sys.exit(1)
 
     return args
 
-def __parse_configuration_file():
-    if options['--config-file'] != None:
-        with open(options['--config-file']) as config_file:
-            globals()['config'] = json.load(config_file)
-        ALIASES.language_aliases = globals()['config'].get('config', {}) \
-                                .get('language aliases', {})
-        ALIASES.device_type_aliases = globals()['config'].get('config', {}) \
-                                .get('device type aliases', {})
+def __import_core():
+    """
+    Core modules import requests, html5lib and lxml, so they are imported only after
+    arguments are validated: --help and usage errors don't wait for them
+    """
+    global ITCServer, ITCBatch, languages, ConfigurationCompiler, ConfigurationError, loadConfigurationFile
+    global changesPlan, parallelMap, prefetchTextAssets, sessionStore, profiler, memoryReport, backgroundWriter
+    global retryOnSessionExpired
+
+    from itc.core.server import ITCServer
+    from itc.core.batch import ITCBatch
+    from itc.util import languages
+    from itc.util.configuration import ConfigurationCompiler, ConfigurationError, loadConfigurationFile
+    from itc.util.plan import changesPlan
+    from itc.util.pool import parallelMap
+    from itc.util.assets import prefetchTextAssets
+    from itc.util.sessionstore import sessionStore
+    from itc.util.profiling import profiler
+    from itc.util.memory import memoryReport
+    from itc.util.logs import backgroundWriter
+    from itc.parsers.baseparser import retryOnSessionExpired
+
+def __parse_promo_amounts():
+    """
+    Returns list of (application id, amount) for <amount> arguments: either AMOUNT
+    for --application-id or APP_ID:AMOUNT
+    """
+    promoRequests = []
+    for amount in options['<amount>']:
+        applicationId = options['--application-id']
+        if ':' in amount:
+            applicationId, amount = amount.split(':', 1)
+        if applicationId == None:
+            raise ValueError('Provide application id for ' + amount + ' (--application-id or -a option or APP_ID:AMOUNT)')
+
+        promoRequests.append((int(applicationId), int(amount)))
+
+    return promoRequests
+
+
+def __promo_output_file(applicationId, severalApplications):
+    fileName = options['--output-file']
+    if fileName == None:
+        return None
+
+    if '{application_id}' in fileName:
+        return fileName.replace('{application_id}', str(applicationId))
+    if severalApplications:
+        directory, fileName = os.path.split(fileName)
+        return os.path.join(directory, str(applicationId) + ' ' + fileName)
+
+    return fileName
+
+
+def __get_promocodes(server, promoRequests):
+    """
+    Requests promocodes for several applications concurrently. Wizards of the applications share
+    the server side session, so they're run one at a time, while links are resolved and codes are
+    downloaded concurrently. Codes are streamed to output files or printed to console.
+    Returns list of failed application ids
+    """
+    severalApplications = len(set(applicationId for applicationId, amount in promoRequests)) > 1
+
+    def getPromocodesForApplication(applicationId, amount):
+        application = server.getApplication(applicationId)
+        if application == None:
+            raise Exception('No application with id ' + str(applicationId))
+
+        promocodes = None
+        outputFileName = __promo_output_file(applicationId, severalApplications)
+        if outputFileName != None:
+            with open(outputFileName, 'a') as outFile:
+                application.getPromocodes(amount, outFile)
+        else:
+            promocodes = application.getPromocodes(amount)
 
-    return globals()['config']
+        server.savePromocodesLink(application)
+
+        return promocodes
+
+    def getPromocodes(promoRequest):
+        applicationId, amount = promoRequest
+        startTime = time.time()
+        try:
+            promocodes = retryOnSessionExpired(getPromocodesForApplication, applicationId, amount)
+        except Exception as e:
+            logging.error('Failed to get promocodes for ' + str(applicationId) + ': ' + str(e))
+            logging.debug('', exc_info=True)
+            return False, None
+
+        logging.info('Got %d promocodes for %d in %.1fs' % (amount, applicationId, time.time() - startTime))
+        return True, promocodes
+
+    results = parallelMap(getPromocodes, promoRequests)
+    for (applicationId, amount), (succeeded, promocodes) in zip(promoRequests, results):
+        if promocodes != None: # just print to console. Using print as we want to suppress silence option
+            if severalApplications:
+                print '# ' + str(applicationId)
+            print promocodes
+
+    return [applicationId for (applicationId, amount), (succeeded, promocodes) in zip(promoRequests, results) if not succeeded]
 
 
-def flattenDictIndexes(dict):
-    for indexKey, val in dict.items():
-        if "-" in indexKey:
-            startIndex, endIndex = indexKey.split("-")
-            for i in range(int(startIndex), int(endIndex) + 1):
-                dict[i] = val
-            del dict[indexKey]
-        else: 
-            try:
-                dict[int(indexKey)] = val
-                del dict[indexKey]
-            except:
-                pass
+def __parse_configuration_file():
+    if options['--config-file'] != None:
+        globals()['config'] = loadConfigurationFile(options['--config-file'])
 
-    return dict
+    return globals()['config']
 
 
-def main():
+def __generate_config(server, application):
+    # if session is expired, application is resolved again in the new one
+    def generateConfig(applicationId):
+        server.getApplication(applicationId).generateConfig(options['--application-version']
+                                                          , generateInapps = options['--generate-config-inapp']
+                                                          , outputFormat = options['--output-format'])
+
+    startTime = time.time()
+    try:
+        retryOnSessionExpired(generateConfig, application.applicationId)
+    except Exception as e:
+        logging.error('Failed to generate config for ' + str(application) + ' in %.1fs: %s' % (time.time() - startTime, e))
+        logging.debug('', exc_info=True)
+        return False
+
+    logging.info('Generated config for ' + str(application) + ' in %.1fs' % (time.time() - startTime))
+    return True
+
+
+def __generate_configs(server, applications):
+    """
+    Generates configs for several applications concurrently, one application per pool worker.
+    Requests of each application are made one by one in its worker, as parallelMap runs in place
+    inside a worker. Pages with lightboxes (version localizations, inapp localizations) are opened
+    under sessionLock, as all the workers share one server side session, so only the rest of the
+    requests are concurrent. Failure of one application doesn't stop the others. Returns list
+    of failed applications
+    """
+    applications = [application for applicationId, application in sorted(applications.items())]
+    startTime = time.time()
+    results = parallelMap(lambda application: __generate_config(server, application), applications)
+    failed = [application for application, succeeded in zip(applications, results) if not succeeded]
+
+    logging.info('Generated %d of %d configs in %.1fs' % (len(applications) - len(failed), len(applications), time.time() - startTime))
+    if len(failed) > 0:
+        logging.error('Failed applications: ' + ', '.join(str(application) for application in failed))
+
+    return failed
+
+
+def main(argv=None, server=None):
+    """
+    argv and server are passed by daemon, which runs commands with already logged in server
+    """
     os.umask(0077)
     if not os.path.exists(temp_dir):
         os.mkdir(temp_dir);
 
-    args = __parse_options()
-    
-    logging.debug('Python %s' % sys.version)
-    logging.debug('Running on %s' % platform.platform())
-    logging.debug('Temp path = %s' % temp_dir)
-    logging.debug('Current Directory = %s' % os.getcwd())
+    args = __parse_options(argv)
+    __import_core()
+
+    if options['--profile'] != None:
+        profiler.start()
+    if options['--memory-report']:
+        memoryReport.start()
+
+    # reports are saved even if command fails or exits
+    try:
+        retryOnSessionExpired(__run_command, args, server)
+    finally:
+        if options['--memory-report']:
+            memoryReport.stop()
+        if options['--profile'] != None:
+            profiler.stop(options['--profile'])
+        backgroundWriter.flush()
+
 
-    logging.debug('args %s' % args)
+def __run_command(args, server):
+    logging.debug('Python %s', sys.version)
+    logging.debug('Running on %s', platform.platform())
+    logging.debug('Temp path = %s', temp_dir)
+    logging.debug('Current Directory = %s', os.getcwd())
+
+    logging.debug('args %s', args)
+
+    if options['--application-id']:
+        options['--application-id'] = int(options['--application-id'])
+
+    # configuration is validated before logging in, so invalid config fails without any requests
+    compiledConfig = None
+    if options['update'] or options['version'] or options['create']:
+        cfg = __parse_configuration_file()
+        try:
+            compiledConfig = ConfigurationCompiler(cfg).compile(applicationId=options['--application-id']
+                                                                , addingVersion=options['version']
+                                                                , creating=options['create'])
+        except ConfigurationError as e:
+            for error in e.errors:
+                logging.error(error)
+            sys.exit(1)
+
+    if not options['--output-format'] in OUTPUT_FORMATS:
+        logging.error('Output format should be one of ' + ', '.join(OUTPUT_FORMATS))
+        sys.exit(1)
+    if options['reviews'] and options['--output-format'] == 'columnar' and options['--output-file'] == None:
+        logging.error('Columnar reviews can only be written to a file (--output-file or -o option)')
+        sys.exit(1)
+
+    promoRequests = None
+    if options['promo']:
+        try:
+            promoRequests = __parse_promo_amounts()
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+
+    batch = None
+    if options['batch']:
+        try:
+            batch = ITCBatch(options['--manifest'])
+        except ConfigurationError as e:
+            for error in e.errors:
+                logging.error(error)
+            sys.exit(1)
+
+    if options['--username'] == None:
+        options['--username'] = raw_input('Username: ')
 
     if options['--no-cookies']:
-        logging.debug('Deleting cookie file: ' + cookie_file)
-        if os.path.exists(cookie_file):
-            os.remove(cookie_file)
+        sessionStore.useAccount(options['--username'])
+        logging.debug('Deleting cookie file: %s', sessionStore.cookieFile)
+        if os.path.exists(sessionStore.cookieFile):
+            sessionStore.clear(force=True)
             logging.info('Removed authentication cookies')
         else:
             logging.debug('Cookie file doesn\'t exist')
 
-    if options['--username'] == None:
-        options['--username'] = raw_input('Username: ')
+    if server == None:
+        with profiler.phase('login'):
+            server = ITCServer(options['--username'], options['--password'])
 
-    server = ITCServer(options['--username'], options['--password'])
+            if not server.isLoggedIn:
+                if options['--password'] == None:
+                    options['--password'] = getpass.getpass()
+                server.login(password = options['--password'])
 
-    if not server.isLoggedIn:
-        if options['--password'] == None:
-            options['--password'] = getpass.getpass()
-        server.login(password = options['--password'])
+    if options['daemon']:
+        daemon.serve(server, options['--username'])
+        return
 
-    if len(server.applications) == 0:
-        server.fetchApplicationsList()
+    if options['batch']:
+        failedTasks = batch.run(server)
+        if not options['--silent']: # using print as report is the result of the command
+            print batch.report()
+        if len(failedTasks) > 0:
+            sys.exit(1)
 
-    if len(server.applications) == 0:
-        logging.info('No applications found.')
         return
-        
-    logging.debug(server.applications)
-    if options['--application-id']:
-        options['--application-id'] = int(options['--application-id'])
-
 
     if options['generate']:
         if options['--application-id']:
-            if options['--application-id'] in server.applications: 
+            application = server.getApplication(options['--application-id'])
+            if application != None:
                 applications = {}
-                applications[options['--application-id']] = server.applications[options['--application-id']]
+                applications[options['--application-id']] = application
             else:
                 logging.error('No application with id ' + str(options['--application-id']))
                 return
         else:
+            server.fetchApplicationsList()
             applications = server.applications
 
-        for applicationId, application in applications.items():
-            application.generateConfig(options['--application-version'], generateInapps = options['--generate-config-inapp'])
+            if len(applications) == 0:
+                logging.info('No applications found.')
+                return
+
+            logging.debug(applications)
+
+        if len(__generate_configs(server, applications)) > 0:
+            sys.exit(1)
 
         return
 
     if options['promo']:
-        if not options['--application-id'] in server.applications: 
-            logging.error("Provide correct application id (--application-id or -a option)")
-        else:
-            application = server.applications[options['--application-id']]
-            promocodes = application.getPromocodes(options['<amount>'])
-            if options['--output-file']:
-                with open(options['--output-file'], 'a') as outFile:
-                    outFile.write(promocodes)
-            else: # just print to console. Using print as we want to suppress silence option
-                print promocodes
+        if len(__get_promocodes(server, promoRequests)) > 0:
+            sys.exit(1)
 
         return
 
     if options['reviews']:
-        if not options['--application-id'] in server.applications: 
+        application = server.getApplication(options['--application-id'])
+        if application == None:
             logging.error("Provide correct application id (--application-id or -a option)")
         else:
-            application = server.applications[options['--application-id']]
-            application.generateReviews(options['--latest-version'], options['--date-range'], options['--output-file'])
+            application.generateReviews(options['--latest-version'], options['--date-range'], options['--output-file']
+                                        , outputFormat = options['--output-format'])
 
         return
 
-    cfg = __parse_configuration_file()
-    if len(cfg) == 0:
+    if compiledConfig == None:
         logging.info('Nothing to do.')
         return
 
-    applicationDict = cfg['application']
-    applicationId = applicationDict.get('id', -1)
-    if options['--application-id']:
-        applicationId = int(options['--application-id'])
+    applicationId = compiledConfig.applicationId
     application = None
-    commonActions = applicationDict.get('metadata', {}).get('general', {})
-    specificLangCommands = applicationDict.get('metadata', {}).get('languages', {})
-    langActions = {}
-    filename_format = cfg.get('config', {}) \
-                           .get('images', {}) \
-                              .get('file name format', default_file_format)
-
-    for lang in specificLangCommands:
-        langActions[languages.languageNameForId(lang)] = dict_merge(commonActions, specificLangCommands[lang])
+    langActions = compiledConfig.langActions
 
     logging.debug(langActions)
 
-    if applicationId not in server.applications and not options['create']:
+    prefetchTextAssets(globals()['config']['application'], [languages.langCodeForLanguage(lang) for lang in langActions])
+
+    if not options['create']:
+        application = server.getApplication(applicationId)
+
+    if application == None and not options['create']:
         logging.warning('No application with id ' + str(applicationId))
         choice = raw_input('Do you want to create a new one? [y/n]')
         options['create'] = True if choice.strip().lower() in ('y', 'yes', '') else False
 
     if options['create']:
-        server.createNewApp(applicationDict, filename_format=filename_format)
-    elif applicationId in server.applications:
-        application = server.applications[applicationId]
+        server.createNewApp(globals()['config']['application'], filename_format=compiledConfig.filenameFormat)
+    elif application != None:
         if options['version']:
-            langActions['default'] = commonActions
-            application.addVersion(applicationDict['version'], langActions)
+            application.addVersionWithConfig(compiledConfig)
         else:
-            for lang in langActions:
-                actions = langActions[lang]
-                application.editVersion(actions, lang=lang, filename_format=filename_format)
-
-            appReviewInfo = applicationDict.get('app review information', None)
-
-            if appReviewInfo != None:
-                application.editReviewInformation(appReviewInfo)
-
-            for inappDict in applicationDict.get('inapps', {}):
-                isIterable = inappDict['id'].find('{index}') != -1
-                iteratorDict = inappDict.get('index iterator')
-
-                if isIterable and (iteratorDict == None):
-                    logging.error('Inapp id contains {index} keyword, but no index_iterator object found. Skipping inapp: ' + inappDict['id'])
-                    continue
-
-                langsDict = inappDict['languages']
-                genericLangsDict = inappDict['general']
-
-                for langId in langsDict:
-                    langsDict[langId] = dict_merge(genericLangsDict, langsDict[langId])
-
-                inappDict['languages'] = langsDict
-                del inappDict['general']
-
-                indexes = [-1]
-                if (isIterable):
-                    indexes = iteratorDict.get('indexes')
-                    if indexes == None:
-                        indexes = range(iteratorDict.get('from', 1), iteratorDict['to'] + 1)
-
-                del inappDict['index iterator']
-
-                for key, value in inappDict.items():
-                    if (not key in ("index iterator", "general", "languages")) and isinstance(value, dict):
-                        flattenDictIndexes(value)
-
-                for langKey, value in inappDict["languages"].items():
-                    for innerLangKey, langValue in inappDict["languages"][langKey].items():
-                        if isinstance(langValue, dict):
-                            flattenDictIndexes(langValue)
-
-                realindex = 0
-                for index in indexes:
-                    inappIndexDict = deepcopy(inappDict)
-                    if isIterable:
-                        for key in inappIndexDict:
-                            if key in ("index iterator", "general", "languages"):
-                                continue
-
-                            if (isinstance(inappIndexDict[key], basestring)):
-                                inappIndexDict[key] = inappIndexDict[key].replace('{index}', str(index))
-                            elif (isinstance(inappIndexDict[key], list)):
-                                inappIndexDict[key] = inappIndexDict[key][realindex]
-                            elif (isinstance(inappIndexDict[key], dict)):
-                                inappIndexDict[key] = inappIndexDict[key][index]
-
-                        langsDict = inappIndexDict['languages']
-
-                        for langId, langDict in langsDict.items():
-                            for langKey in langDict:
-                                if (isinstance(langDict[langKey], basestring)):
-                                    langDict[langKey] = langDict[langKey].replace('{index}', str(index))
-                                elif (isinstance(langDict[langKey], list)):
-                                    langDict[langKey] = langDict[langKey][realindex]
-                                elif (isinstance(langDict[langKey], dict)):
-                                    langDict[langKey] = langDict[langKey][index]
-
-                    inapp = application.getInappById(inappIndexDict['id'])
-                    if inapp == None:
-                        application.createInapp(inappIndexDict)
-                    else:
-                        inapp.update(inappIndexDict)
-
-                    realindex += 1
+            application.updateWithConfig(compiledConfig)
+
+            if options['--plan']: # using print as we want to suppress silence option
+                print changesPlan.report()
+            elif options['--apply']:
+                logging.info('Applied changes:\n' + changesPlan.report())
     else:
         logging.error('No application with id ' + str(applicationId))
         return
@@ -1,26 +1,34 @@
 # coding=utf-8
 
-import logging
-
-from itc.util import languages
-from itc.conf import *
-
 class ITCReview(object):
-    def __init__(self, reviewId=None, authorName=None, text=None, store=None, rating=0, date=None):
+    __slots__ = ('reviewId', 'authorName', 'title', 'text', 'store', 'version', 'rating', 'date')
+
+    def __init__(self, reviewId=None, authorName=None, title=None, text=None, store=None, version=None, rating=0, date=None):
         self.reviewId = reviewId
         self.authorName = authorName
+        self.title = title
         self.text = text
         self.store = store
+        self.version = version
         self.rating = rating
         self.date = date
 
-        logging.debug('Review: ' + self.__str__())
-
 
     def __repr__(self):
         return self.__str__()
 
 
     def __str__(self):
-        return self.authorName + " (" + self.store + ", " + self.date + ") " + str(self.rating) + "\n" + self.text
-
+        return self.authorName + " (" + (self.store or '') + ", " + self.date + ") " + str(self.rating) + "\n" + self.text
+
+
+    def dict(self):
+        """
+        Review in the format of reviews output file
+        """
+        return {'reviewer': self.authorName
+              , 'version': self.version
+              , 'date': self.date
+              , 'title': self.title
+              , 'mark': self.rating
+              , 'text': self.text}
@@ -1,4 +1,6 @@
 import os
+import time
+import threading
 import logging
 from datetime import datetime
 
@@ -6,26 +8,110 @@ import requests
 
 from itc.core.application import ITCApplication
 from itc.parsers.serverparser import ITCServerParser
+from itc.parsers.baseparser import BaseParser
 from itc.core.imageuploader import ITCImageUploader
 from itc.util import languages
 from itc.util import dataFromStringOrFile
+from itc.util.configuration import saveReferenceData
+from itc.util.sessionstore import sessionStore, readJSON, writeJSON
 from itc.conf import *
 
 class ITCServer(ITCImageUploader):
     def __init__(self, username, password):
         super(ITCServer, self).__init__()
+        sessionStore.useAccount(username)
+        sessionStore.loadCookies()
 
         self._info                  = {'username': username, 'password': password}
         self._loginPageURL          = ITUNESCONNECT_MAIN_PAGE_URL
         self._parser                = ITCServerParser()
         self.applications           = {}
-        self.isLoggedIn             = self.__checkLogin()
+        self._applicationsLock      = threading.RLock()
+        self._reloginLock           = threading.Lock()
+        self.isLoggedIn             = self.__restoreSession() or self.__checkLogin()
+        if self.isLoggedIn:
+            self.__watchSession()
 
 
     def __cleanup(self):
-        if os.path.exists(cookie_file):
-            os.remove(cookie_file)
-        
+        """
+        Removes cookies, session and applications cache, as applications links are valid only within
+        the session. Returns False if session was replaced by another process, so it shouldn't be removed
+        """
+        return sessionStore.clear()
+
+
+    def __saveSession(self):
+        """
+        Saves session URLs next to the cookies, so the next run doesn't have to fetch main page
+        to check if cookies are still valid. Session is trusted until the first of cookies expires
+        """
+        expires = time.time() + session_ttl
+        for cookie in cookie_jar:
+            if cookie.expires != None:
+                expires = min(expires, cookie.expires)
+
+        session = {'username': self._info['username']
+                 , 'manageAppsURL': self._parser._manageAppsURL
+                 , 'logoutURL': self._parser._logoutURL
+                 , 'expires': expires}
+        writeJSON(sessionStore.sessionFile, session)
+
+
+    def __restoreSession(self):
+        if not os.path.exists(sessionStore.cookieFile):
+            return False
+
+        session = readJSON(sessionStore.sessionFile)
+        if session == None:
+            return False
+
+        if session.get('username') != self._info['username'] or session.get('expires', 0) < time.time():
+            logging.debug('Saved session is expired')
+            return False
+
+        self._parser._manageAppsURL = session['manageAppsURL']
+        self._parser._logoutURL = session['logoutURL']
+        logging.debug('Restored saved session')
+
+        return True
+
+
+    def __watchSession(self):
+        """
+        If session turns out to be expired, login is checked on the first response with login form.
+        Saved session isn't checked on start, and long running daemon may outlive its session as well
+        """
+        BaseParser.sessionExpiredHandler = self.__relogin
+
+
+    def __relogin(self):
+        """
+        Called when session turns out to be expired. Checks login with main page
+        and logs in again if needed. Links of the old session are invalid, so applications and
+        internal URLs are forgotten: they're resolved again, when the operation is started again
+        """
+        with self._reloginLock:
+            if BaseParser.sessionExpiredHandler == None: # already done by another thread
+                return
+            BaseParser.sessionExpiredHandler = None
+
+            logging.info('Saved session is expired, checking login')
+            self.isLoggedIn = self.__checkLogin()
+            if not self.isLoggedIn:
+                if self._info['password'] == None:
+                    raise Exception('Session is expired. Please log in again')
+                self.login(password=self._info['password'])
+
+            self._parser.clearSessionURLs()
+            with self._applicationsLock:
+                self.applications = {}
+            with sessionStore.locked():
+                if os.path.exists(sessionStore.applicationsCacheFile):
+                    os.remove(sessionStore.applicationsCacheFile)
+
+            self.__watchSession()
+
 
     def __checkLogin(self, mainPageTree=None):
         if mainPageTree == None:
@@ -33,10 +119,14 @@ class ITCServer(ITCImageUploader):
 
         if (mainPageTree == None) or (not self._parser.isLoggedIn(self.checkContinueButton(mainPageTree))):
             logging.debug('Check login: not logged in!')
-            self.__cleanup()
+            if not self.__cleanup():
+                # another process has logged in since cookies were loaded
+                sessionStore.loadCookies()
+                return self.__checkLogin()
             return False
 
         logging.debug('Check login: logged in!')
+        self.__saveSession()
         return True
 
 
@@ -58,6 +148,17 @@ class ITCServer(ITCImageUploader):
         return mainPageTree
 
     def login(self, login=None, password=None):
+        # processes log in one by one, others use cookies of the first one
+        with sessionStore.locked():
+            if not self.isLoggedIn and sessionStore.isChangedByOtherProcess():
+                logging.debug('Login: cookies are updated by another process')
+                sessionStore.loadCookies()
+                self.isLoggedIn = self.__checkLogin()
+
+            self.__login(login, password)
+
+
+    def __login(self, login=None, password=None):
         if self.isLoggedIn:
             logging.debug('Login: already logged in')
             return
@@ -79,9 +180,10 @@ class ITCServer(ITCImageUploader):
             mainPageTree = self.checkContinueButton(mainPageTree)
 
         if self.isLoggedIn:
-            logging.info("Login: logged in. Session cookies are saved to " + cookie_file)
+            logging.info("Login: logged in. Session cookies are saved to " + sessionStore.cookieFile)
             logging.debug(cookie_jar)
-            cookie_jar.save(cookie_file, ignore_discard=True)
+            sessionStore.saveCookies()
+            self.__watchSession()
         else:
             raise Exception('Cannot continue: login failed. Please check username/password')
 
@@ -97,8 +199,86 @@ class ITCServer(ITCImageUploader):
             applicationId = applicationData.applicationId
 
             application = ITCApplication(name=name, applicationId=applicationId, link=link)
+            logging.info('Application found: ' + str(application))
             self.applications[applicationId] = application
 
+        self.__saveApplicationsCache(dict((applicationData.applicationId, applicationData) for applicationData in applicationsData))
+
+
+    def __loadApplicationsCache(self):
+        """
+        Returns {applicationId: {'name': ..., 'link': ..., 'timestamp': ...}} saved by previous runs
+        for the current account. Expired applications are skipped
+        """
+        cache = readJSON(sessionStore.applicationsCacheFile)
+        if cache == None:
+            return {}
+
+        if cache.get('username') != self._info['username']:
+            return {}
+
+        return dict((int(applicationId), applicationDict) for applicationId, applicationDict in cache.get('applications', {}).items()
+                        if time.time() - applicationDict.get('timestamp', 0) < applications_cache_ttl)
+
+
+    def __saveApplicationsCache(self, applicationsData):
+        with sessionStore.locked():
+            applications = self.__loadApplicationsCache()
+            for applicationId, applicationData in applicationsData.items():
+                applications[applicationId] = {'name': applicationData.name, 'link': applicationData.link, 'timestamp': time.time()}
+
+            cache = {'username': self._info['username'], 'applications': applications}
+            writeJSON(sessionStore.applicationsCacheFile, cache)
+
+
+    def savePromocodesLink(self, application):
+        """
+        Keeps resolved promocodes link of application in applications cache
+        """
+        with sessionStore.locked():
+            applications = self.__loadApplicationsCache()
+            if not application.applicationId in applications:
+                return
+
+            applications[application.applicationId]['promocodesLink'] = application.promocodesLink
+            cache = {'username': self._info['username'], 'applications': applications}
+            writeJSON(sessionStore.applicationsCacheFile, cache)
+
+
+    def getApplication(self, applicationId):
+        """
+        Resolves a single application without fetching the whole applications list: from already fetched
+        applications, applications cache or by walking through the list until application is found.
+        Returns None if there's no such application
+        """
+        with self._applicationsLock:
+            return self.__getApplication(applicationId)
+
+
+    def __getApplication(self, applicationId):
+        if applicationId in self.applications:
+            return self.applications[applicationId]
+
+        if not self.isLoggedIn:
+            raise Exception('Get application: not logged in')
+
+        applicationDict = self.__loadApplicationsCache().get(applicationId)
+        if applicationDict != None:
+            logging.debug('Application %d is found in cache', applicationId)
+            application = ITCApplication(name=applicationDict['name'], applicationId=applicationId, link=applicationDict['link'])
+            application.promocodesLink = applicationDict.get('promocodesLink')
+        else:
+            applicationData = self._parser.findApplicationData(applicationId)
+            if applicationData == None:
+                return None
+
+            self.__saveApplicationsCache({applicationId: applicationData})
+            application = ITCApplication(name=applicationData.name, applicationId=applicationId, link=applicationData.link)
+
+        logging.info('Application found: ' + str(application))
+        self.applications[applicationId] = application
+        return application
+
     def __manageCountries(self, serverCountries, countries, formData):
         include = countries \
             and isinstance(countries, dict) \
@@ -111,14 +291,14 @@ class ITCServer(ITCImageUploader):
 
         if include:
             for country in countries['list']:
-                logging.debug("Including " + country)
+                logging.debug("Including %s", country)
                 formData[serverCountries[country]] = serverCountries[country]
         else:
             for country, val in serverCountries.items():
                 if not exclude or country not in countries['list']:
                     formData[val] = val
                 else:
-                    logging.debug("Excluding " + country)
+                    logging.debug("Excluding %s", country)
 
 
     def createNewApp(self, appDictionary=None, filename_format=None):
@@ -151,6 +331,7 @@ class ITCServer(ITCImageUploader):
             return
 
         metadata = self._parser.parseSecondAppCreatePageForm(secondPageTree)
+        saveReferenceData('countries', metadata.countries.keys())
         formData = {}
         formNames = metadata.formNames
         submitAction = metadata.submitAction
@@ -179,6 +360,7 @@ class ITCServer(ITCImageUploader):
             return
 
         metadata = self._parser.parseThirdAppCreatePageForm(thirdPageTree, fetchSubcategories=newAppMetadata['primary category'])
+        saveReferenceData('categories', metadata.categories.keys())
         
         formData = {}
         formNames = metadata.formNames
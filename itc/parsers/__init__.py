@@ -1,4 +1,16 @@
-import html5lib
+import threading
 
-htmlParser = html5lib.HTMLParser(tree=html5lib.treebuilders.getTreeBuilder("lxml")
-                                 , namespaceHTMLElements=False)
+_threadLocal = threading.local()
+
+def htmlParser():
+    """
+    html5lib parser keeps the state of the document being parsed, so every thread gets its own instance
+    """
+    parser = getattr(_threadLocal, 'htmlParser', None)
+    if parser == None:
+        import html5lib
+        parser = html5lib.HTMLParser(tree=html5lib.treebuilders.getTreeBuilder("lxml")
+                                     , namespaceHTMLElements=False)
+        _threadLocal.htmlParser = parser
+
+    return parser
@@ -6,8 +6,21 @@ from collections import namedtuple
 from datetime import datetime
 
 from itc.parsers.baseparser import BaseParser
+from itc.core.review import ITCReview
 from itc.util import getElement
 from itc.util import languages
+from itc.util.profiling import profiler
+
+AppVersion = namedtuple('AppVersion', ['versionString', 'statusString', 'editable', 'detailsLink'])
+AppVersions = namedtuple('AppVersions', ['manageInappsLink', 'customerReviewsLink', 'addVersionLink', 'versions'])
+AppMetadata = namedtuple('AppMetadata', ['activatedLanguages', 'nonactivatedLanguages', 'formData', 'formNames', 'submitActions'])
+AppReviewInfo = namedtuple('AppReviewInfo', ['formData', 'formNames', 'submitAction'])
+AddVersionPageInfo = namedtuple('AddVersionPageInfo', ['formNames', 'submitAction', 'saveButton'])
+PromoPageInfo = namedtuple('PromoPageInfo', ['amountName', 'continueButton', 'submitAction'])
+PromoLicensePageInfo = namedtuple('PromoLicensePageInfo', ['agreeTickName', 'continueButton', 'submitAction'])
+ReviewsPageInfo = namedtuple('ReviewsPageInfo', ['countries', 'countriesSelectName', 'countryFormSubmitAction', 'allVersions', 'currentVersion', 'allReviews'])
+
+REVIEWER_REGEXP = re.compile('by\s+(.*)-\sVersion(.*)-\s*(.*)', re.DOTALL)
 
 class ITCApplicationParser(BaseParser):
     def __init__(self):
@@ -15,44 +28,42 @@ class ITCApplicationParser(BaseParser):
 
     
     def parseAppVersionsPage(self, htmlTree):
-        AppVersions = namedtuple('AppVersions', ['manageInappsLink', 'customerReviewsLink', 'addVersionLink', 'versions'])
-
         # get 'manage in-app purchases' link
         manageInappsLink = htmlTree.xpath("//ul[@id='availableButtons']/li/a[.='Manage In-App Purchases']/@href")[0]
         customerReviewsLinkTree = htmlTree.xpath("//td[@class='value']/a[.='Customer Reviews']/@href")
         customerReviewsLink = None
         if (len(customerReviewsLinkTree) > 0):
             customerReviewsLink = customerReviewsLinkTree[0]
-        logging.debug("Manage In-App purchases link: " + manageInappsLink)
-        logging.debug("Customer reviews link: " + manageInappsLink)
+        logging.debug("Manage In-App purchases link: %s", manageInappsLink)
+        logging.debug("Customer reviews link: %s", customerReviewsLink)
 
         versionsContainer = htmlTree.xpath("//h2[.='Versions']/following-sibling::div")
         if len(versionsContainer) == 0:
-            return AppVersions(manageInappsLink=manageInappsLink, customerReviewsLink=customerReviewsLink, versions={})
+            return AppVersions(manageInappsLink=manageInappsLink, customerReviewsLink=customerReviewsLink, addVersionLink=None, versions={})
 
         versionDivs = versionsContainer[0].xpath(".//div[@class='version-container']")
         if len(versionDivs) == 0:
-            return AppVersions(manageInappsLink=manageInappsLink, customerReviewsLink=customerReviewsLink, versions={})
+            return AppVersions(manageInappsLink=manageInappsLink, customerReviewsLink=customerReviewsLink, addVersionLink=None, versions={})
 
         versions = {}
         addVersionLink = None
 
         for versionDiv in versionDivs:
-            version = {}            
             versionString = versionDiv.xpath(".//p/label[.='Version']/../span")
 
             if len(versionString) == 0: # Add version
                 addVersionLink = versionDiv.xpath(".//a[.='Add Version']/@href")[0]
-                logging.debug('Add version link: ' + addVersionLink)
+                logging.debug('Add version link: %s', addVersionLink)
                 continue
             
             versionString = versionString[0].text.strip()
-            version['detailsLink'] = versionDiv.xpath(".//a[.='View Details']/@href")[0]
-            version['statusString'] = ("".join([str(x) for x in versionDiv.xpath(".//span/img[starts-with(@src, '/itc/images/status-')]/../text()")])).strip()
-            version['editable'] = (version['statusString'] != 'Ready for Sale')
-            version['versionString'] = versionString
+            statusString = ("".join([str(x) for x in versionDiv.xpath(".//span/img[starts-with(@src, '/itc/images/status-')]/../text()")])).strip()
+            version = AppVersion(versionString=versionString
+                               , statusString=statusString
+                               , editable=(statusString != 'Ready for Sale')
+                               , detailsLink=versionDiv.xpath(".//a[.='View Details']/@href")[0])
 
-            logging.info("Version found: " + versionString)
+            logging.debug('Version found: %s', versionString)
             logging.debug(version)
 
             versions[versionString] = version
@@ -61,90 +72,104 @@ class ITCApplicationParser(BaseParser):
                             , addVersionLink=addVersionLink, versions=versions)
 
 
-    def parseCreateOrEditPage(self, htmlTree, version, language=None):
-        tree = htmlTree
+    def __parseLocalizationLightbox(self, localizationLightboxAction, lang, versionString, activatedLanguages, nonactivatedLanguages):
+        logging.debug('Processing language: %s', lang)
+        languageId = languages.appleLangIdForLanguage(lang)
+        logging.debug('Apple language id: %s', languageId)
 
-        AppMetadata = namedtuple('AppMetadata', ['activatedLanguages', 'nonactivatedLanguages'
-                                                , 'formData', 'formNames', 'submitActions'])
+        if lang in activatedLanguages:
+            logging.debug('Getting metadata for %s. Version: %s', lang, versionString)
+        elif lang in nonactivatedLanguages:
+            logging.debug('Add %s for version %s', lang, versionString)
 
-        localizationLightboxAction = tree.xpath("//div[@id='localizationLightbox']/@action")[0] # if no lang provided, edit default
-        #localizationLightboxUpdateAction = tree.xpath("//span[@id='localizationLightboxUpdate']/@action")[0] 
+        editTree = self.parseTreeForURL(localizationLightboxAction + "?open=true" 
+                                                + ("&language=" + languageId if (languageId != None) else ""))
+        hasWhatsNew = False
 
-        activatedLanguages    = tree.xpath('//div[@id="modules-dropdown"] \
-                                    /ul/li[count(preceding-sibling::li[@class="heading"])=1]/a/text()')
-        nonactivatedLanguages = tree.xpath('//div[@id="modules-dropdown"] \
-                                    /ul/li[count(preceding-sibling::li[@class="heading"])=2]/a/text()')
-        
-        activatedLanguages = [lng.replace("(Default)", "").strip() for lng in activatedLanguages]
+        formDataForLang = {}
+        formNamesForLang = {}
 
-        logging.info('Activated languages: ' + ', '.join(activatedLanguages))
-        logging.debug('Nonactivated languages: ' + ', '.join(nonactivatedLanguages))
+        submitActionForLang = editTree.xpath("//div[@class='lcAjaxLightboxContentsWrapper']/div[@class='lcAjaxLightboxContents']/@action")[0]
 
-        langs = activatedLanguages
+        formNamesForLang['appNameName'] = editTree.xpath("//div[@id='appNameUpdateContainerId']//input/@name")[0]
+        formNamesForLang['descriptionName'] = editTree.xpath("//div[@id='descriptionUpdateContainerId']//textarea/@name")[0]
+        whatsNewName = editTree.xpath("//div[@id='whatsNewinthisVersionUpdateContainerId']//textarea/@name")
 
-        if language != None:
-            langs = [language]
+        if len(whatsNewName) > 0: # there's no what's new section for first version
+            hasWhatsNew = True
+            formNamesForLang['whatsNewName'] = whatsNewName[0]
 
-        formData = {}
-        formNames = {}
-        submitActions = {}
-        versionString = version['versionString']
+        formNamesForLang['keywordsName']     = editTree.xpath("//div/label[.='Keywords']/..//input/@name")[0]
+        formNamesForLang['supportURLName']   = editTree.xpath("//div/label[.='Support URL']/..//input/@name")[0]
+        formNamesForLang['marketingURLName'] = editTree.xpath("//div/label[contains(., 'Marketing URL')]/..//input/@name")[0]
+        formNamesForLang['pPolicyURLName']   = editTree.xpath("//div/label[contains(., 'Privacy Policy URL')]/..//input/@name")[0]
+
+        formDataForLang['appNameValue']     = editTree.xpath("//div[@id='appNameUpdateContainerId']//input/@value")[0]
+        formDataForLang['descriptionValue'] = getElement(editTree.xpath("//div[@id='descriptionUpdateContainerId']//textarea/text()"), 0)
+        whatsNewValue    = editTree.xpath("//div[@id='whatsNewinthisVersionUpdateContainerId']//textarea/text()")
 
-        for lang in langs:
-            logging.info('Processing language: ' + lang)
-            languageId = languages.appleLangIdForLanguage(lang)
-            logging.debug('Apple language id: ' + languageId)
+        if len(whatsNewValue) > 0 and hasWhatsNew:
+            formDataForLang['whatsNewValue'] = getElement(whatsNewValue, 0)
 
-            if lang in activatedLanguages:
-                logging.info('Getting metadata for ' + lang + '. Version: ' + versionString)
-            elif lang in nonactivatedLanguages:
-                logging.info('Add ' + lang + ' for version ' + versionString)
+        formDataForLang['keywordsValue']     = getElement(editTree.xpath("//div/label[.='Keywords']/..//input/@value"), 0)
+        formDataForLang['supportURLValue']   = getElement(editTree.xpath("//div/label[.='Support URL']/..//input/@value"), 0)
+        formDataForLang['marketingURLValue'] = getElement(editTree.xpath("//div/label[contains(., 'Marketing URL')]/..//input/@value"), 0)
+        formDataForLang['pPolicyURLValue']   = getElement(editTree.xpath("//div/label[contains(., 'Privacy Policy URL')]/..//input/@value"), 0)
 
-            editTree = self.parseTreeForURL(localizationLightboxAction + "?open=true" 
-                                                    + ("&language=" + languageId if (languageId != None) else ""))
-            hasWhatsNew = False
+        logging.debug("Old values: %s", formDataForLang)
 
-            formDataForLang = {}
-            formNamesForLang = {}
+        iphoneUploadScreenshotForm = editTree.xpath("//form[@name='FileUploadForm_35InchRetinaDisplayScreenshots']")[0]
+        iphone5UploadScreenshotForm = editTree.xpath("//form[@name='FileUploadForm_iPhone5']")[0]
+        ipadUploadScreenshotForm = editTree.xpath("//form[@name='FileUploadForm_iPadScreenshots']")[0]
 
-            submitActionForLang = editTree.xpath("//div[@class='lcAjaxLightboxContentsWrapper']/div[@class='lcAjaxLightboxContents']/@action")[0]
+        formNamesForLang['iphoneUploadScreenshotForm'] = iphoneUploadScreenshotForm
+        formNamesForLang['iphone5UploadScreenshotForm'] = iphone5UploadScreenshotForm
+        formNamesForLang['ipadUploadScreenshotForm'] = ipadUploadScreenshotForm
 
-            formNamesForLang['appNameName'] = editTree.xpath("//div[@id='appNameUpdateContainerId']//input/@name")[0]
-            formNamesForLang['descriptionName'] = editTree.xpath("//div[@id='descriptionUpdateContainerId']//textarea/@name")[0]
-            whatsNewName = editTree.xpath("//div[@id='whatsNewinthisVersionUpdateContainerId']//textarea/@name")
+        return languageId, formDataForLang, formNamesForLang, submitActionForLang
 
-            if len(whatsNewName) > 0: # there's no what's new section for first version
-                hasWhatsNew = True
-                formNamesForLang['whatsNewName'] = whatsNewName[0]
+    def parseVersionLanguages(self, tree):
+        activatedLanguages    = tree.xpath('//div[@id="modules-dropdown"] \
+                                    /ul/li[count(preceding-sibling::li[@class="heading"])=1]/a/text()')
+        nonactivatedLanguages = tree.xpath('//div[@id="modules-dropdown"] \
+                                    /ul/li[count(preceding-sibling::li[@class="heading"])=2]/a/text()')
+        
+        activatedLanguages = [lng.replace("(Default)", "").strip() for lng in activatedLanguages]
 
-            formNamesForLang['keywordsName']     = editTree.xpath("//div/label[.='Keywords']/..//input/@name")[0]
-            formNamesForLang['supportURLName']   = editTree.xpath("//div/label[.='Support URL']/..//input/@name")[0]
-            formNamesForLang['marketingURLName'] = editTree.xpath("//div/label[contains(., 'Marketing URL')]/..//input/@name")[0]
-            formNamesForLang['pPolicyURLName']   = editTree.xpath("//div/label[contains(., 'Privacy Policy URL')]/..//input/@name")[0]
+        return activatedLanguages, nonactivatedLanguages
 
-            formDataForLang['appNameValue']     = editTree.xpath("//div[@id='appNameUpdateContainerId']//input/@value")[0]
-            formDataForLang['descriptionValue'] = getElement(editTree.xpath("//div[@id='descriptionUpdateContainerId']//textarea/text()"), 0)
-            whatsNewValue    = editTree.xpath("//div[@id='whatsNewinthisVersionUpdateContainerId']//textarea/text()")
+    def parseCreateOrEditPage(self, htmlTree, version, language=None):
+        tree = htmlTree
 
-            if len(whatsNewValue) > 0 and hasWhatsNew:
-                formDataForLang['whatsNewValue'] = getElement(whatsNewValue, 0)
+        localizationLightboxAction = tree.xpath("//div[@id='localizationLightbox']/@action")[0] # if no lang provided, edit default
+        #localizationLightboxUpdateAction = tree.xpath("//span[@id='localizationLightboxUpdate']/@action")[0] 
 
-            formDataForLang['keywordsValue']     = getElement(editTree.xpath("//div/label[.='Keywords']/..//input/@value"), 0)
-            formDataForLang['supportURLValue']   = getElement(editTree.xpath("//div/label[.='Support URL']/..//input/@value"), 0)
-            formDataForLang['marketingURLValue'] = getElement(editTree.xpath("//div/label[contains(., 'Marketing URL')]/..//input/@value"), 0)
-            formDataForLang['pPolicyURLValue']   = getElement(editTree.xpath("//div/label[contains(., 'Privacy Policy URL')]/..//input/@value"), 0)
+        activatedLanguages, nonactivatedLanguages = self.parseVersionLanguages(tree)
 
-            logging.debug("Old values:")
-            logging.debug(formDataForLang)
+        logging.debug('Activated languages: %s', ', '.join(activatedLanguages))
+        logging.debug('Nonactivated languages: %s', ', '.join(nonactivatedLanguages))
 
-            iphoneUploadScreenshotForm = editTree.xpath("//form[@name='FileUploadForm_35InchRetinaDisplayScreenshots']")[0]
-            iphone5UploadScreenshotForm = editTree.xpath("//form[@name='FileUploadForm_iPhone5']")[0]
-            ipadUploadScreenshotForm = editTree.xpath("//form[@name='FileUploadForm_iPadScreenshots']")[0]
+        langs = activatedLanguages
 
-            formNamesForLang['iphoneUploadScreenshotForm'] = iphoneUploadScreenshotForm
-            formNamesForLang['iphone5UploadScreenshotForm'] = iphone5UploadScreenshotForm
-            formNamesForLang['ipadUploadScreenshotForm'] = ipadUploadScreenshotForm
+        if isinstance(language, list): # several languages at once
+            langs = language
+        elif language != None:
+            langs = [language]
 
+        formData = {}
+        formNames = {}
+        submitActions = {}
+        versionString = version.versionString
+
+        def parseLanguage(lang):
+            return self.__parseLocalizationLightbox(localizationLightboxAction, lang, versionString
+                                                    , activatedLanguages, nonactivatedLanguages)
+
+        # server side session keeps only the last opened lightbox, so they are fetched one by one
+        with profiler.phase('localization lightboxes'):
+            lightboxes = [parseLanguage(lang) for lang in langs]
+
+        for languageId, formDataForLang, formNamesForLang, submitActionForLang in lightboxes:
             formData[languageId] = formDataForLang
             formNames[languageId] = formNamesForLang
             submitActions[languageId] = submitActionForLang
@@ -160,7 +185,6 @@ class ITCApplicationParser(BaseParser):
     def parseAppReviewInfoForm(self, tree):
         logging.info('Updating application review informtaion')
 
-        AppReviewInfo = namedtuple('AppReviewInfo', ['formData', 'formNames', 'submitAction'])
 
         appReviewLightboxAction = tree.xpath("//div[@id='reviewInfoLightbox']/@action")[0]
         editTree = self.parseTreeForURL(appReviewLightboxAction + "?open=true")
@@ -182,7 +206,7 @@ class ITCApplicationParser(BaseParser):
         formData['last name']         = getElement(editTree.xpath("//div/label[.='Last Name']/..//input/@value"), 0)
         formData['email address']     = getElement(editTree.xpath("//div/label[.='Email Address']/..//input/@value"), 0)
         formData['phone number']      = getElement(editTree.xpath("//div/label[.='Phone Number']/..//input/@value"), 0)
-        formData['review notes']      = getElement(editTree.xpath("//div[@id='reviewnotes']//textarea/@value"), 0)
+        formData['review notes']      = getElement(editTree.xpath("//div[@id='reviewnotes']//textarea/text()"), 0)
         formData['username']          = getElement(editTree.xpath("//div/label[.='Username']/..//input/@value"), 0)
         formData['password']          = getElement(editTree.xpath("//div/label[.='Password']/..//input/@value"), 0)
 
@@ -194,7 +218,6 @@ class ITCApplicationParser(BaseParser):
         return metadata
 
     def parseAddVersionPageMetadata(self, htmlTree):
-        AddVersionPageInfo = namedtuple('AddVersionPageInfo', ['formNames', 'submitAction', 'saveButton'])
         formNames = {'languages': {}}
 
         formNames['version'] = htmlTree.xpath("//div/label[.='Version Number']/..//input/@name")[0]
@@ -224,7 +247,6 @@ class ITCApplicationParser(BaseParser):
         return link[0].attrib['href'].strip()
 
     def parsePromocodesPageMetadata(self, tree):
-        PromoPageInfo = namedtuple('PromoPageInfo', ['amountName', 'continueButton', 'submitAction'])
         amountName = getElement(tree.xpath("//td[@class='metadata-field-code']/input/@name"), 0).strip()
         continueButton = tree.xpath("//input[@class='continueActionButton']/@name")[0].strip()
         submitAction = tree.xpath('//form[@name="mainForm"]/@action')[0]
@@ -235,19 +257,18 @@ class ITCApplicationParser(BaseParser):
         return metadata
 
     def parsePromocodesLicenseAgreementPage(self, pageText):
-        tree = self.parser.parse(pageText)
-        PromoPageInfo = namedtuple('PromoPageInfo', ['agreeTickName', 'continueButton', 'submitAction'])
+        tree = self.parseHTML(pageText)
         agreeTickName = getElement(tree.xpath("//input[@type='checkbox']/@name"), 0).strip()
         continueButton = tree.xpath("//input[@class='continueActionButton']/@name")[0].strip()
         submitAction = tree.xpath('//form[@name="mainForm"]/@action')[0]
-        metadata = PromoPageInfo(agreeTickName=agreeTickName
+        metadata = PromoLicensePageInfo(agreeTickName=agreeTickName
                                , continueButton=continueButton
                                , submitAction=submitAction)
 
         return metadata
 
     def getDownloadCodesLink(self, pageText):
-        tree = self.parser.parse(pageText)
+        tree = self.parseHTML(pageText)
         link = tree.xpath("//img[@alt='Download Codes']/../@href")
         if len(link) == 0:
             raise('Cannot find "Download Codes" button.')
@@ -255,7 +276,6 @@ class ITCApplicationParser(BaseParser):
         return link[0].strip()
 
     def getReviewsPageMetadata(self, tree):
-        ReviewsPageInfo = namedtuple('ReviewsPageInfo', ['countries', 'countriesSelectName', 'countryFormSubmitAction', 'allVersions', 'currentVersion', 'allReviews'])
         countriesSelectName = tree.xpath('//select/@name')[0].strip()
         countriesSelect = tree.xpath('//select/option')
         countries = {}
@@ -276,8 +296,8 @@ class ITCApplicationParser(BaseParser):
 
         return metadata
 
-    def parseReviews(self, pageText, minDate=None, maxDate=None):
-        tree = self.parser.parse(pageText)
+    def parseReviews(self, pageText, minDate=None, maxDate=None, store=None):
+        tree = self.parseHTML(pageText)
         reviewDivs = tree.xpath('//div[@class="reviews-container"]')
         
         if len(reviewDivs) == 0:
@@ -285,24 +305,23 @@ class ITCApplicationParser(BaseParser):
 
         reviews = []
         for reviewDiv in reviewDivs:
-            review = {} 
             reviewerString = getElement(reviewDiv.xpath('./p[@class="reviewer"]'), 0).text.strip()
-            regexp = re.compile('by\s+(.*)-\sVersion(.*)-\s*(.*)', re.DOTALL)
-            m = regexp.search(reviewerString)
-            review['reviewer'] = m.group(1).strip()
-            review['version'] = m.group(2).strip()
-            review['date'] = m.group(3).strip()
-            reviewDate = datetime.strptime(review['date'], '%b %d, %Y')
+            m = REVIEWER_REGEXP.search(reviewerString)
+            date = m.group(3).strip()
+            reviewDate = datetime.strptime(date, '%b %d, %Y')
             if minDate != None and reviewDate < minDate:
                 break
             if maxDate != None and reviewDate > maxDate:
                 continue
 
-            title = getElement(reviewDiv.xpath('./p[@class="reviewer-title"]'), 0).text.strip()
-            review['title'] = title.replace(u'★', '').strip()
-            review['mark'] = len(title.replace(review['title'], '').strip())
-
-            review['text'] = getElement(reviewDiv.xpath('./p[@class="review-text"]'), 0).text.strip()
-            reviews.append(review)
+            fullTitle = getElement(reviewDiv.xpath('./p[@class="reviewer-title"]'), 0).text.strip()
+            title = fullTitle.replace(u'★', '').strip()
+            reviews.append(ITCReview(authorName=m.group(1).strip()
+                                   , version=m.group(2).strip()
+                                   , date=date
+                                   , title=title
+                                   , rating=len(fullTitle.replace(title, '').strip())
+                                   , text=getElement(reviewDiv.xpath('./p[@class="review-text"]'), 0).text.strip()
+                                   , store=store))
 
         return reviews
\ No newline at end of file
@@ -1,17 +1,101 @@
 import logging
+import threading
 
 import requests
-from bs4 import BeautifulSoup
 
 from itc.parsers import htmlParser
 from itc.conf import *
+from itc.util.profiling import profiler, PARSING
+from itc.util.logs import bodyDumper
+
+# requests' session isn't thread safe, so each thread has its own one, shared by all the parsers
+_transport = threading.local()
+
+# server side session keeps the state of opened pages, lightboxes and wizards, and it's shared by all
+# the threads. Page with its lightboxes or a wizard is processed by one thread at a time under this lock.
+# It's never held while waiting for the pool, as workers may need it
+sessionLock = threading.RLock()
+_postsLock = threading.Lock()
+
+class SessionExpiredError(Exception):
+    """
+    Saved session turned out to be expired and the server has logged in again. Links of the old
+    session are invalid, so the operation should be started again with links resolved in the new one
+    """
+    pass
+
+
+def retryOnSessionExpired(function, *args):
+    """
+    Runs function once more, if saved session turned out to be expired. function should resolve
+    applications and links itself, so they're resolved again in the new session. Function isn't
+    run again, if server has accepted any form since it was started, as changes may be applied twice
+    """
+    postsCount = BaseParser.postsCount
+    try:
+        return function(*args)
+    except SessionExpiredError:
+        if BaseParser.postsCount != postsCount:
+            logging.error('Session has expired after some changes were sent. Please check them and run the command again')
+            raise
+        logging.info('Starting again with the new session')
+        return function(*args)
+
 
 class BaseParser(object):
-    parser = None
-    requests_session = None
-    def __init__(self):
-        self.requests_session = requests.session()
-        self.parser = htmlParser
+    # set by server, once it's logged in or session is restored. Called on the first response with login form
+    sessionExpiredHandler = None
+    # POST requests, which weren't rejected with login form. Login itself isn't counted
+    postsCount = 0
+
+    @property
+    def parser(self):
+        return htmlParser()
+
+    @property
+    def requests_session(self):
+        session = getattr(_transport, 'requests_session', None)
+        if session == None:
+            session = requests.session()
+            profiler.timeRequests(session)
+            _transport.requests_session = session
+
+        return session
+
+    def parseHTML(self, text):
+        with profiler.measure(PARSING):
+            tree = self.parser.parse(text)
+
+        return profiler.timedTree(tree)
+
+    def __checkSession(self):
+        handler = BaseParser.sessionExpiredHandler
+        if handler != None:
+            handler()
+            raise SessionExpiredError('Saved session is expired')
+
+    def __countPost(self, method):
+        # login is posted while session isn't watched
+        if method != "GET" and BaseParser.sessionExpiredHandler != None:
+            with _postsLock:
+                BaseParser.postsCount += 1
+
+    def request(self, url, method="GET", **kwargs):
+        """
+        Request, which response isn't parsed as html page: json, form posts, uploads and downloads.
+        Responses with login form are checked the same way as in parseTreeForURL
+        """
+        if method == "GET":
+            response = self.requests_session.get(ITUNESCONNECT_URL + url, cookies=cookie_jar, **kwargs)
+        else:
+            response = self.requests_session.post(ITUNESCONNECT_URL + url, cookies=cookie_jar, **kwargs)
+
+        # streamed responses aren't read here
+        if BaseParser.sessionExpiredHandler != None and kwargs.get('prefetch', True) and 'theAccountName' in response.content:
+            self.__checkSession()
+        self.__countPost(method)
+
+        return response
 
     def parseTreeForURL(self, url, method="GET", payload=None, debugPrint=False):
         response = None
@@ -23,7 +107,10 @@ class BaseParser(object):
         if response == None:
             raise
 
-        if debugPrint or config.options['--verbose'] == 2:
+        if bodyDumper.dump(method, url, response.content):
+            pass
+        elif debugPrint or config.options['--verbose'] == 2:
+            from bs4 import BeautifulSoup # only needed for debug output
             if config.options['-f']:
                 logging.debug(BeautifulSoup(response.content).prettify())
             elif debugPrint:
@@ -33,6 +120,12 @@ class BaseParser(object):
 
         if response.status_code != 200:
             logging.error('Wrong response from itunesconnect. Status code: ' + str(response.status_code) + '. Content:\n' + response.text)
+            self.__countPost(method) # form may be partially applied
             return None
 
-        return self.parser.parse(response.text)
\ No newline at end of file
+        tree = self.parseHTML(response.text)
+        if BaseParser.sessionExpiredHandler != None and len(tree.xpath("//input[@name='theAccountName']")) > 0:
+            self.__checkSession()
+        self.__countPost(method)
+
+        return tree
\ No newline at end of file
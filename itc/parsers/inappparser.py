@@ -1,17 +1,18 @@
-import logging 
+import logging
 from collections import namedtuple
 
-from itc.parsers.baseparser import BaseParser
+from itc.parsers.baseparser import BaseParser, sessionLock
 from itc.util import languages
 
+InappMetadata = namedtuple('InappMetadata', ['refname', 'cleared', 'languages', 'textid', 'numericid', 'price_tier', 'reviewnotes', 'hosted'])
+InappPageMetadata = namedtuple('InappPageMetadata', ['refname', 'cleared', 'textid', 'numericid', 'price_tier', 'reviewnotes', 'hosted', 'localizationAction', 'localizationURLs'])
+
 class ITCInappParser(BaseParser):
     def __init__(self):
         super(ITCInappParser, self).__init__()
 
 
-    def metadataForInappPurchase(self, htmlTree):
-        InappMetadata = namedtuple('InappMetadata', ['refname', 'cleared', 'languages', 'textid', 'numericid', 'price_tier', 'reviewnotes', 'hosted'])
-
+    def parseInappPage(self, htmlTree):
         inappReferenceName = htmlTree.xpath('//span[@id="iapReferenceNameUpdateContainer"]//span/text()')[0].strip()
         textId = htmlTree.xpath('//div[@id="productIdText"]//span/text()')[0].strip()
         numericId = htmlTree.xpath('//label[.="Apple ID: "]/following-sibling::span/text()')[0].strip()
@@ -37,26 +38,73 @@ class ITCInappParser(BaseParser):
         languageAction = htmlTree.xpath('//div[@id="0' + idAddon + 'ocalizationListLightbox"]/@action')[0]
 
         # logging.info('Activated languages for inapp ' + self.numericId + ': ' + ', '.join(activatedLanguages))
-        logging.debug('Activated languages ids: ' + ', '.join(activatedLangsIds))
+        logging.debug('Activated languages ids: %s', ', '.join(activatedLangsIds))
+
+        localizationURLs = [(langId, languageAction + "?open=true&itemID=" + languages.appleLangIdForLanguage(langId))
+                                for langId in activatedLangsIds]
+
+        return InappPageMetadata(refname=inappReferenceName
+                                , cleared=clearedForSale
+                                , price_tier=priceTier
+                                , textid=textId
+                                , numericid=int(numericId)
+                                , hosted=hostedContent
+                                , reviewnotes=reviewNotes
+                                , localizationAction=languageAction
+                                , localizationURLs=localizationURLs)
+
+
+    def parseInappLocalization(self, localizationTree):
+        localization = {}
+        localization['name'] = localizationTree.xpath('//div[@id="proposedDisplayName"]//input/@value')[0]
+        localization['description'] = localizationTree.xpath('//div[@id="proposedDescription"]//textarea/text()')[0].strip()
+
+        localizedPublicationName = localizationTree.xpath('//div[@id="proposedPublicationName"]//input/@value')
+        if len(localizedPublicationName) > 0:
+            localization['publication name'] = localizedPublicationName[0]
+
+        return localization
+
+
+    def __fetchLocalization(self, url):
+        return self.parseInappLocalization(self.parseTreeForURL(url))
+
+
+    def __metadataWithLocalizations(self, pageMetadata, localizations):
         metadataLanguages = {}
+        for (langId, url), localization in zip(pageMetadata.localizationURLs, localizations):
+            metadataLanguages[langId] = localization
 
-        for langId in activatedLangsIds:
-            metadataLanguages[langId] = {}
-            languageParamStr = "&itemID=" + languages.appleLangIdForLanguage(langId)
-            localizationTree = self.parseTreeForURL(languageAction + "?open=true" + languageParamStr)
-            metadataLanguages[langId]['name'] = localizationTree.xpath('//div[@id="proposedDisplayName"]//input/@value')[0]
-            metadataLanguages[langId]['description'] = localizationTree.xpath('//div[@id="proposedDescription"]//textarea/text()')[0].strip()
-    
-            localizedPublicationName = localizationTree.xpath('//div[@id="proposedPublicationName"]//input/@value')
-            if len(localizedPublicationName) > 0:
-                metadataLanguages[langId]['publication name'] = localizedPublicationName[0]
-
-        return InappMetadata(refname=inappReferenceName
-                            , cleared=clearedForSale
+        return InappMetadata(refname=pageMetadata.refname
+                            , cleared=pageMetadata.cleared
                             , languages=metadataLanguages
-                            , price_tier=priceTier
-                            , textid=textId
-                            , numericid=int(numericId)
-                            , hosted=hostedContent
-                            , reviewnotes=reviewNotes)
+                            , price_tier=pageMetadata.price_tier
+                            , textid=pageMetadata.textid
+                            , numericid=pageMetadata.numericid
+                            , hosted=pageMetadata.hosted
+                            , reviewnotes=pageMetadata.reviewnotes)
+
+
+    def metadataForInappPurchase(self, htmlTree):
+        """
+        Lightboxes belong to the page in the server side session, so the page should be
+        the last one opened. Callers hold sessionLock since the page was requested
+        """
+        pageMetadata = self.parseInappPage(htmlTree)
+        localizations = [self.__fetchLocalization(url) for langId, url in pageMetadata.localizationURLs]
+
+        return self.__metadataWithLocalizations(pageMetadata, localizations)
+
+
+    def __fetchInappMetadata(self, itemURL):
+        with sessionLock:
+            return self.metadataForInappPurchase(self.parseTreeForURL(itemURL))
+
 
+    def metadataForInappPurchases(self, itemURLs):
+        """
+        Fetches metadata for several inapps. Each item page is fetched together with its own
+        localization lightboxes, so other threads may use the session only between inapps.
+        Result is a list of InappMetadata in the same order as itemURLs
+        """
+        return [self.__fetchInappMetadata(itemURL) for itemURL in itemURLs]
@@ -2,6 +2,7 @@ import logging
 from collections import namedtuple
 
 from itc.parsers.baseparser import BaseParser
+from itc.util.profiling import profiledPhase
 import pprint
 
 ApplicationData = namedtuple('SessionURLs', ['name', 'applicationId', 'link'])
@@ -29,6 +30,14 @@ class ITCServerParser(BaseParser):
         return False
 
 
+    def clearSessionURLs(self):
+        """
+        Internal URLs are valid only within the session, they're resolved again after login
+        """
+        self._createAppURL = None
+        self._getApplicationListURL = None
+
+
     def parseSessionURLs(self, htmlTree):
         manageAppsLink = htmlTree.xpath("//a[.='Manage Your Apps']")
         if len(manageAppsLink) == 0:
@@ -41,8 +50,8 @@ class ITCServerParser(BaseParser):
         self._manageAppsURL = manageAppsLink[0].attrib['href']
         self._logoutURL = signOutLink[0].attrib['href']
 
-        logging.debug('manage apps url: ' + self._manageAppsURL)
-        logging.debug('logout url: ' + self._logoutURL)
+        logging.debug('manage apps url: %s', self._manageAppsURL)
+        logging.debug('logout url: %s', self._logoutURL)
 
 
     def __getInternalURLs(self):
@@ -64,7 +73,7 @@ class ITCServerParser(BaseParser):
         self._createAppURL = createAppLink[0].attrib['href']
 
 
-    def getApplicationsData(self):
+    def __iterApplicationsData(self):
         if self._manageAppsURL == None:
             raise Exception('Get applications list: not logged in')
 
@@ -73,7 +82,6 @@ class ITCServerParser(BaseParser):
         if not self._getApplicationListURL:
             self.__getInternalURLs()
 
-        result = []
         nextLink = self._getApplicationListURL;
         while nextLink!=None:
             appsTree = self.parseTreeForURL(nextLink)
@@ -85,7 +93,7 @@ class ITCServerParser(BaseParser):
                 name = nameLink[0].text.strip()
                 link = nameLink[0].attrib["href"]
                 applicationId = int(tds[4].xpath(".//p")[0].text.strip())
-                result.append(ApplicationData(name=name, link=link, applicationId=applicationId))
+                yield ApplicationData(name=name, link=link, applicationId=applicationId)
 
             nextLinkDiv = appsTree.xpath("//td[@class='next']")
             if len(nextLinkDiv) > 0:
@@ -93,7 +101,20 @@ class ITCServerParser(BaseParser):
             else:
                 nextLink = None
 
-        return result
+
+    @profiledPhase('applications list')
+    def getApplicationsData(self):
+        return list(self.__iterApplicationsData())
+
+
+    @profiledPhase('applications list')
+    def findApplicationData(self, applicationId):
+        """
+        Walks through applications list until application with applicationId is found.
+        Following pages aren't requested once application is found
+        """
+        return next((applicationData for applicationData in self.__iterApplicationsData()
+                        if applicationData.applicationId == applicationId), None)
 
     def parseFirstAppCreatePageForm(self):
         if self._manageAppsURL == None:
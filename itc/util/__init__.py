@@ -1,7 +1,7 @@
 import os
 import json 
 from copy import deepcopy 
-from itc.conf import ALIASES
+from itc.util.assets import assetPath, readTextAsset
 
 def getElement(list, index, outOfBoundsValue=""):
     """
@@ -33,11 +33,7 @@ def dataFromStringOrFile(value, languageCode=None):
         return value
     elif (isinstance(value, dict)):
         if ('file name format' in value):
-            descriptionFilePath = value['file name format']
-            if languageCode != None:
-                replace_language = ALIASES.language_aliases.get(languageCode, languageCode)
-                descriptionFilePath = descriptionFilePath.replace('{language}', replace_language)
-            return open(descriptionFilePath, 'r').read()
+            return readTextAsset(assetPath(value, languageCode))
 
     return ""
 
@@ -0,0 +1,77 @@
+import os
+import logging
+import threading
+
+from itc.conf import *
+from itc.util.pool import parallelMap
+from itc.util.profiling import profiler, DISK
+
+# configuration keys, which values may be loaded from text files with 'file name format'
+TEXT_ASSET_KEYS = ('description', 'whats new', 'keywords', 'review notes', 'eula text')
+
+_cache = {}
+_cacheLock = threading.Lock()
+
+def assetPath(value, languageCode=None):
+    """
+    Path of the file for {"file name format": "..."} value with {language} replaced
+    """
+    path = value['file name format']
+    if languageCode != None:
+        replace_language = ALIASES.language_aliases.get(languageCode, languageCode)
+        path = path.replace('{language}', replace_language)
+
+    return path
+
+def readTextAsset(path):
+    """
+    Reads file contents. Contents are memoized by the real path of the file and its
+    modification time, so the same file is read from disk only once until it's changed
+    """
+    realPath = os.path.realpath(path)
+    mtime = os.stat(realPath).st_mtime
+
+    with _cacheLock:
+        cached = _cache.get(realPath)
+    if cached != None and cached[0] == mtime:
+        return cached[1]
+
+    with profiler.measure(DISK):
+        with open(realPath, 'r') as fp:
+            contents = fp.read()
+
+    with _cacheLock:
+        _cache[realPath] = (mtime, contents)
+
+    return contents
+
+def __collectAssetPaths(value, languageCodes, paths):
+    if isinstance(value, dict):
+        for key, subvalue in value.items():
+            if key in TEXT_ASSET_KEYS and isinstance(subvalue, dict) and 'file name format' in subvalue:
+                for languageCode in languageCodes:
+                    paths.add(assetPath(subvalue, languageCode))
+            else:
+                __collectAssetPaths(subvalue, languageCodes, paths)
+    elif isinstance(value, list):
+        for subvalue in value:
+            __collectAssetPaths(subvalue, languageCodes, paths)
+
+def __prefetchAsset(path):
+    try:
+        readTextAsset(path)
+    except (IOError, OSError) as e:
+        # missing file is reported when the value is actually used
+        logging.debug('Can\'t prefetch %s: %s', path, e)
+
+def prefetchTextAssets(configDict, languageCodes=None):
+    """
+    Reads all the text files referenced from configuration concurrently.
+    Templates with {language} are expanded for each of languageCodes
+    """
+    paths = set()
+    __collectAssetPaths(configDict, [None] + list(languageCodes or []), paths)
+    paths = sorted(path for path in paths if not '{language}' in path)
+
+    logging.debug('Prefetching %d text files', len(paths))
+    parallelMap(__prefetchAsset, paths)
@@ -0,0 +1,245 @@
+"""
+Columnar binary files for large outputs: reviews and inapps catalog snapshots.
+
+File consists of a header, column descriptors and columns data. Numeric columns are
+little-endian arrays. Values of string columns are stored in one utf-8 strings buffer,
+string column itself is an array of rows + 1 offsets into the buffer. Files are
+memory-mapped on reading, values are unpacked only when accessed
+"""
+
+import sys
+import mmap
+import struct
+from array import array
+from datetime import datetime
+
+from itc.util.sessionstore import writeFileAtomically
+
+MAGIC = 'ITCCOL1\0'
+HEADER = struct.Struct('<8sII')          # magic, rows count, columns count
+DESCRIPTOR = struct.Struct('<16scxxxQQ') # name, typecode, offset, size
+STRING = 's'
+STRINGS_BUFFER = '__strings'
+ALIGNMENT = 8
+
+REVIEW_COLUMNS = [('rating', 'B'), ('date', 'I'), ('version', STRING), ('country', STRING)
+                  , ('reviewer', STRING), ('title', STRING), ('text', STRING)]
+INAPP_COLUMNS = [('productId', STRING), ('appleId', STRING), ('name', STRING), ('type', STRING)
+                 , ('priceTier', 'h'), ('cleared', 'B')]
+EPOCH = datetime(1970, 1, 1)
+
+def _littleEndianBytes(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    return values.tostring()
+
+
+class ColumnarWriter(object):
+    """
+    Collects rows into column arrays and writes them to a file at once
+    """
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.rows = 0
+        self._values = []
+        self._strings = []
+        for name, typecode in self.columns:
+            if typecode == STRING:
+                self._values.append(array('I', [0]))
+                self._strings.append([])
+            else:
+                if array(typecode).itemsize != struct.calcsize('<' + typecode):
+                    raise Exception('Column ' + name + ': unsupported type ' + typecode)
+                self._values.append(array(typecode))
+                self._strings.append(None)
+
+    def append(self, row):
+        """
+        row is a tuple of values in the order of columns. Strings are unicode or utf-8 encoded
+        """
+        for value, values, strings in zip(row, self._values, self._strings):
+            if strings != None:
+                if isinstance(value, unicode):
+                    value = value.encode('utf-8')
+                value = value or ''
+                strings.append(value)
+                values.append(values[-1] + len(value))
+            else:
+                values.append(value)
+        self.rows += 1
+
+    def write(self, path):
+        # strings of each column are placed one after another, so their offsets are shifted
+        # by the size of strings of the previous columns
+        base = 0
+        data = []
+        for values, strings in zip(self._values, self._strings):
+            if strings != None:
+                size = values[-1]
+                if base > 0:
+                    values = array('I', (offset + base for offset in values))
+                base += size
+            data.append(_littleEndianBytes(values))
+
+        columns = self.columns + [(STRINGS_BUFFER, 'c')]
+        data.append(''.join(''.join(strings) for strings in self._strings if strings != None))
+
+        offset = HEADER.size + DESCRIPTOR.size * len(columns)
+        descriptors = []
+        for (name, typecode), columnData in zip(columns, data):
+            offset += -offset % ALIGNMENT
+            descriptors.append(DESCRIPTOR.pack(name, typecode, offset, len(columnData)))
+            offset += len(columnData)
+
+        def writeColumns(fp):
+            fp.write(HEADER.pack(MAGIC, self.rows, len(columns)))
+            fp.write(''.join(descriptors))
+            for columnData in data:
+                fp.write('\0' * (-fp.tell() % ALIGNMENT))
+                fp.write(columnData)
+
+        writeFileAtomically(path, writeColumns)
+
+
+class Column(object):
+    """
+    View of a column of memory-mapped file. Values are unpacked on access
+    """
+    def __init__(self, columnarFile, name, typecode, offset, size):
+        self._file = columnarFile
+        self.name = name
+        self.typecode = typecode
+        self._offset = offset
+        self._size = size
+        self._format = struct.Struct('<' + ('I' if typecode == STRING else typecode))
+
+    def __len__(self):
+        return self._file.rows
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('Row index out of range')
+
+        data = self._file._data
+        if self.typecode != STRING:
+            return self._format.unpack_from(data, self._offset + index * self._format.size)[0]
+
+        start, end = struct.unpack_from('<II', data, self._offset + index * 4)
+        stringsOffset = self._file._stringsOffset
+
+        return data[stringsOffset + start:stringsOffset + end].decode('utf-8')
+
+    def __iter__(self):
+        if self.typecode != STRING:
+            for value in self.array():
+                yield value
+            return
+
+        # strings of a column are contiguous, so they are sliced from one copy of them
+        offsets = self.__values('I')
+        stringsOffset = self._file._stringsOffset
+        strings = self._file._data[stringsOffset + offsets[0]:stringsOffset + offsets[-1]]
+        base = offsets[0]
+        for index in xrange(len(offsets) - 1):
+            yield strings[offsets[index] - base:offsets[index + 1] - base].decode('utf-8')
+
+    def __values(self, typecode):
+        values = array(typecode)
+        values.fromstring(self._file._data[self._offset:self._offset + self._size])
+        if sys.byteorder != 'little':
+            values.byteswap()
+
+        return values
+
+    def array(self):
+        """
+        All values of numeric column as an array. Data is copied, but not parsed
+        """
+        if self.typecode == STRING:
+            raise Exception('Column ' + self.name + ' is a string column')
+
+        return self.__values(self.typecode)
+
+
+class ColumnarFile(object):
+    """
+    Memory-mapped columnar file: file['title'][10], file.row(10), file.column('rating').array()
+    """
+    def __init__(self, path):
+        self._fp = open(path, 'rb')
+        self._data = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.rows, columnsCount = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise Exception(path + ' is not a columnar file')
+
+        self.columnNames = []
+        self._columns = {}
+        for index in range(columnsCount):
+            name, typecode, offset, size = DESCRIPTOR.unpack_from(self._data, HEADER.size + DESCRIPTOR.size * index)
+            name = name.rstrip('\0')
+            if name == STRINGS_BUFFER:
+                self._stringsOffset = offset
+                continue
+
+            self.columnNames.append(name)
+            self._columns[name] = Column(self, name, typecode, offset, size)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def column(self, name):
+        return self._columns[name]
+
+    def row(self, index):
+        return dict((name, self._columns[name][index]) for name in self.columnNames)
+
+    def close(self):
+        self._data.close()
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def writeReviews(path, reviews):
+    """
+    reviews is {country: [ITCReview, ...]}. Dates are stored as days since 1970-01-01
+    """
+    writer = ColumnarWriter(REVIEW_COLUMNS)
+    days = {}
+    for country, reviewsForCountry in sorted(reviews.items()):
+        for review in reviewsForCountry:
+            if not review.date in days: # the same dates repeat a lot, strptime is slow
+                days[review.date] = (datetime.strptime(review.date, '%b %d, %Y') - EPOCH).days
+            writer.append((review.rating, days[review.date], review.version, country
+                         , review.authorName, review.title, review.text))
+
+    writer.write(path)
+
+    return writer.rows
+
+def writeInappsCatalog(path, inappDicts):
+    """
+    inappDicts are inapps in the format of generated configuration file
+    """
+    writer = ColumnarWriter(INAPP_COLUMNS)
+    for inappDict in inappDicts:
+        priceTier = inappDict['price tier']
+        writer.append((inappDict['_id'], str(inappDict['id']), inappDict['reference name'], inappDict['type']
+                     , priceTier if priceTier != None else -1, 1 if inappDict['cleared'] else 0))
+
+    writer.write(path)
+
+    return writer.rows
@@ -0,0 +1,228 @@
+import os
+import json
+from datetime import datetime
+from collections import namedtuple
+
+from itc.conf import *
+from itc.util import languages
+from itc.util.assets import TEXT_ASSET_KEYS, assetPath
+from itc.util.template import InappTemplate
+from itc.util.sessionstore import readJSON, writeJSON
+
+MAX_PRICE_TIER = 87
+INAPP_TYPES = ('Consumable', 'Non-Consumable', 'Free Subscription', 'Non-Renewing Subscription')
+
+CompiledConfig = namedtuple('CompiledConfig', ['applicationId', 'filenameFormat', 'commonActions', 'langActions'
+                                                , 'reviewInformation', 'inapps', 'version', 'newApp'])
+
+class ConfigurationError(Exception):
+    """
+    Configuration file is invalid. All the found problems are listed in errors
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        super(ConfigurationError, self).__init__('Invalid configuration file:\n' + '\n'.join(errors))
+
+
+def loadConfigurationFile(path):
+    """
+    Loads configuration file and sets aliases from its 'config' section
+    """
+    with open(path) as config_file:
+        cfg = json.load(config_file)
+    ALIASES.language_aliases = cfg.get('config', {}) \
+                            .get('language aliases', {})
+    ALIASES.device_type_aliases = cfg.get('config', {}) \
+                            .get('device type aliases', {})
+
+    return cfg
+
+
+def loadReferenceData():
+    """
+    Reference data (categories, countries), saved from iTunesConnect pages by previous runs
+    """
+    return readJSON(reference_cache_file) or {}
+
+def saveReferenceData(name, values):
+    referenceData = loadReferenceData()
+    referenceData[name] = sorted(values)
+    writeJSON(reference_cache_file, referenceData)
+
+
+def mergeShared(a, b):
+    """
+    Same as dict_merge, but values of a and b aren't copied: new dictionaries are created
+    only for keys, which are dictionaries in both a and b. Result mustn't be modified
+    """
+    if not isinstance(b, dict):
+        return b
+    result = dict(a)
+    for k, v in b.iteritems():
+        if k in result and isinstance(result[k], dict):
+            result[k] = mergeShared(result[k], v)
+        else:
+            result[k] = v
+    return result
+
+
+class ConfigurationCompiler(object):
+    def __init__(self, cfg, referenceData=None):
+        self._cfg = cfg
+        self._referenceData = referenceData if referenceData != None else loadReferenceData()
+        self._errors = []
+
+    def __error(self, message):
+        self._errors.append(message)
+
+    def __checkLanguageId(self, scope, langId):
+        try:
+            return languages.languageNameForId(langId)
+        except KeyError:
+            self.__error(scope + ': unknown language "' + langId + '"')
+            return None
+
+    def __checkPriceTier(self, scope, tier, minTier=0):
+        values = [tier]
+        if isinstance(tier, dict):
+            values = tier.values()
+        elif isinstance(tier, list):
+            values = tier
+
+        for value in values:
+            try:
+                if not (minTier <= int(value) <= MAX_PRICE_TIER):
+                    raise ValueError()
+            except (ValueError, TypeError):
+                self.__error(scope + ': price tier should be from %d to %d, got "%s"' % (minTier, MAX_PRICE_TIER, value))
+
+    def __checkReference(self, scope, name, title, value):
+        """
+        Values are checked only if reference data was saved by one of the previous runs
+        """
+        reference = self._referenceData.get(name)
+        if reference != None and not value in reference:
+            self.__error(scope + ': unknown ' + title + ' "' + value + '"')
+
+    def __checkTextAssets(self, scope, dataDict, languageCode=None):
+        for key in TEXT_ASSET_KEYS:
+            value = dataDict.get(key)
+            if isinstance(value, dict) and 'file name format' in value:
+                path = assetPath(value, languageCode)
+                if path.find('{language}') == -1 and not os.path.exists(path):
+                    self.__error(scope + ': ' + key + ' file "' + path + '" doesn\'t exist')
+
+    def __compileInapp(self, inappDict):
+        scope = 'Inapp ' + inappDict.get('id', '?')
+        for key in ('id', 'type', 'reference name'):
+            if not key in inappDict:
+                self.__error(scope + ': "' + key + '" is missing')
+        if not 'id' in inappDict:
+            return None
+
+        if 'type' in inappDict and not inappDict['type'] in INAPP_TYPES:
+            self.__error(scope + ': unknown type "' + inappDict['type'] + '"')
+        if 'price tier' in inappDict:
+            self.__checkPriceTier(scope, inappDict['price tier'], minTier=1)
+        for langId in inappDict.get('languages', {}):
+            if languages.appleLangIdForLanguage(langId) == None:
+                self.__error(scope + ': unknown language "' + langId + '"')
+
+        if inappDict['id'].find('{index}') != -1:
+            iteratorDict = inappDict.get('index iterator')
+            if iteratorDict == None:
+                self.__error(scope + ': id contains {index} keyword, but no index iterator object found')
+                return None
+            if not 'indexes' in iteratorDict and not 'to' in iteratorDict:
+                self.__error(scope + ': index iterator should contain either "indexes" or "to"')
+                return None
+
+        return InappTemplate(inappDict)
+
+    def __compileNewApp(self, newAppDict):
+        scope = 'New app'
+        for key in ('default language', 'name', 'sku number', 'bundle id', 'bundle id suffix', 'availability date'
+                    , 'price tier', 'version', 'copyright', 'primary category', 'app rating', 'large app icon'
+                    , 'screenshots', 'description', 'keywords', 'support url'):
+            if not key in newAppDict:
+                self.__error(scope + ': "' + key + '" is missing')
+
+        if 'default language' in newAppDict:
+            self.__checkLanguageId(scope, newAppDict['default language'])
+        if 'price tier' in newAppDict:
+            self.__checkPriceTier(scope, newAppDict['price tier'])
+        if 'availability date' in newAppDict:
+            try:
+                datetime.strptime(newAppDict['availability date'], '%b %d %Y')
+            except ValueError:
+                self.__error(scope + ': availability date should look like "Jan 01 2014"')
+
+        for key in ('primary category', 'secondary category'):
+            if key in newAppDict:
+                self.__checkReference(scope, 'categories', 'category', newAppDict[key])
+        for key in ('countries', 'eula countries'):
+            for country in newAppDict.get(key, {}).get('list', []):
+                self.__checkReference(scope, 'countries', 'country', country)
+
+        self.__checkTextAssets(scope, newAppDict)
+
+    def compile(self, applicationId=None, addingVersion=False, creating=False):
+        """
+        Validates configuration and returns CompiledConfig. Raises ConfigurationError
+        with all the found problems, so nothing is requested from iTunesConnect for invalid config
+        """
+        cfg = self._cfg
+        if not 'application' in cfg:
+            raise ConfigurationError(['"application" section is missing'])
+
+        applicationDict = cfg['application']
+        if applicationId == None:
+            applicationId = applicationDict.get('id', -1)
+        filenameFormat = cfg.get('config', {}) \
+                            .get('images', {}) \
+                                .get('file name format', default_file_format)
+
+        commonActions = applicationDict.get('metadata', {}).get('general', {})
+        self.__checkTextAssets('General', commonActions)
+
+        langActions = {}
+        for langId, langDict in applicationDict.get('metadata', {}).get('languages', {}).items():
+            lang = self.__checkLanguageId('Metadata', langId)
+            if lang != None:
+                langActions[lang] = mergeShared(commonActions, langDict)
+                self.__checkTextAssets(lang, langActions[lang], languages.langCodeForLanguage(lang))
+
+        reviewInformation = applicationDict.get('app review information')
+        if reviewInformation != None:
+            self.__checkTextAssets('App review information', reviewInformation)
+
+        inapps = []
+        for inappDict in applicationDict.get('inapps', []):
+            inappTemplate = self.__compileInapp(inappDict)
+            if inappTemplate != None:
+                inapps.append(inappTemplate)
+
+        version = applicationDict.get('version')
+        if addingVersion and version == None:
+            self.__error('"version" is missing')
+
+        newApp = applicationDict.get('new app')
+        if creating:
+            if newApp == None:
+                self.__error('"new app" section is missing')
+            else:
+                self.__compileNewApp(newApp)
+            if reviewInformation == None:
+                self.__error('"app review information" section is missing')
+
+        if len(self._errors) > 0:
+            raise ConfigurationError(self._errors)
+
+        return CompiledConfig(applicationId=int(applicationId)
+                            , filenameFormat=filenameFormat
+                            , commonActions=commonActions
+                            , langActions=langActions
+                            , reviewInformation=reviewInformation
+                            , inapps=inapps
+                            , version=version
+                            , newApp=newApp)
@@ -2,6 +2,9 @@ import json
 import logging
 
 languages_map = {}
+# prebuilt indexes of languages_map, so lookups don't scan the whole map
+__appleIdByName = {}
+__codeByLanguage = {}
 
 def __parse_languages_map():
     try:
@@ -11,10 +14,26 @@ def __parse_languages_map():
         except ImportError:
              import pkg_resources
              data = pkg_resources.resource_string(__name__, 'languages.json')
-        globals()['languages_map'] = json.loads(data)
+        languagesMap = json.loads(data)
     except BaseException:
         raise 
 
+    appleIdByName = {}
+    codeByLanguage = {}
+    for langId, lang in languagesMap.items():
+        if type(lang) is dict:
+            appleIdByName.setdefault(lang['name'], lang['id'])
+            codeByLanguage.setdefault(lang['name'], langId)
+            codeByLanguage.setdefault(lang['id'], langId)
+        else:
+            appleIdByName.setdefault(lang, lang)
+            codeByLanguage.setdefault(lang, langId)
+
+    globals()['__appleIdByName'] = appleIdByName
+    globals()['__codeByLanguage'] = codeByLanguage
+    # map is set last, so other threads never see it without indexes
+    globals()['languages_map'] = languagesMap
+
 def __langs():
     if globals()['languages_map'] == None or len(globals()['languages_map']) == 0:
         __parse_languages_map()
@@ -34,30 +53,15 @@ def appleLangIdForLanguage(languageString):
 
         return lang
 
-    for langId, lang in __langs().items():
-        if type(lang) is dict:
-            if lang['name'] == languageString:
-                return lang['id']
-        else:
-            if lang == languageString:
-                return lang
-                
-    return None
+    return globals()['__appleIdByName'].get(languageString)
 
 def langCodeForLanguage(languageString):
     """
     returns language code (i.e. 'fr-CA') for language name 
     (i.e. 'Canadian French') or apple language id (i.e. 'French_CA')
     """
-    for langId, lang in __langs().items():
-        if type(lang) is dict:
-            if (lang['name'] == languageString) or (lang['id'] == languageString):
-                return langId
-        else:
-            if lang == languageString:
-                return langId
-                
-    return None
+    __langs()
+    return globals()['__codeByLanguage'].get(languageString)
 
 def languageNameForId(languageId):
     lang = __langs()[languageId]
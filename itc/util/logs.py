@@ -0,0 +1,159 @@
+"""
+Logging, which doesn't slow down the command: records are formatted and written to the console
+by a background thread, response bodies are dumped to files instead of the log
+"""
+
+import os
+import re
+import Queue
+import atexit
+import logging
+import threading
+
+class BackgroundWriter(object):
+    """
+    Runs queued writes one after another in a daemon thread
+    """
+    def __init__(self):
+        self._queue = Queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, write):
+        with self._lock:
+            if self._thread == None:
+                self._thread = threading.Thread(target=self.__run, name='itc-log-writer')
+                self._thread.daemon = True
+                self._thread.start()
+
+        self._queue.put(write)
+
+    def __run(self):
+        while True:
+            write = self._queue.get()
+            try:
+                write()
+            except Exception as e:
+                logging.error('Background write failed: ' + str(e))
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Waits until all queued writes are done
+        """
+        if self._thread != None:
+            self._queue.join()
+
+
+class BackgroundHandler(logging.Handler):
+    """
+    Writes records to the stream of handler in the background writer thread. Messages are formatted
+    in the calling thread, as arguments may change after the call. Records, queued while the writer
+    is busy, are written and flushed at once
+    """
+    def __init__(self, handler):
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self._records = []
+        self._scheduled = False
+        self._recordsLock = threading.Lock()
+
+    def emit(self, record):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._recordsLock:
+            self._records.append(record)
+            if self._scheduled:
+                return
+            self._scheduled = True
+
+        backgroundWriter.put(self.__writeRecords)
+
+    def __writeRecords(self):
+        with self._recordsLock:
+            records, self._records = self._records, []
+            self._scheduled = False
+
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.handler.format(record) + '\n')
+            except Exception:
+                self.handleError(record)
+
+        stream = self.handler.stream
+        stream.write(''.join(line.encode('utf-8') if isinstance(line, unicode) else line for line in lines))
+        stream.flush()
+
+
+class BodyDumper(object):
+    """
+    Writes response bodies to numbered files in directory. With sample N, only each N-th body is written
+    """
+    def __init__(self):
+        self.directory = None
+        self.sample = 1
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def configure(self, directory, sample=1):
+        """
+        directory None turns dumping off
+        """
+        if sample < 1:
+            raise ValueError('Dump sample should be a positive number')
+        if directory != None and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.sample = sample
+        self._count = 0
+
+    def dump(self, method, url, content):
+        """
+        Returns False if dumping is off, so body should be logged as before
+        """
+        if self.directory == None:
+            return False
+
+        with self._lock:
+            self._count += 1
+            number = self._count
+        if (number - 1) % self.sample != 0:
+            return True
+
+        name = re.sub('[^A-Za-z0-9.-]+', '_', url.split('?')[0]).strip('_')[-80:]
+        path = os.path.join(self.directory, '%05d-%s-%s.html' % (number, method, name))
+        logging.debug('%s %s response is dumped to %s', method, url, path)
+        backgroundWriter.put(lambda: _writeBody(path, content))
+
+        return True
+
+
+def _writeBody(path, content):
+    with open(path, 'wb') as fp:
+        fp.write(content)
+
+def configureLogging(level, format):
+    """
+    Same as logging.basicConfig(level=level, format=format), but console is written in background
+    """
+    rootLogger = logging.getLogger()
+    if len(rootLogger.handlers) == 0:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(format))
+        rootLogger.addHandler(BackgroundHandler(handler))
+        rootLogger.setLevel(level)
+
+backgroundWriter = BackgroundWriter()
+bodyDumper = BodyDumper()
+atexit.register(backgroundWriter.flush)
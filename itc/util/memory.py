@@ -0,0 +1,199 @@
+import gc
+import sys
+import types
+import logging
+import threading
+import weakref
+from collections import namedtuple
+
+try:
+    import resource
+except ImportError: # no resource module on Windows
+    resource = None
+
+from itc.util.profiling import profiler
+
+MemorySnapshot = namedtuple('MemorySnapshot', ['phase', 'highWaterMark', 'objects', 'lxmlDocuments', 'lxmlElements', 'growingTypes'])
+
+# objects, which references aren't followed when looking for application's trees: they lead to globals
+NOT_FOLLOWED_TYPES = (types.ModuleType, type, types.ClassType, types.FunctionType, types.BuiltinFunctionType
+                      , types.MethodType, types.FrameType)
+
+def highWaterMark():
+    """
+    Peak resident set size of the process in bytes or None if it's unknown
+    """
+    if resource == None:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on Mac OS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+def _typeName(obj):
+    # classes are counted by name, so classes created over and over again, i.e. namedtuples, are visible
+    if isinstance(obj, (type, types.ClassType)):
+        return 'class ' + obj.__name__
+
+    objType = type(obj)
+    module = getattr(objType, '__module__', None)
+    if module in (None, '__builtin__'):
+        return objType.__name__
+
+    return module + '.' + objType.__name__
+
+def _isLxmlTree(obj):
+    from lxml import etree
+    return isinstance(obj, (etree._Element, etree._ElementTree))
+
+def lxmlDocuments(objects):
+    """
+    Sizes (amounts of elements) of distinct documents, which lxml elements and trees belong to
+    """
+    from lxml import etree
+    roots = {}
+    for obj in objects:
+        root = obj.getroot() if isinstance(obj, etree._ElementTree) else obj.getroottree().getroot()
+        if root is not None and not id(root) in roots:
+            roots[id(root)] = (root, sum(1 for element in root.iter()))
+
+    return [size for documentRoot, size in roots.values()]
+
+def reachableLxmlTrees(obj, excluded=()):
+    """
+    lxml elements and trees, which are referenced by obj directly or through its attributes,
+    parsers, inapps and so on. Objects from excluded aren't walked through
+    """
+    seen = set(id(excludedObj) for excludedObj in excluded if excludedObj is not obj)
+    trees = []
+    stack = [obj]
+    while len(stack) > 0:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+
+        if _isLxmlTree(current):
+            trees.append(current)
+        elif not isinstance(current, NOT_FOLLOWED_TYPES):
+            stack.extend(gc.get_referents(current))
+
+    return trees
+
+
+class MemoryReport(object):
+    """
+    Memory usage at the boundaries of profiler's phases: peak RSS, amount of live objects
+    and lxml documents, types which amount grew the most and lxml trees retained by each application.
+    Python 2 has no tracemalloc, so growth is attributed to object types instead of source lines.
+    Does nothing unless started
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._snapshots = []
+        self._applications = []
+        self._retainedTrees = {}
+        self._firstTypeCounts = None
+        self._lastTypeCounts = None
+
+    def start(self):
+        self.enabled = True
+        profiler.addPhaseListener(self.snapshot)
+        self.snapshot('start')
+
+    def track(self, application):
+        """
+        Applications are referenced weakly, so tracking doesn't keep them alive
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._applications.append(weakref.ref(application))
+
+    def __countTypes(self):
+        typeCounts = {}
+        lxmlTrees = []
+        objects = gc.get_objects()
+        for obj in objects:
+            typeName = _typeName(obj)
+            typeCounts[typeName] = typeCounts.get(typeName, 0) + 1
+            if _isLxmlTree(obj):
+                lxmlTrees.append(obj)
+        del objects
+
+        return typeCounts, lxmlDocuments(lxmlTrees)
+
+    def __snapshotApplications(self):
+        applications = [application for application in (reference() for reference in self._applications) if application != None]
+        for application in applications:
+            documents = lxmlDocuments(reachableLxmlTrees(application, excluded=applications))
+            name = str(application)
+            previous = self._retainedTrees.get(name, (0, 0, 0, 0))
+            self._retainedTrees[name] = (len(documents), sum(documents)
+                                       , max(previous[2], len(documents)), max(previous[3], sum(documents)))
+
+    def snapshot(self, phase):
+        """
+        Garbage is collected first, so snapshot shows what is actually retained
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            gc.collect()
+            typeCounts, documents = self.__countTypes()
+
+            growingTypes = []
+            if self._lastTypeCounts != None:
+                growingTypes = self.__growingTypes(self._lastTypeCounts, typeCounts, 3)
+            if self._firstTypeCounts == None:
+                self._firstTypeCounts = typeCounts
+            self._lastTypeCounts = typeCounts
+
+            self._snapshots.append(MemorySnapshot(phase=phase
+                                                , highWaterMark=highWaterMark()
+                                                , objects=sum(typeCounts.values())
+                                                , lxmlDocuments=len(documents)
+                                                , lxmlElements=sum(documents)
+                                                , growingTypes=growingTypes))
+            self.__snapshotApplications()
+
+    def __growingTypes(self, before, after, limit):
+        growth = [(after[typeName] - before.get(typeName, 0), typeName) for typeName in after]
+
+        return [(count, typeName) for count, typeName in sorted(growth, reverse=True)[:limit] if count > 0]
+
+    def report(self):
+        lines = ['%-50s %10s %10s %10s %10s  %s' % ('phase', 'peak RSS', 'objects', 'lxml docs', 'elements', 'growing types')]
+        for snapshot in self._snapshots:
+            peak = '%.1fMB' % (snapshot.highWaterMark / 1024.0 / 1024) if snapshot.highWaterMark != None else '-'
+            lines.append('%-50s %10s %10d %10d %10d  %s' % (snapshot.phase, peak, snapshot.objects, snapshot.lxmlDocuments
+                                                         , snapshot.lxmlElements
+                                                         , ', '.join('%s +%d' % (typeName, count) for count, typeName in snapshot.growingTypes)))
+
+        lines.append('')
+        lines.append('Top growing types since start:')
+        for count, typeName in self.__growingTypes(self._firstTypeCounts, self._lastTypeCounts, 15):
+            lines.append('%10d  %s' % (count, typeName))
+
+        lines.append('')
+        lines.append('Retained lxml trees per application (last seen / peak):')
+        for name, (documents, elements, peakDocuments, peakElements) in sorted(self._retainedTrees.items()):
+            lines.append('  %s: %d documents, %d elements / %d documents, %d elements' % (name, documents, elements
+                                                                                           , peakDocuments, peakElements))
+
+        return '\n'.join(lines)
+
+    def stop(self):
+        """
+        Takes the last snapshot and logs the report
+        """
+        self.snapshot('end')
+        profiler.removePhaseListener(self.snapshot)
+        self.enabled = False
+
+        logging.info('Memory report:\n' + self.report())
+
+memoryReport = MemoryReport()
@@ -0,0 +1,82 @@
+import threading
+
+from itc.conf import *
+
+def isPlanning():
+    """
+    --plan: changes are only collected and printed, nothing is sent to iTunesConnect
+    """
+    return bool(config.options.get('--plan'))
+
+def isApplyingChangesOnly():
+    """
+    --plan or --apply: forms, which don't differ from current values, are not submitted
+    """
+    return isPlanning() or bool(config.options.get('--apply'))
+
+def _shorten(value, length=60):
+    if value == None:
+        return 'None'
+    value = unicode(value) if not isinstance(value, basestring) else value
+    value = value.replace('\n', ' ').replace('\r', '')
+    if len(value) > length:
+        value = value[:length - 3] + '...'
+
+    return '"' + value + '"'
+
+def _normalized(value):
+    if value == None:
+        return ''
+    if isinstance(value, basestring):
+        return value.strip().replace('\r\n', '\n')
+
+    return value
+
+class ChangesPlan(object):
+    """
+    Field-level differences between configuration and current state of iTunesConnect.
+    Changes may be added from several threads.
+    """
+    def __init__(self):
+        self._changes = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._changes)
+
+    def clear(self):
+        with self._lock:
+            self._changes = []
+
+    def addChange(self, scope, field, oldValue, newValue):
+        if field == 'password':
+            oldValue, newValue = '******', '******'
+
+        with self._lock:
+            self._changes.append((scope, field + ': ' + _shorten(oldValue) + ' -> ' + _shorten(newValue)))
+
+    def addAction(self, scope, description):
+        with self._lock:
+            self._changes.append((scope, description))
+
+    def addDifferences(self, scope, currentValues, newValues):
+        """
+        Compares two dictionaries with the same keys and adds changed fields.
+        Returns True if anything is changed
+        """
+        changed = False
+        for field, newValue in newValues.items():
+            oldValue = currentValues.get(field)
+            if _normalized(newValue) != _normalized(oldValue):
+                self.addChange(scope, field, oldValue, newValue)
+                changed = True
+
+        return changed
+
+    def report(self):
+        if len(self._changes) == 0:
+            return 'No changes.'
+
+        return '\n'.join(scope + ' / ' + change for scope, change in sorted(self._changes))
+
+changesPlan = ChangesPlan()
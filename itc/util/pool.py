@@ -0,0 +1,88 @@
+import sys
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+
+from itc.conf import *
+from itc.util.profiling import profiler
+
+_pool = None
+_poolSize = 0
+_poolLock = threading.Lock()
+_workerState = threading.local()
+
+def workersCount():
+    """
+    Number of concurrent requests allowed. Can be overridden with --workers option
+    """
+    workers = config.options.get('--workers')
+    if workers:
+        return max(1, int(workers))
+
+    return default_workers
+
+def sharedPool():
+    """
+    Returns the pool, which is shared between all the concurrent operations,
+    so the total amount of simultaneous requests never exceeds workersCount()
+    """
+    global _pool, _poolSize
+    with _poolLock:
+        if _pool == None:
+            _poolSize = workersCount()
+            _pool = ThreadPool(_poolSize)
+
+    return _pool
+
+def __runInWorker(function):
+    phase = profiler.currentPhase()
+    def wrapper(item):
+        _workerState.insideWorker = True
+        try:
+            with profiler.inPhase(phase):
+                return function(item)
+        finally:
+            _workerState.insideWorker = False
+
+    return wrapper
+
+def parallelMap(function, items):
+    """
+    Applies function to each item on the shared pool. Results are returned in the
+    same order as items. First raised exception is re-raised in the calling thread.
+    If called from one of the pool's workers, items are processed in place, as
+    waiting for other workers of the same pool may lead to a deadlock
+    """
+    items = list(items)
+    if len(items) == 0:
+        return []
+
+    if len(items) == 1 or getattr(_workerState, 'insideWorker', False) or workersCount() == 1:
+        return [function(item) for item in items]
+
+    # map_async with timeout allows to interrupt the script with Ctrl+C
+    return sharedPool().map_async(__runInWorker(function), items).get(sys.maxint)
+
+def runOnEachWorker(function, timeout=5):
+    """
+    Runs function once in each worker of the shared pool, e.g. to reset thread state of idle workers.
+    Workers wait for each other, so none of them takes two calls. Workers, which are busy
+    for longer than timeout seconds, are skipped. Does nothing if the pool isn't created
+    """
+    with _poolLock:
+        pool, size = _pool, _poolSize
+    if pool == None:
+        return
+
+    condition = threading.Condition()
+    started = [0]
+    deadline = time.time() + timeout
+    def runAndWait(index):
+        function()
+        with condition:
+            started[0] += 1
+            condition.notify_all()
+            while started[0] < size and time.time() < deadline:
+                condition.wait(deadline - time.time())
+
+    pool.map_async(runAndWait, range(size), chunksize=1).get(sys.maxint)
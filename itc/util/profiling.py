@@ -0,0 +1,250 @@
+import time
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+
+NETWORK = 'network'
+PARSING = 'html parsing'
+XPATH = 'xpath'
+DISK = 'disk'
+CATEGORIES = (NETWORK, PARSING, XPATH, DISK)
+
+class _TimedTree(object):
+    """
+    Parsed document, which xpath calls are measured. Elements are measured by _timedElementClass
+    """
+    def __init__(self, tree):
+        self._tree = tree
+
+    def xpath(self, *args, **kwargs):
+        with profiler.measure(XPATH):
+            return self._tree.xpath(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._tree, name)
+
+
+def _timedElementClass():
+    from lxml import etree
+
+    class TimedElement(etree.ElementBase):
+        def xpath(self, *args, **kwargs):
+            with profiler.measure(XPATH):
+                return etree.ElementBase.xpath(self, *args, **kwargs)
+
+    return TimedElement
+
+
+class Profiler(object):
+    """
+    Collects cProfile stats of all the threads, which do the work, and time of network requests,
+    html parsing, xpath and disk I/O for each phase of a command. Phases may be nested,
+    time is attributed to the innermost one. Does nothing unless started or phase listeners are added
+    """
+    def __init__(self):
+        self.enabled = False
+        self._phaseListeners = []
+        self._lock = threading.Lock()
+        self._threadState = threading.local()
+        self._profiles = []
+        self._phases = []
+        self._phaseTimes = {}
+        self._categoryTimes = {}
+        self._generation = 0
+
+    def start(self):
+        from lxml import etree
+
+        with self._lock:
+            self._profiles = []
+            self._phases = []
+            self._phaseTimes = {}
+            self._categoryTimes = {}
+            self._generation += 1
+        self.enabled = True
+        self._startTime = time.time()
+        etree.set_element_class_lookup(etree.ElementDefaultClassLookup(element=_timedElementClass()))
+        self.profileThread()
+
+    def profileThread(self):
+        """
+        cProfile measures only the thread it's enabled in, so each thread enables its own profile.
+        Profile can be disabled only in its own thread as well, so profiles of stopped profiler
+        are disabled here: by stop() in pool workers or when the thread gets its next work
+        """
+        state = self._threadState
+        profile = getattr(state, 'profile', None)
+        if profile != None and (not self.enabled or state.generation != self._generation):
+            profile.disable()
+            profile = state.profile = None
+        if not self.enabled or profile != None:
+            return
+
+        import cProfile
+        profile = cProfile.Profile()
+        state.profile = profile
+        state.generation = self._generation
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def addPhaseListener(self, listener):
+        """
+        listener(phase) is called every time a phase is finished, even if profiler isn't started
+        """
+        self._phaseListeners.append(listener)
+
+    def removePhaseListener(self, listener):
+        self._phaseListeners.remove(listener)
+
+    def __tracksPhases(self):
+        return self.enabled or len(self._phaseListeners) > 0
+
+    def currentPhase(self):
+        stack = getattr(self._threadState, 'phases', None)
+        if not stack:
+            return None
+
+        return stack[-1]
+
+    @contextmanager
+    def inPhase(self, phase):
+        """
+        Continues the phase of another thread, i.e. in pool workers
+        """
+        self.profileThread()
+        if not self.__tracksPhases():
+            yield
+            return
+
+        if phase == None:
+            yield
+            return
+
+        stack = getattr(self._threadState, 'phases', None)
+        if stack == None:
+            stack = self._threadState.phases = []
+        stack.append(phase)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    @contextmanager
+    def phase(self, name):
+        if not self.__tracksPhases():
+            yield
+            return
+
+        parent = self.currentPhase()
+        fullName = name if parent == None else parent + ' / ' + name
+        with self._lock:
+            if not fullName in self._phaseTimes:
+                self._phases.append(fullName)
+                self._phaseTimes[fullName] = 0
+
+        startTime = time.time()
+        with self.inPhase(fullName):
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._phaseTimes[fullName] += time.time() - startTime
+                for listener in list(self._phaseListeners):
+                    listener(fullName)
+
+    @contextmanager
+    def measure(self, category):
+        if not self.enabled:
+            yield
+            return
+
+        startTime = time.time()
+        try:
+            yield
+        finally:
+            key = (self.currentPhase(), category)
+            with self._lock:
+                self._categoryTimes[key] = self._categoryTimes.get(key, 0) + time.time() - startTime
+
+    def timeRequests(self, session):
+        """
+        All the session's methods go through session.request, so it's enough to measure it
+        """
+        if not self.enabled:
+            return
+
+        request = session.request
+        def timedRequest(*args, **kwargs):
+            with self.measure(NETWORK):
+                return request(*args, **kwargs)
+
+        session.request = timedRequest
+
+    def timedTree(self, tree):
+        if not self.enabled or tree == None:
+            return tree
+
+        return _TimedTree(tree)
+
+    def report(self):
+        """
+        Phases with their time and time of each category. Time spent in concurrent threads is summed up,
+        so nested phases and categories may take longer than the enclosing phase
+        """
+        lines = ['%-50s %9s' % ('phase', 'time') + ''.join(' %12s' % category for category in CATEGORIES)]
+        totalTime = time.time() - self._startTime
+        phases = [(None, totalTime)] + [(phase, self._phaseTimes[phase]) for phase in self._phases]
+        for phase, wallTime in phases:
+            line = '%-50s %8.2fs' % (phase if phase != None else '(total / outside of phases)', wallTime)
+            for category in CATEGORIES:
+                line += ' %11.2fs' % self._categoryTimes.get((phase, category), 0)
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+    def stop(self, outputFileName):
+        """
+        Saves merged pstats of all the threads to outputFileName and phases breakdown
+        to outputFileName + '.phases.txt'
+        """
+        import pstats
+        from lxml import etree
+
+        from itc.util.pool import runOnEachWorker # pool imports profiler
+
+        # profiles are disabled by profileThread in their own threads once the profiler is disabled.
+        # Idle pool workers would keep them enabled until their next work, so they're drained here
+        self.enabled = False
+        self.profileThread()
+        runOnEachWorker(self.profileThread)
+        etree.set_element_class_lookup()
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(outputFileName)
+
+        report = self.report()
+        with open(outputFileName + '.phases.txt', 'w') as fp:
+            fp.write(report + '\n')
+
+        logging.info('Profile is saved to ' + outputFileName + ', phases breakdown:\n' + report)
+
+profiler = Profiler()
+
+def profiledPhase(name):
+    """
+    Decorator, which runs the function in profiler's phase
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profiler.phase(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,37 @@
+import sys
+import time
+import threading
+
+from itc.conf import *
+
+class ProgressIndicator(object):
+    """
+    Prints progress of a long operation to console, i.e. '42% (21 of 50), ETA 01:15'.
+    Steps can be reported from several threads. Nothing is printed in silent and verbose modes.
+    """
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self._startTime = time.time()
+        self._lock = threading.Lock()
+
+    def __isEnabled(self):
+        return not config.options.get('--silent') and not config.options.get('--verbose')
+
+    def step(self):
+        with self._lock:
+            self.done += 1
+            if not self.__isEnabled() or self.total == 0:
+                return
+
+            elapsed = time.time() - self._startTime
+            eta = int(elapsed / self.done * (self.total - self.done))
+            print >> sys.stdout, "\r%d%% (%d of %d), ETA %02d:%02d" % (100 * self.done / self.total, self.done, self.total, eta / 60, eta % 60),
+            sys.stdout.flush()
+
+    def finish(self):
+        if not self.__isEnabled():
+            return
+
+        print >> sys.stdout, "\rDone in %ds%s\n" % (time.time() - self._startTime, ' ' * 20),
+        sys.stdout.flush()
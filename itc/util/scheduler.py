@@ -0,0 +1,138 @@
+import time
+import logging
+import threading
+
+from itc.util.pool import workersCount
+from itc.util.profiling import profiler
+
+class Task(object):
+    """
+    Unit of work of TaskGraph. Task is started once all the tasks it depends on succeeded
+    """
+    def __init__(self, taskId, function, dependencies=None):
+        self.taskId = taskId
+        self.function = function
+        self.dependencies = list(dependencies or [])
+        self.status = 'pending'
+        self.error = None
+        self.startTime = None
+        self.endTime = None
+
+    @property
+    def duration(self):
+        if self.startTime == None or self.endTime == None:
+            return 0
+
+        return self.endTime - self.startTime
+
+
+class TaskGraph(object):
+    """
+    Runs tasks in separate threads as soon as their dependencies are finished.
+    At most workersCount() tasks are running at the same time. Requests of all the tasks
+    still go through the shared pool, so total amount of simultaneous requests doesn't grow
+    """
+    def __init__(self):
+        self.tasks = []
+        self._tasksById = {}
+        self._condition = threading.Condition()
+
+    def addTask(self, taskId, function, dependencies=None):
+        if taskId in self._tasksById:
+            raise Exception('Task "' + taskId + '" is added twice')
+        for dependency in dependencies or []:
+            if not dependency in self._tasksById:
+                raise Exception('Task "' + taskId + '" depends on unknown task "' + dependency + '"')
+
+        task = Task(taskId, function, dependencies)
+        self.tasks.append(task)
+        self._tasksById[taskId] = task
+
+        return task
+
+    def __runTask(self, task, phase):
+        try:
+            with profiler.inPhase(phase):
+                task.function()
+            status = 'succeeded'
+        except BaseException as e:
+            logging.error('Task "' + task.taskId + '" failed: ' + str(e))
+            logging.debug('', exc_info=True)
+            task.error = e
+            status = 'failed'
+
+        with self._condition:
+            task.endTime = time.time()
+            task.status = status
+            self._condition.notify_all()
+
+    def __nextTasks(self, running):
+        """
+        Starts tasks, which dependencies are finished. Tasks, which depend on failed ones, are skipped
+        """
+        started = []
+        for task in self.tasks:
+            if task.status != 'pending':
+                continue
+
+            dependenciesStatuses = [self._tasksById[dependency].status for dependency in task.dependencies]
+            if any(status in ('failed', 'skipped') for status in dependenciesStatuses):
+                task.status = 'skipped'
+                logging.error('Task "' + task.taskId + '" is skipped as one of its dependencies failed')
+            elif all(status == 'succeeded' for status in dependenciesStatuses) and running + len(started) < workersCount():
+                task.status = 'running'
+                task.startTime = time.time()
+                started.append(task)
+
+        return started
+
+    def run(self):
+        """
+        Runs all the tasks and returns list of failed and skipped ones
+        """
+        self._startTime = time.time()
+        with self._condition:
+            while True:
+                running = len([task for task in self.tasks if task.status == 'running'])
+                for task in self.__nextTasks(running):
+                    logging.info('Starting task "' + task.taskId + '"')
+                    thread = threading.Thread(target=self.__runTask, args=(task, profiler.currentPhase()))
+                    thread.daemon = True
+                    thread.start()
+                    running += 1
+
+                if running == 0:
+                    break
+                # wait with timeout allows to interrupt the script with Ctrl+C
+                self._condition.wait(1)
+
+        self._endTime = time.time()
+
+        return [task for task in self.tasks if task.status in ('failed', 'skipped')]
+
+    def criticalPath(self):
+        """
+        Chain of dependent tasks, which took the longest time
+        """
+        longestPaths = {}
+        for task in self.tasks: # dependencies are always added before dependent tasks
+            previous = max([longestPaths[dependency] for dependency in task.dependencies] or [(0, [])])
+            longestPaths[task.taskId] = (previous[0] + task.duration, previous[1] + [task])
+
+        if len(longestPaths) == 0:
+            return []
+
+        return max(longestPaths.values())[1]
+
+    def report(self):
+        lines = []
+        for task in self.tasks:
+            lines.append('%-40s %-10s %8.1fs' % (task.taskId, task.status, task.duration))
+
+        criticalPath = self.criticalPath()
+        lines.append('')
+        lines.append('Total time: %.1fs' % (self._endTime - self._startTime))
+        lines.append('Critical path: %.1fs (%s)' % (sum(task.duration for task in criticalPath)
+                                                   , ' -> '.join(task.taskId for task in criticalPath)))
+
+        return '\n'.join(lines)
@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # no file locking on Windows
+    fcntl = None
+
+from itc.conf import *
+from itc.util.profiling import profiler, DISK
+
+def writeFileAtomically(path, write):
+    """
+    Writes file with write(fp) to a temporary file in the same directory and renames it to path,
+    so other processes never read partially written file
+    """
+    with profiler.measure(DISK):
+        fd, temporaryPath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                write(fp)
+            os.rename(temporaryPath, path)
+        except:
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+            raise
+
+def readJSON(path):
+    """
+    Returns None if file doesn't exist or is invalid
+    """
+    try:
+        with profiler.measure(DISK):
+            with open(path, 'r') as fp:
+                return json.load(fp)
+    except (IOError, ValueError):
+        return None
+
+def writeJSON(path, data):
+    writeFileAtomically(path, lambda fp: json.dump(data, fp))
+
+
+class SessionStore(object):
+    """
+    Cookies, session and applications cache of an account, shared between itc processes.
+    Files are namespaced by username, replaced atomically and changed under exclusive file lock,
+    so parallel processes don't corrupt or delete each other's session
+    """
+    def __init__(self):
+        self._threadLock = threading.RLock()
+        self._lockDepth = 0
+        self.useAccount(None)
+
+    def useAccount(self, username):
+        suffix = ''
+        if username != None:
+            suffix = '-' + hashlib.sha1(username.encode('utf-8')).hexdigest()[:12]
+
+        self.cookieFile = os.path.join(temp_dir, '.itc-cli-cookies%s.txt' % suffix)
+        self.sessionFile = os.path.join(temp_dir, '.itc-cli-session%s.json' % suffix)
+        self.applicationsCacheFile = os.path.join(temp_dir, '.itc-cli-applications%s.json' % suffix)
+        self._lockFile = os.path.join(temp_dir, '.itc-cli%s.lock' % suffix)
+        self._loadedCookiesMTime = None
+
+    def __cookiesMTime(self):
+        try:
+            return os.stat(self.cookieFile).st_mtime
+        except OSError:
+            return None
+
+    @contextmanager
+    def locked(self):
+        """
+        Exclusive lock of the account's files between threads and processes
+        """
+        with self._threadLock:
+            # file lock is taken by the outermost call only, as flock on another descriptor would wait for itself
+            if fcntl == None or self._lockDepth > 0:
+                self._lockDepth += 1
+                try:
+                    yield
+                finally:
+                    self._lockDepth -= 1
+                return
+
+            with open(self._lockFile, 'a') as lockFile:
+                fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX)
+                self._lockDepth += 1
+                try:
+                    yield
+                finally:
+                    self._lockDepth -= 1
+                    fcntl.flock(lockFile.fileno(), fcntl.LOCK_UN)
+
+    def loadCookies(self):
+        with self.locked():
+            self._loadedCookiesMTime = self.__cookiesMTime()
+            if self._loadedCookiesMTime == None:
+                return
+
+            try:
+                cookie_jar.load(self.cookieFile, ignore_discard=True)
+            except IOError:
+                pass
+
+    def saveCookies(self):
+        with self.locked():
+            writeFileAtomically(self.cookieFile, lambda fp: fp.write("#LWP-Cookies-2.0\n" + cookie_jar.as_lwp_str(ignore_discard=True)))
+            self._loadedCookiesMTime = self.__cookiesMTime()
+
+    def isChangedByOtherProcess(self):
+        """
+        True if another process saved cookies after this one loaded them, i.e. logged in again
+        """
+        return self.__cookiesMTime() != self._loadedCookiesMTime
+
+    def clear(self, force=False):
+        """
+        Removes account's session files. Unless forced, files are kept if another process
+        has already replaced cookies, which this process loaded
+        """
+        with self.locked():
+            if not force and self.isChangedByOtherProcess():
+                logging.debug('Session is updated by another process, keeping it')
+                return False
+
+            for path in (self.cookieFile, self.sessionFile, self.applicationsCacheFile):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._loadedCookiesMTime = None
+
+            return True
+
+sessionStore = SessionStore()
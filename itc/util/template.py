@@ -0,0 +1,124 @@
+from bisect import bisect_right
+from collections import Mapping
+
+from itc.util import dict_merge
+
+class IndexedValues(object):
+    """
+    Values of a template dictionary, selected by index: {"5": "value for 5", "1-500": "value for 1..500"}.
+    Range keys are kept as intervals, exact indexes have priority over ranges.
+    """
+    def __init__(self, dictionary):
+        self._values = {}
+        ranges = []
+
+        for key, value in dictionary.items():
+            key = str(key)
+            if "-" in key:
+                startIndex, endIndex = key.split("-")
+                ranges.append((int(startIndex), int(endIndex), value))
+            else:
+                try:
+                    self._values[int(key)] = value
+                except ValueError:
+                    self._values[key] = value
+
+        ranges.sort(key=lambda r: r[0])
+        self._ranges = ranges
+        self._rangeStarts = [r[0] for r in ranges]
+
+    def __getitem__(self, index):
+        if index in self._values:
+            return self._values[index]
+
+        position = bisect_right(self._rangeStarts, index)
+        while position > 0:
+            position -= 1
+            startIndex, endIndex, value = self._ranges[position]
+            if startIndex <= index <= endIndex:
+                return value
+
+        raise KeyError(index)
+
+
+def _prepareValues(dictionary):
+    return dict((key, IndexedValues(value) if isinstance(value, dict) else value)
+                    for key, value in dictionary.items())
+
+
+class IndexedView(Mapping):
+    """
+    Read-only view of a prepared template for a particular index. Values are resolved on access:
+    '{index}' is substituted in strings, lists are accessed by position of the index in iterator
+    and dictionaries by the index itself
+    """
+    def __init__(self, values, index, position):
+        self._values = values
+        self._index = index
+        self._position = position
+
+    def __getitem__(self, key):
+        value = self._values[key]
+
+        if isinstance(value, basestring):
+            return value.replace('{index}', str(self._index))
+        elif isinstance(value, list):
+            return value[self._position]
+        elif isinstance(value, IndexedValues):
+            return value[self._index]
+        elif isinstance(value, dict):
+            return IndexedView(value, self._index, self._position)
+
+        return value
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return repr(dict((key, value) for key, value in self.items()))
+
+
+class InappTemplate(object):
+    """
+    Inapp configuration, probably with 'index iterator'. Iterating over template yields a dictionary
+    for each index. Template is prepared once, so per-index dictionaries are cheap lazy views.
+    """
+    def __init__(self, inappDict):
+        self.isIterable = inappDict['id'].find('{index}') != -1
+        iteratorDict = inappDict.get('index iterator', {})
+
+        self.indexes = [-1]
+        if self.isIterable:
+            self.indexes = iteratorDict.get('indexes')
+            if self.indexes == None:
+                self.indexes = xrange(iteratorDict.get('from', 1), iteratorDict['to'] + 1)
+
+        genericLangsDict = inappDict.get('general', {})
+        langsDict = {}
+        for langId, langDict in inappDict.get('languages', {}).items():
+            langsDict[langId] = dict_merge(genericLangsDict, langDict)
+
+        values = dict((key, value) for key, value in inappDict.items()
+                        if not key in ("index iterator", "general", "languages"))
+
+        if self.isIterable:
+            values = _prepareValues(values)
+            langsDict = dict((langId, _prepareValues(langDict)) for langId, langDict in langsDict.items())
+
+        values['languages'] = langsDict
+
+        self._values = values
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __iter__(self):
+        if not self.isIterable:
+            yield self._values
+            return
+
+        for position, index in enumerate(self.indexes):
+            yield IndexedView(self._values, index, position)